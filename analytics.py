@@ -0,0 +1,445 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from database import Database
+from models import TimeRecord
+
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+
+def day_index(value: date) -> int:
+    """Номер дня от 1970-01-01 (так же считаются дни в массивах)"""
+    return (value - EPOCH).days
+
+
+def index_to_date(index: int) -> date:
+    return EPOCH + timedelta(days=int(index))
+
+
+def to_epoch(value: datetime) -> int:
+    """Секунды от эпохи для "наивного" времени, как strftime('%s') в SQLite"""
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+@dataclass
+class RecordColumns:
+    """Колонки таблицы time_records в виде массивов NumPy"""
+    ids: np.ndarray
+    task_ids: np.ndarray
+    project_ids: np.ndarray
+    starts: np.ndarray  # секунды от эпохи
+    ends: np.ndarray
+    durations: np.ndarray
+    productive: np.ndarray  # bool
+
+    @property
+    def days(self) -> np.ndarray:
+        return self.starts // SECONDS_PER_DAY
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple]) -> 'RecordColumns':
+        data = np.array(rows, dtype=np.int64).reshape(-1, 7)
+        return cls(
+            ids=data[:, 0],
+            task_ids=data[:, 1],
+            project_ids=data[:, 2],
+            starts=data[:, 3],
+            ends=data[:, 4],
+            durations=data[:, 5],
+            productive=data[:, 6].astype(bool)
+        )
+
+
+def weekday_of(days):
+    """День недели для номера дня (0 - понедельник; 1970-01-01 - четверг)"""
+    return (days + 3) % 7
+
+
+class ChartAggregates:
+    """
+    Предрасчитанные агрегаты для графиков:
+    - day_project: секунды по дням (строки) и проектам (столбцы);
+    - day_hour: секунды по дням и часам суток (для теплокарты);
+    - productive_daily / total_daily: продуктивное и общее время по дням.
+
+    Строки соответствуют дням начиная с first_day. Агрегаты строятся векторно
+    из колонок и затем обновляются по одной записи через add_record.
+    """
+
+    def __init__(self, cols: RecordColumns):
+        self.project_ids = [int(p) for p in np.unique(cols.project_ids)]
+        self._project_index = {p: i for i, p in enumerate(self.project_ids)}
+        if len(cols):
+            self.first_day = int(cols.days.min())
+            # Запись, перешедшая через полночь, занимает и следующий день
+            last_days = (cols.starts + np.maximum(cols.durations, 1) - 1) // SECONDS_PER_DAY
+            n_days = int(last_days.max()) - self.first_day + 1
+        else:
+            self.first_day = day_index(date.today())
+            n_days = 1
+        n_projects = max(len(self.project_ids), 1)
+
+        self.day_project = np.zeros((n_days, n_projects))
+        self.day_hour = np.zeros((n_days, 24))
+        self.productive_daily = np.zeros(n_days)
+        self.total_daily = np.zeros(n_days)
+        if not len(cols):
+            return
+
+        rows = cols.days - self.first_day
+        columns = np.array([self._project_index[int(p)] for p in cols.project_ids])
+        flat = np.bincount(rows * n_projects + columns, weights=cols.durations,
+                           minlength=n_days * n_projects)
+        self.day_project += flat.reshape(n_days, n_projects)
+        self.total_daily += np.bincount(rows, weights=cols.durations, minlength=n_days)
+        self.productive_daily += np.bincount(rows, weights=cols.durations * cols.productive,
+                                             minlength=n_days)
+
+        # Раскладываем каждую запись по часам, которые она пересекает
+        first_hour = cols.starts // 3600
+        ends = cols.starts + cols.durations
+        max_span = int(((cols.starts % 3600) + cols.durations).max() // 3600) + 1
+        for k in range(max_span):
+            hour_start = (first_hour + k) * 3600
+            seconds = np.minimum(ends, hour_start + 3600) - np.maximum(cols.starts, hour_start)
+            valid = seconds > 0
+            if not valid.any():
+                break
+            hours = first_hour[valid] + k
+            cells = (hours // 24 - self.first_day) * 24 + hours % 24
+            self._add_day_hour_cells(cells, seconds[valid])
+
+    def _add_day_hour_cells(self, cells, seconds):
+        flat = self.day_hour.reshape(-1)
+        inside = (cells >= 0) & (cells < len(flat))
+        flat += np.bincount(cells[inside], weights=seconds[inside], minlength=len(flat))
+
+    @property
+    def last_day(self) -> int:
+        return self.first_day + len(self.total_daily) - 1
+
+    def _ensure_day(self, day: int):
+        if day < self.first_day:
+            pad = ((self.first_day - day, 0),)
+            self.first_day = day
+        elif day > self.last_day:
+            pad = ((0, day - self.last_day),)
+        else:
+            return
+        self.day_project = np.pad(self.day_project, pad + ((0, 0),))
+        self.day_hour = np.pad(self.day_hour, pad + ((0, 0),))
+        self.productive_daily = np.pad(self.productive_daily, pad)
+        self.total_daily = np.pad(self.total_daily, pad)
+
+    def _project_column(self, project_id: int) -> int:
+        if project_id not in self._project_index:
+            self.project_ids.append(project_id)
+            # При пустой истории уже есть один свободный столбец
+            if len(self.project_ids) > self.day_project.shape[1]:
+                self.day_project = np.pad(self.day_project, ((0, 0), (0, 1)))
+            self._project_index[project_id] = len(self.project_ids) - 1
+        return self._project_index[project_id]
+
+    def add_record(self, project_id: int, start: int, duration: int,
+                   productive: bool, sign: int = 1):
+        """Учитывает одну запись (sign=-1 - вычитает удалённую)"""
+        day = start // SECONDS_PER_DAY
+        last = (start + max(duration, 1) - 1) // SECONDS_PER_DAY
+        self._ensure_day(day)
+        self._ensure_day(last)
+        row = day - self.first_day
+        # Столбец до обращения к массиву: для нового проекта массив расширяется
+        column = self._project_column(project_id)
+        self.day_project[row, column] += sign * duration
+        self.total_daily[row] += sign * duration
+        if productive:
+            self.productive_daily[row] += sign * duration
+
+        hour = start // 3600
+        end = start + duration
+        while hour * 3600 < end:
+            seconds = min(end, hour * 3600 + 3600) - max(start, hour * 3600)
+            self.day_hour[hour // 24 - self.first_day, hour % 24] += sign * seconds
+            hour += 1
+
+    def _rows(self, date_from: Optional[date], date_to: Optional[date]):
+        first = 0 if date_from is None else max(day_index(date_from) - self.first_day, 0)
+        last = len(self.total_daily) if date_to is None else \
+            min(day_index(date_to) - self.first_day + 1, len(self.total_daily))
+        return first, max(last, first)
+
+    def stacked_days(self, date_from: Optional[date] = None, date_to: Optional[date] = None):
+        """(номер первого дня, матрица день×проект) для диапазона дат"""
+        a, b = self._rows(date_from, date_to)
+        return self.first_day + a, self.day_project[a:b]
+
+    def heatmap(self, date_from: Optional[date] = None, date_to: Optional[date] = None):
+        """Матрица 7×24: секунды по дням недели и часам"""
+        a, b = self._rows(date_from, date_to)
+        heat = np.zeros((7, 24))
+        weekdays = weekday_of(np.arange(a, b) + self.first_day)
+        np.add.at(heat, weekdays, self.day_hour[a:b])
+        return heat
+
+    def productivity_trend(self, window_days: int = 7, date_from: Optional[date] = None,
+                           date_to: Optional[date] = None):
+        """(номер первого дня, доля продуктивного времени скользящим окном)"""
+        a, b = self._rows(date_from, date_to)
+        productive = np.concatenate(([0.0], np.cumsum(self.productive_daily[a:b])))
+        total = np.concatenate(([0.0], np.cumsum(self.total_daily[a:b])))
+        idx = np.arange(1, b - a + 1)
+        lo = np.maximum(idx - window_days, 0)
+        window_total = total[idx] - total[lo]
+        window_productive = productive[idx] - productive[lo]
+        ratio = np.divide(window_productive, window_total,
+                          out=np.full(len(idx), np.nan), where=window_total > 0)
+        return self.first_day + a, ratio
+
+
+class Analytics:
+    """
+    Аналитика по записям времени.
+
+    Все записи загружаются одним запросом в массивы NumPy, а группировки,
+    гистограммы и перцентили считаются векторно. Массивы кэшируются и
+    перечитываются только при изменении счётчика изменений БД.
+    Используется вкладкой статистики и командной строкой (cli.py).
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._columns: Optional[RecordColumns] = None
+        self._aggregates: Optional[ChartAggregates] = None
+        self._cache_key = None
+
+    def columns(self) -> RecordColumns:
+        key = self.db.get_change_counter()
+        if self._columns is None or key != self._cache_key:
+            self._columns = RecordColumns.from_rows(self.db.get_time_record_columns())
+            self._aggregates = None
+            self._cache_key = key
+        return self._columns
+
+    def aggregates(self) -> ChartAggregates:
+        cols = self.columns()
+        if self._aggregates is None:
+            self._aggregates = ChartAggregates(cols)
+        return self._aggregates
+
+    def invalidate(self):
+        self._columns = None
+        self._aggregates = None
+        self._cache_key = None
+
+    def _advance_cache_key(self, changes: int = 1) -> bool:
+        """
+        Сдвигает ключ кэша после собственных записей в БД. Если с момента
+        последней загрузки БД менялась ещё кем-то, кэш сбрасывается.
+        """
+        key = self.db.get_change_counter()
+        expected = (self._cache_key[0], self._cache_key[1] + changes)
+        if key != expected:
+            self.invalidate()
+            return False
+        self._cache_key = key
+        return True
+
+    def on_db_event(self, event: str, payload):
+        """Обработчик Database.add_listener: инкрементально обновляет кэш"""
+        if event == 'catalog_changed':
+            return  # в колонках только id, названия проектов и задач не хранятся
+        if event == 'records_changed':
+            # Массовое изменение (каскадное удаление, синхронизация) - перечитываем
+            self.invalidate()
+            return
+        records = payload if event == 'records_added' else [payload]
+        if self._columns is None or not self._advance_cache_key(len(records)):
+            return
+        if event in ('record_added', 'records_added'):
+            for record in records:
+                self._apply_added(record)
+        elif event == 'record_deleted':
+            self._apply_deleted(payload)
+
+    def _apply_added(self, record: TimeRecord):
+        cols = self._columns
+        known = np.flatnonzero(cols.task_ids == record.task_id)
+        if len(known):
+            project_id = int(cols.project_ids[known[0]])
+        else:
+            task = self.db.get_task(record.task_id)
+            project_id = task.project_id if task else 0
+        start = to_epoch(record.start_time)
+        values = (record.id, record.task_id, project_id, start,
+                  start + record.duration_seconds, record.duration_seconds,
+                  record.was_productive)
+        self._columns = self._append(cols, values)
+        if self._aggregates is not None:
+            self._aggregates.add_record(project_id, start, record.duration_seconds,
+                                        record.was_productive)
+
+    def _apply_deleted(self, record_id: int):
+        cols = self._columns
+        found = np.flatnonzero(cols.ids == record_id)
+        if not len(found):
+            return
+        i = found[0]
+        if self._aggregates is not None:
+            self._aggregates.add_record(int(cols.project_ids[i]), int(cols.starts[i]),
+                                        int(cols.durations[i]), bool(cols.productive[i]),
+                                        sign=-1)
+        keep = cols.ids != record_id
+        self._columns = RecordColumns(
+            ids=cols.ids[keep], task_ids=cols.task_ids[keep],
+            project_ids=cols.project_ids[keep], starts=cols.starts[keep],
+            ends=cols.ends[keep], durations=cols.durations[keep],
+            productive=cols.productive[keep])
+
+    @staticmethod
+    def _append(cols: RecordColumns, values: tuple) -> RecordColumns:
+        return RecordColumns(
+            ids=np.append(cols.ids, values[0]),
+            task_ids=np.append(cols.task_ids, values[1]),
+            project_ids=np.append(cols.project_ids, values[2]),
+            starts=np.append(cols.starts, values[3]),
+            ends=np.append(cols.ends, values[4]),
+            durations=np.append(cols.durations, values[5]),
+            productive=np.append(cols.productive, bool(values[6]))
+        )
+
+    def _mask(self, cols: RecordColumns, date_from: Optional[date] = None,
+              date_to: Optional[date] = None, project_id: Optional[int] = None,
+              task_id: Optional[int] = None,
+              productive: Optional[bool] = None,
+              tag_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        mask = np.ones(len(cols), dtype=bool)
+        if date_from is not None or date_to is not None:
+            days = cols.days
+            if date_from is not None:
+                mask &= days >= day_index(date_from)
+            if date_to is not None:
+                mask &= days <= day_index(date_to)
+        if project_id:
+            mask &= cols.project_ids == project_id
+        if task_id:
+            mask &= cols.task_ids == task_id
+        if productive is not None:
+            mask &= cols.productive == productive
+        if tag_ids:
+            # Битовая карта меток разворачивается в массив по id записи
+            bitmap = np.unpackbits(np.frombuffer(self.db.find_tagged_records(tag_ids), dtype=np.uint8),
+                                   bitorder='little').astype(bool)
+            inside = cols.ids < len(bitmap)
+            if len(bitmap):
+                mask &= inside & bitmap[np.where(inside, cols.ids, 0)]
+            else:
+                mask[:] = False
+        return mask
+
+    def select(self, **filters) -> RecordColumns:
+        """Возвращает колонки только для записей, подходящих под фильтры"""
+        cols = self.columns()
+        mask = self._mask(cols, **filters)
+        return RecordColumns(
+            ids=cols.ids[mask],
+            task_ids=cols.task_ids[mask],
+            project_ids=cols.project_ids[mask],
+            starts=cols.starts[mask],
+            ends=cols.ends[mask],
+            durations=cols.durations[mask],
+            productive=cols.productive[mask]
+        )
+
+    @staticmethod
+    def _group_sum(keys: np.ndarray, values: np.ndarray):
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=values, minlength=len(uniq))
+        return uniq, sums.astype(np.int64)
+
+    # Группировки
+    def totals_by_day(self, **filters) -> Dict[date, int]:
+        cols = self.select(**filters)
+        days, sums = self._group_sum(cols.days, cols.durations)
+        return {index_to_date(d): int(s) for d, s in zip(days, sums)}
+
+    def totals_by_week(self, **filters) -> Dict[date, int]:
+        """Суммы по неделям; ключ - понедельник недели"""
+        cols = self.select(**filters)
+        # 1970-01-01 - четверг, сдвигаем так, чтобы неделя начиналась с понедельника
+        weeks, sums = self._group_sum((cols.days + 3) // 7, cols.durations)
+        return {index_to_date(w * 7 - 3): int(s) for w, s in zip(weeks, sums)}
+
+    def totals_by_project(self, **filters) -> Dict[int, int]:
+        cols = self.select(**filters)
+        keys, sums = self._group_sum(cols.project_ids, cols.durations)
+        return {int(k): int(s) for k, s in zip(keys, sums)}
+
+    def totals_by_task(self, **filters) -> Dict[int, int]:
+        cols = self.select(**filters)
+        keys, sums = self._group_sum(cols.task_ids, cols.durations)
+        return {int(k): int(s) for k, s in zip(keys, sums)}
+
+    # Продуктивность
+    def productivity(self, **filters) -> Dict[str, float]:
+        cols = self.select(**filters)
+        productive = int(cols.durations[cols.productive].sum())
+        unproductive = int(cols.durations[~cols.productive].sum())
+        total = productive + unproductive
+        return {
+            'productive': productive,
+            'unproductive': unproductive,
+            'ratio': productive / total if total else 0.0
+        }
+
+    def rolling_average(self, window_days: int = 7, **filters) -> Dict[date, float]:
+        """
+        Скользящее среднее времени за день. Дни без записей считаются
+        нулевыми, поэтому ряд строится по всем календарным дням диапазона.
+        """
+        cols = self.select(**filters)
+        if len(cols) == 0:
+            return {}
+        days = cols.days
+        first = int(days.min())
+        daily = np.bincount(days - first, weights=cols.durations)
+        cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+        counts = np.minimum(np.arange(1, len(daily) + 1), window_days)
+        starts = np.maximum(np.arange(len(daily)) - window_days + 1, 0)
+        averages = (cumulative[1:] - cumulative[starts]) / counts
+        return {index_to_date(first + i): float(a) for i, a in enumerate(averages)}
+
+    # Распределения
+    def duration_histogram(self, bins=10, **filters):
+        """Гистограмма длительностей записей: (количества, границы корзин)"""
+        cols = self.select(**filters)
+        return np.histogram(cols.durations, bins=bins)
+
+    def duration_percentiles(self, percentiles=(50, 90, 99), **filters) -> Dict[float, float]:
+        cols = self.select(**filters)
+        if len(cols) == 0:
+            return {p: 0.0 for p in percentiles}
+        values = np.percentile(cols.durations, percentiles)
+        return {p: float(v) for p, v in zip(percentiles, values)}
+
+    def summary(self, **filters) -> Dict[str, float]:
+        """Краткая сводка для вкладки статистики и командной строки"""
+        cols = self.select(**filters)
+        total = int(cols.durations.sum())
+        days = len(np.unique(cols.days))
+        productivity = self.productivity(**filters)
+        return {
+            'records': len(cols),
+            'total_seconds': total,
+            'days': days,
+            'average_per_day': total / days if days else 0.0,
+            'productive_ratio': productivity['ratio']
+        }
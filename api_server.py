@@ -0,0 +1,286 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from analytics import Analytics
+from database import Database
+
+LONG_POLL_TIMEOUT = 30
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 415: "Unsupported Media Type", 500: "Internal Server Error"}
+# Имена, под которыми к серверу обращаются локальные клиенты (заголовок Host).
+# Другое имя - признак DNS rebinding: страница из интернета ходит на 127.0.0.1
+LOCAL_HOSTS = {'127.0.0.1', 'localhost', '::1'}
+
+
+class ApiServer(QObject):
+    """
+    Локальный HTTP/JSON API для запущенного таймера.
+
+    Сервер asyncio работает в отдельном потоке и не обращается к GUI-потоку:
+    GUI публикует снимок состояния через publish_state(), сервер отдаёт уже
+    сериализованный JSON. Команды (start/pause/stop) передаются в GUI через
+    сигнал command_received (очередь событий Qt).
+
+    Эндпоинты:
+        GET  /state               - текущее состояние
+        GET  /state?since=N       - long-poll: ждёт версию больше N
+        GET  /events              - поток изменений состояния (server-sent events)
+        GET  /stats?from=&to=&by= - статистика (только чтение)
+        POST /start, /pause, /stop - команды таймеру, тело {"task_id": ...}
+    Соединения HTTP/1.1 держатся открытыми (keep-alive).
+
+    Команды принимаются только с Content-Type: application/json и без
+    заголовка Origin: браузер не может отправить такой запрос со страницы
+    без предварительного CORS-запроса, который сервер не разрешает.
+    """
+
+    command_received = pyqtSignal(str, dict)
+
+    def __init__(self, db: Database, host: str = '127.0.0.1', port: int = 8765,
+                 socket_path: str = '', parent=None):
+        super().__init__(parent)
+        # База окна: статистика читает её через пул соединений только для
+        # чтения, без своего соединения записи и миграций в потоке сервера
+        self.db = db
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+
+        self._lock = threading.Lock()
+        self._state_body = b'{}'
+        self._version = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._analytics: Optional[Analytics] = None
+        # Статистика (NumPy и SQLite) считается вне цикла asyncio, по одному запросу
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.error: Optional[Exception] = None
+
+    # Вызывается из GUI-потока
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="api-server", daemon=True)
+        self._thread.start()
+        self._started.wait(5)
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(5)
+
+    def publish_state(self, state: dict):
+        """Публикует новое состояние и будит ожидающих клиентов"""
+        with self._lock:
+            self._version += 1
+            state = dict(state, version=self._version)
+            self._state_body = json.dumps(state, ensure_ascii=False).encode('utf-8')
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._notify_changed)
+
+    # Дальше всё выполняется в потоке сервера
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._changed = asyncio.Event()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='api-stats')
+        try:
+            if self.socket_path:
+                server = self._loop.run_until_complete(
+                    asyncio.start_unix_server(self._handle_client, path=self.socket_path))
+            else:
+                server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle_client, self.host, self.port))
+                self.port = server.sockets[0].getsockname()[1]
+        except Exception as e:
+            self.error = e
+            self._executor.shutdown()
+            self._started.set()
+            return
+
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            # Закрываем открытые соединения (keep-alive, long-poll, SSE)
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.close()
+            self._executor.shutdown()
+
+    def _notify_changed(self):
+        # Будим всех ожидающих и заводим новое событие для следующих
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _snapshot(self):
+        with self._lock:
+            return self._version, self._state_body
+
+    async def _wait_version(self, since: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while self._snapshot()[0] <= since:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), left)
+            except asyncio.TimeoutError:
+                break
+        return self._snapshot()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                url = urlsplit(target)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+                if method == 'GET' and url.path == '/events':
+                    await self._stream_events(writer)
+                    break
+                status, payload = await self._dispatch(method, url.path, params, body, headers)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Остановка сервера: соединение просто закрывается
+            pass
+        finally:
+            writer.close()
+
+    def _write_response(self, writer, status: int, payload: bytes, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1'))
+        writer.write(payload)
+
+    async def _stream_events(self, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        version, body = self._snapshot()
+        while True:
+            writer.write(b"event: state\ndata: " + body + b"\n\n")
+            await writer.drain()
+            new_version, body = await self._wait_version(version, LONG_POLL_TIMEOUT)
+            if new_version == version:
+                # Комментарий, чтобы соединение не закрывалось по простою
+                writer.write(b": ping\n\n")
+                await writer.drain()
+            version = new_version
+
+    def _check_host(self, headers: dict) -> bool:
+        if self.socket_path:
+            return True
+        host = headers.get('host', '')
+        # Без порта; IPv6 записывается в скобках: [::1]:8765
+        name = host[1:host.find(']')] if host.startswith('[') else host.rpartition(':')[0] or host
+        return name in LOCAL_HOSTS or name == self.host
+
+    async def _dispatch(self, method: str, path: str, params: dict, body: bytes,
+                        headers: dict):
+        if not self._check_host(headers):
+            return 403, self._error("Недопустимый заголовок Host")
+
+        if path == '/state':
+            if method != 'GET':
+                return 405, self._error("Метод не поддерживается")
+            if 'since' in params:
+                try:
+                    since = int(params['since'])
+                except ValueError:
+                    return 400, self._error("since должен быть целым числом")
+                _, state = await self._wait_version(since, LONG_POLL_TIMEOUT)
+                return 200, state
+            return 200, self._snapshot()[1]
+
+        if path == '/stats':
+            if method != 'GET':
+                return 405, self._error("Метод не поддерживается")
+            try:
+                return 200, await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._stats, params)
+            except ValueError as e:
+                return 400, self._error(str(e))
+
+        if path in ('/start', '/pause', '/stop'):
+            if method != 'POST':
+                return 405, self._error("Метод не поддерживается")
+            if 'origin' in headers:
+                return 403, self._error("Команды со страниц браузера не принимаются")
+            if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+                return 415, self._error("Нужен Content-Type: application/json")
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                return 400, self._error("Некорректный JSON")
+            self.command_received.emit(path[1:], data)
+            return 202, b'{"accepted": true}'
+
+        return 404, self._error("Не найдено")
+
+    @staticmethod
+    def _error(message: str) -> bytes:
+        return json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+
+    def _stats(self, params: dict) -> bytes:
+        """Выполняется в self._executor"""
+        if self._analytics is None:
+            # Свой кэш массивов: аналитика окна живёт в GUI-потоке
+            self._analytics = Analytics(self.db)
+        filters = {
+            'date_from': datetime.strptime(params['from'], "%Y-%m-%d").date() if 'from' in params else None,
+            'date_to': datetime.strptime(params['to'], "%Y-%m-%d").date() if 'to' in params else None,
+            'project_id': int(params['project']) if 'project' in params else None,
+            'task_id': int(params['task']) if 'task' in params else None,
+        }
+        by = params.get('by', 'day')
+        groupings = {
+            'day': self._analytics.totals_by_day,
+            'week': self._analytics.totals_by_week,
+            'project': self._analytics.totals_by_project,
+            'task': self._analytics.totals_by_task,
+        }
+        if by not in groupings:
+            raise ValueError(f"Неизвестная группировка: {by}")
+        totals = groupings[by](**filters)
+        return json.dumps({
+            'summary': self._analytics.summary(**filters),
+            'totals': {str(k): v for k, v in totals.items()}
+        }, ensure_ascii=False).encode('utf-8')
@@ -0,0 +1,153 @@
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+from urllib.request import pathname2url
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from settings import Settings, user_data_dir
+
+logger = logging.getLogger(__name__)
+
+# Копирование идёт шагами по BACKUP_PAGES страниц с паузой между ними:
+# писатель успевает зафиксировать свои транзакции, окно не ждёт копирования
+BACKUP_PAGES = 256
+BACKUP_PAUSE = 0.005
+NAME_FORMAT = 'timer-%Y%m%d-%H%M%S.db'
+
+
+@dataclass
+class BackupInfo:
+    path: str
+    created: datetime
+    size: int
+
+
+def backup_folder(settings: Settings) -> str:
+    return settings.backup_folder or os.path.join(user_data_dir(), 'backups')
+
+
+def _connect_readonly(path: str) -> sqlite3.Connection:
+    uri = 'file:' + pathname2url(os.path.abspath(path)) + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def check_integrity(path: str) -> str:
+    """Результат PRAGMA integrity_check: 'ok' или описание повреждений"""
+    conn = _connect_readonly(path)
+    try:
+        return '\n'.join(row[0] for row in conn.execute('PRAGMA integrity_check'))
+    finally:
+        conn.close()
+
+
+def list_backups(folder: str) -> List[BackupInfo]:
+    """Резервные копии в папке, новые сначала"""
+    if not os.path.isdir(folder):
+        return []
+    backups = []
+    for name in os.listdir(folder):
+        try:
+            created = datetime.strptime(name, NAME_FORMAT)
+        except ValueError:
+            continue
+        path = os.path.join(folder, name)
+        backups.append(BackupInfo(path, created, os.path.getsize(path)))
+    backups.sort(key=lambda b: b.created, reverse=True)
+    return backups
+
+
+def prune_backups(folder: str, keep: int) -> List[str]:
+    """Удаляет копии старше keep последних поколений"""
+    removed = []
+    for info in list_backups(folder)[max(keep, 1):]:
+        os.remove(info.path)
+        removed.append(info.path)
+    return removed
+
+
+def create_backup(db_path: str, folder: str, keep: int = 10,
+                  progress: Optional[Callable[[int, int], None]] = None) -> BackupInfo:
+    """
+    Снимок работающей базы через backup API SQLite. Копия пишется во
+    временный файл, проверяется integrity_check и только потом получает
+    имя с датой; после этого старые поколения удаляются.
+
+    progress(скопировано страниц, всего страниц) вызывается после каждого шага.
+    """
+    os.makedirs(folder, exist_ok=True)
+    created = datetime.now()
+    path = os.path.join(folder, created.strftime(NAME_FORMAT))
+    part = path + '.part'
+
+    def on_step(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+
+    start = time.perf_counter()
+    source = _connect_readonly(db_path)
+    target = sqlite3.connect(part)
+    try:
+        source.backup(target, pages=BACKUP_PAGES, progress=on_step, sleep=BACKUP_PAUSE)
+    except Exception:
+        target.close()
+        os.remove(part)
+        raise
+    finally:
+        source.close()
+    try:
+        # Копия наследует режим WAL исходной базы, и проверка рядом с ней
+        # создала бы файлы -wal и -shm, которые остались бы в папке копий
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+
+    result = check_integrity(part)
+    if result != 'ok':
+        os.remove(part)
+        raise sqlite3.DatabaseError(f"Копия повреждена: {result}")
+    os.replace(part, path)
+    removed = prune_backups(folder, keep)
+    logger.info("Резервная копия создана", extra={
+        'path': path, 'seconds': round(time.perf_counter() - start, 3), 'removed': len(removed)})
+    return BackupInfo(path, created, os.path.getsize(path))
+
+
+def last_backup_time(folder: str) -> Optional[datetime]:
+    backups = list_backups(folder)
+    return backups[0].created if backups else None
+
+
+class BackupSignals(QObject):
+    progress = pyqtSignal(int, int)  # скопировано страниц, всего
+    finished = pyqtSignal(str)  # путь к копии
+    failed = pyqtSignal(str)
+
+
+class BackupJob(QRunnable):
+    """Создание резервной копии в пуле потоков Qt"""
+
+    def __init__(self, db_path: str, folder: str, keep: int):
+        super().__init__()
+        self.db_path = db_path
+        self.folder = folder
+        self.keep = keep
+        self.signals = BackupSignals()
+        # Объект задачи держит вызывающая сторона до получения результата
+        self.setAutoDelete(False)
+
+    def run(self):
+        try:
+            info = create_backup(self.db_path, self.folder, self.keep, self.signals.progress.emit)
+        except Exception as e:
+            logger.exception("Ошибка резервного копирования")
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(info.path)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
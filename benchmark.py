@@ -0,0 +1,251 @@
+"""
+Замеры производительности базы данных и статистики.
+
+    python benchmark.py --projects 5 --tasks 8 --years 2 --output bench.json
+    python benchmark.py --compare bench.json
+
+Результаты выводятся в JSON, чтобы сравнивать прогоны на разных коммитах.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from database import Database
+from models import RecordQuery
+from settings import Settings
+
+
+def generate_data(db: Database, projects: int, tasks: int, years: float, seed: int = 1) -> dict:
+    """
+    Синтетические данные: projects проектов по tasks задач, записи за years
+    лет. В рабочий день 4-10 сессий от 10 минут до 2 часов между 8 и 20
+    часами, в выходные - изредка. Данные одинаковы при одинаковом seed.
+    """
+    rng = random.Random(seed)
+    task_ids = []
+    for p in range(projects):
+        project = db.add_project(f"Проект {p + 1}")
+        for t in range(tasks):
+            task_ids.append(db.add_task(project.id, f"Задача {t + 1}").id)
+
+    # Несколько задач получают большую часть времени, как в реальной работе
+    weights = [1.0 / (i + 1) for i in range(len(task_ids))]
+    rng.shuffle(weights)
+
+    rows = []
+    day = date.today() - timedelta(days=int(years * 365))
+    while day <= date.today():
+        workday = day.weekday() < 5
+        sessions = rng.randint(4, 10) if workday else (rng.randint(1, 3) if rng.random() < 0.2 else 0)
+        moment = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=rng.randint(0, 90))
+        for _ in range(sessions):
+            duration = rng.randint(10 * 60, 2 * 3600)
+            end = moment + timedelta(seconds=duration)
+            if end.hour >= 20:
+                break
+            rows.append((rng.choices(task_ids, weights)[0],
+                         moment.strftime("%Y-%m-%d %H:%M:%S"),
+                         end.strftime("%Y-%m-%d %H:%M:%S"),
+                         duration, rng.random() < 0.85, uuid.uuid4().hex))
+            moment = end + timedelta(minutes=rng.randint(5, 60))
+        day += timedelta(days=1)
+
+    # Массовая загрузка напрямую: замеряем чтение, а не генератор
+    with db.transaction():
+        db.conn.executemany('''
+        INSERT INTO time_records
+        (task_id, start_time, end_time, duration_seconds, was_productive, uid)
+        VALUES (?, ?, ?, ?, ?, ?)''', rows)
+    db.conn.execute('ANALYZE')
+    return {'projects': projects, 'tasks': len(task_ids), 'records': len(rows), 'task_ids': task_ids}
+
+
+def measure(func, repeat: int) -> dict:
+    """Время выполнения func в миллисекундах: min/median/mean/max по repeat запускам"""
+    func()  # прогрев (кэш страниц SQLite, ленивая инициализация)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'repeat': repeat,
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def bench_database(db: Database, data: dict, repeat: int) -> dict:
+    results = {}
+    busiest = db.conn.execute('''
+        SELECT task_id FROM time_records GROUP BY task_id
+        ORDER BY COUNT(*) DESC LIMIT 1''').fetchone()[0]
+    today = date.today()
+
+    results['get_time_records_for_task'] = measure(lambda: db.get_time_records_for_task(busiest), repeat)
+    results['get_all_time_records'] = measure(db.get_all_time_records, repeat)
+    # Без кэша страниц - время самого запроса; *_cached - повторное обновление таблицы
+    month = RecordQuery(today - timedelta(days=30), today)
+    results['stats_query_month'] = measure(
+        lambda: (db.clear_query_cache(), db.query_records(month)), repeat)
+    results['stats_query_month_cached'] = measure(lambda: db.query_records(month), repeat)
+    results['stats_query_all'] = measure(
+        lambda: (db.clear_query_cache(), db.query_records(RecordQuery(date(1970, 1, 1), today))),
+        repeat)
+    results['stats_query_project'] = measure(
+        lambda: (db.clear_query_cache(),
+                 db.query_records(RecordQuery(date(1970, 1, 1), today, project_id=1))), repeat)
+    results['stats_query_page'] = measure(
+        lambda: (db.clear_query_cache(),
+                 db.query_records(RecordQuery(date(1970, 1, 1), today, limit=100, offset=1000))),
+        repeat)
+
+    # Вставка последней: она меняет данные для остальных замеров
+    # (каждая в своём промежутке: записи одной задачи не могут пересекаться)
+    starts = (datetime.now() + timedelta(minutes=10 * i) for i in itertools.count())
+    task_id = data['task_ids'][0]
+
+    def add_record():
+        start = next(starts)
+        db.add_time_record(task_id, start, start + timedelta(minutes=5), 300, True)
+    results['add_time_record'] = measure(add_record, repeat)
+    return results
+
+
+def bench_gui(workdir: str, repeat: int) -> dict:
+    """Заполнение комбобоксов и таблицы статистики в окне без экрана"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtCore import QDate
+        from ui import TimerApp
+    except ImportError as e:
+        return {'skipped': f"PyQt5 недоступен: {e}"}
+
+    app = QApplication.instance() or QApplication([])
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(workdir)  # TimerApp открывает db/timer.db и settings.json в текущей папке
+    try:
+        # Настройки окна - в рабочей папке замера: автоматическая резервная
+        # копия синтетической базы не должна попасть к копиям пользователя
+        settings = Settings()
+        settings.backup_interval_hours = 0
+        settings.backup_folder = os.path.join(workdir, 'backups')
+        settings.save()
+        window = TimerApp()
+
+        def fill_combos():
+            window.update_projects_combo()
+            window.update_filter_combos()
+
+        results['combo_population'] = measure(fill_combos, repeat)
+        # Таблица строится только на открытой вкладке статистики
+        window.tabs.setCurrentWidget(window.stats_tab)
+
+        def fill_stats(days):
+            window.date_from_edit.setDate(QDate.currentDate().addDays(-days))
+            window.date_to_edit.setDate(QDate.currentDate())
+            window.update_stats_table()
+            app.processEvents()
+
+        results['stats_table_fill_month'] = measure(lambda: fill_stats(30), repeat)
+        results['stats_table_fill_all'] = measure(lambda: fill_stats(365 * 100), max(repeat // 3, 1))
+        results['stats_table_rows'] = window.stats_table.rowCount()
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def compare(old: dict, new: dict):
+    """Печатает изменение медианы по каждому замеру"""
+    for section in ('database', 'gui'):
+        for name, result in new.get(section, {}).items():
+            before = old.get(section, {}).get(name)
+            if not isinstance(result, dict) or not isinstance(before, dict) or 'median_ms' not in result:
+                continue
+            ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            print(f"{section}.{name}: {before['median_ms']:.3f} -> {result['median_ms']:.3f} ms "
+                  f"({ratio:.2f}x)", file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Замеры производительности таймера")
+    parser.add_argument('--projects', type=int, default=5, help="Число проектов")
+    parser.add_argument('--tasks', type=int, default=8, help="Задач в каждом проекте")
+    parser.add_argument('--years', type=float, default=2, help="Лет записей")
+    parser.add_argument('--repeat', type=int, default=10, help="Повторов каждого замера")
+    parser.add_argument('--seed', type=int, default=1, help="Зерно генератора данных")
+    parser.add_argument('--no-gui', action='store_true', help="Не замерять окно")
+    parser.add_argument('--output', help="Файл для результатов (по умолчанию stdout)")
+    parser.add_argument('--compare', help="Предыдущий результат для сравнения")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database(os.path.join(workdir, 'db', 'timer.db'))
+        start = time.perf_counter()
+        data = generate_data(db, args.projects, args.tasks, args.years, args.seed)
+        generated_in = time.perf_counter() - start
+
+        report = {
+            'environment': environment(),
+            'dataset': {
+                'projects': data['projects'],
+                'tasks': data['tasks'],
+                'records': data['records'],
+                'years': args.years,
+                'seed': args.seed,
+                'generate_s': round(generated_in, 3),
+            },
+            'database': bench_database(db, data, args.repeat),
+        }
+        db.close()
+        if not args.no_gui:
+            report['gui'] = bench_gui(workdir, args.repeat)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QDate
+from PyQt5.QtWidgets import (QComboBox, QDateEdit, QDialog, QDialogButtonBox, QHBoxLayout,
+                             QLabel, QLineEdit, QMessageBox, QPushButton, QTableWidget,
+                             QTableWidgetItem, QVBoxLayout)
+
+from models import Rate
+from repository import Repository
+from settings import Settings
+
+CENT = Decimal('0.01')
+SECONDS_PER_HOUR = Decimal(3600)
+ROUNDING_MODES = {'record': "каждая запись", 'day': "задача за день", 'none': "без округления"}
+
+
+def round_up(seconds: int, step: int) -> int:
+    """Округление вверх до кратного step секунд"""
+    return -(-seconds // step) * step if step > 1 else seconds
+
+
+def month_periods(year: int) -> List[Tuple[date, date]]:
+    periods = []
+    for month in range(1, 13):
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        periods.append((start, end))
+    return periods
+
+
+class RateTable:
+    """
+    История ставок: для каждой задачи и проекта - даты начала действия
+    по возрастанию. Ставка на день ищется бинарным поиском; ставка задачи
+    важнее ставки проекта, без ставки время не оплачивается.
+    """
+
+    def __init__(self, rates: Iterable[Rate]):
+        self._dates: Dict[tuple, List[date]] = {}
+        self._values: Dict[tuple, List[Decimal]] = {}
+        # При одинаковой дате действует ставка, добавленная позже
+        for rate in sorted(rates, key=lambda r: (r.effective_from, r.id)):
+            key = ('task', rate.task_id) if rate.task_id is not None else ('project', rate.project_id)
+            self._dates.setdefault(key, []).append(rate.effective_from)
+            self._values.setdefault(key, []).append(rate.hourly_rate)
+
+    def _lookup(self, key: tuple, day: date) -> Optional[Decimal]:
+        dates = self._dates.get(key)
+        if not dates:
+            return None
+        index = bisect_right(dates, day)
+        return self._values[key][index - 1] if index else None
+
+    def rate_for(self, project_id: int, task_id: int, day: date) -> Decimal:
+        rate = self._lookup(('task', task_id), day)
+        if rate is None:
+            rate = self._lookup(('project', project_id), day)
+        return rate if rate is not None else Decimal(0)
+
+
+@dataclass
+class InvoiceLine:
+    project_id: int
+    task_id: int
+    seconds: int = 0
+    billable_seconds: int = 0  # после округления
+    amount: Decimal = Decimal(0)
+
+
+@dataclass
+class Invoice:
+    project_id: Optional[int]  # None - все проекты
+    date_from: date
+    date_to: date
+    lines: List[InvoiceLine] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> int:
+        return sum(line.seconds for line in self.lines)
+
+    @property
+    def billable_seconds(self) -> int:
+        return sum(line.billable_seconds for line in self.lines)
+
+    @property
+    def amount(self) -> Decimal:
+        return sum((line.amount for line in self.lines), Decimal(0))
+
+
+def bill(records: Iterable[tuple], rates: RateTable, periods: Sequence[Tuple[date, date]],
+         rounding: str = 'record', step_seconds: int = 900,
+         by_project: bool = True) -> Dict[Tuple[int, Optional[int]], Invoice]:
+    """
+    Счета за непересекающиеся периоды (по возрастанию) за один проход по
+    записям (id задачи, id проекта, начало, длительность).
+
+    Записи складываются по (период, проект, задача, день) в целых секундах:
+    округление 'day' применяется к сумме за день. Decimal нужен только в
+    конце - по одному умножению на каждую ставку строки счёта; суммы строк
+    округляются до копеек. Ключ результата - (номер периода, id проекта
+    или None при by_project=False).
+    """
+    starts = [period[0] for period in periods]
+    days: Dict[str, Optional[tuple]] = {}  # 'ГГГГ-ММ-ДД' -> (номер периода, дата)
+    groups: Dict[tuple, List[int]] = {}
+    for task_id, project_id, start, duration in records:
+        found = days.get(start[:10], False)
+        if found is False:
+            day = date.fromisoformat(start[:10])
+            index = bisect_right(starts, day) - 1
+            found = days[start[:10]] = ((index, day) if index >= 0 and day <= periods[index][1]
+                                        else None)
+        if found is None:
+            continue
+        key = (found[0], project_id, task_id, found[1])
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = [0, 0]
+        totals[0] += duration
+        if rounding == 'record':
+            totals[1] += round_up(duration, step_seconds)
+
+    invoices: Dict[Tuple[int, Optional[int]], Invoice] = {}
+    lines: Dict[tuple, InvoiceLine] = {}
+    billable_by_rate: Dict[tuple, Dict[Decimal, int]] = {}
+    for (index, project_id, task_id, day), (seconds, billable) in groups.items():
+        if rounding == 'day':
+            billable = round_up(seconds, step_seconds)
+        elif rounding != 'record':
+            billable = seconds
+        line_key = (index, project_id if by_project else None, task_id)
+        line = lines.get(line_key)
+        if line is None:
+            invoice = invoices.get(line_key[:2])
+            if invoice is None:
+                invoice = invoices[line_key[:2]] = Invoice(line_key[1], *periods[index])
+            line = lines[line_key] = InvoiceLine(project_id, task_id)
+            invoice.lines.append(line)
+            billable_by_rate[line_key] = {}
+        line.seconds += seconds
+        line.billable_seconds += billable
+        by_rate = billable_by_rate[line_key]
+        rate = rates.rate_for(project_id, task_id, day)
+        by_rate[rate] = by_rate.get(rate, 0) + billable
+    for line_key, line in lines.items():
+        amount = sum((rate * seconds for rate, seconds in billable_by_rate[line_key].items()),
+                     Decimal(0))
+        line.amount = (amount / SECONDS_PER_HOUR).quantize(CENT, ROUND_HALF_UP)
+    return invoices
+
+
+class BillingEngine:
+    """
+    Счета за период с кэшем по (проект, период). Кэш сбрасывается при любом
+    изменении записей (события базы и счётчик изменений), ставок и
+    настроек округления.
+    """
+
+    def __init__(self, db: Repository, settings: Settings):
+        self.db = db
+        self.settings = settings
+        self._rates: Optional[RateTable] = None
+        # (проект, начало, конец) -> Invoice; ("year", год) -> список счетов года
+        self._cache: Dict[tuple, object] = {}
+        self._cache_key = None
+
+    def invalidate(self):
+        """После изменения ставок"""
+        self._rates = None
+        self._cache.clear()
+
+    def on_db_event(self, event: str, payload):
+        """Обработчик Database.add_listener: записи изменились - счета устарели"""
+        if event != 'catalog_changed':
+            self._cache.clear()
+
+    def rates(self) -> RateTable:
+        if self._rates is None:
+            self._rates = RateTable(self.db.get_rates())
+        return self._rates
+
+    def _check_cache(self):
+        key = (self.db.get_change_counter(), self.settings.billing_rounding,
+               self.settings.billing_round_minutes)
+        if key != self._cache_key:
+            self._cache.clear()
+            self._cache_key = key
+
+    def _bill(self, periods: Sequence[Tuple[date, date]], project_id: Optional[int],
+              by_project: bool) -> Dict[Tuple[int, Optional[int]], Invoice]:
+        records = self.db.iter_time_records(periods[0][0], periods[-1][1], project_id)
+        return bill(records, self.rates(), periods, self.settings.billing_rounding,
+                    self.settings.billing_round_minutes * 60, by_project)
+
+    def invoice(self, project_id: Optional[int], date_from: date, date_to: date) -> Invoice:
+        """Счёт за период по проекту (None - по всем проектам вместе)"""
+        self._check_cache()
+        key = (project_id, date_from, date_to)
+        if key not in self._cache:
+            invoices = self._bill([(date_from, date_to)], project_id, by_project=False)
+            self._cache[key] = invoices.get((0, None)) or Invoice(project_id, date_from, date_to)
+            self._cache[key].project_id = project_id
+        return self._cache[key]
+
+    def monthly_invoices(self, year: int) -> List[Invoice]:
+        """Счета по каждому проекту за каждый месяц года - один проход по записям"""
+        self._check_cache()
+        periods = month_periods(year)
+        key = ('year', year)
+        if key not in self._cache:
+            invoices = self._bill(periods, None, by_project=True)
+            for invoice in invoices.values():
+                self._cache[(invoice.project_id, invoice.date_from, invoice.date_to)] = invoice
+            self._cache[key] = sorted(invoices.values(),
+                                      key=lambda i: (i.date_from, i.project_id))
+        return self._cache[key]
+
+
+def format_hours(seconds: int) -> str:
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}"
+
+
+class InvoiceDialog(QDialog):
+    """Строки счёта по задачам и итог"""
+
+    def __init__(self, invoice: Invoice, task_titles: Dict[int, str], rounding: str, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Счёт за {invoice.date_from:%d.%m.%Y} - {invoice.date_to:%d.%m.%Y}")
+        self.resize(600, 400)
+        layout = QVBoxLayout(self)
+
+        table = QTableWidget(len(invoice.lines), 4)
+        table.setHorizontalHeaderLabels(["Задача", "Время", "К оплате (ч)", "Сумма"])
+        for row, line in enumerate(sorted(invoice.lines, key=lambda l: -l.amount)):
+            table.setItem(row, 0, QTableWidgetItem(task_titles.get(line.task_id, "?")))
+            table.setItem(row, 1, QTableWidgetItem(format_hours(line.seconds)))
+            table.setItem(row, 2, QTableWidgetItem(format_hours(line.billable_seconds)))
+            table.setItem(row, 3, QTableWidgetItem(f"{line.amount:.2f}"))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+
+        layout.addWidget(QLabel(
+            f"Итого: {format_hours(invoice.billable_seconds)} ч к оплате "
+            f"(учтено {format_hours(invoice.seconds)}, округление: {ROUNDING_MODES[rounding]}), "
+            f"сумма {invoice.amount:.2f}"))
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+
+class RatesDialog(QDialog):
+    """История ставок с добавлением и удалением"""
+
+    def __init__(self, db: Repository, targets: List[Tuple[int, Optional[int], str]], parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Почасовые ставки")
+        self.resize(600, 360)
+        self.db = db
+        # (id проекта, id задачи или None, название)
+        self.targets = targets
+        self.changed = False
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Проект / задача", "Действует с", "Ставка в час", ""])
+        layout.addWidget(self.table)
+
+        add_layout = QHBoxLayout()
+        self.target_combo = QComboBox()
+        for project_id, task_id, title in targets:
+            self.target_combo.addItem(title, (project_id, task_id))
+        add_layout.addWidget(self.target_combo)
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setDisplayFormat("dd.MM.yyyy")
+        self.date_edit.setCalendarPopup(True)
+        add_layout.addWidget(self.date_edit)
+        self.rate_edit = QLineEdit()
+        self.rate_edit.setPlaceholderText("например, 1500.00")
+        add_layout.addWidget(self.rate_edit)
+        add_btn = QPushButton("Добавить")
+        add_btn.clicked.connect(self.add_rate)
+        add_layout.addWidget(add_btn)
+        layout.addLayout(add_layout)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.populate()
+
+    def populate(self):
+        titles = {(project_id, task_id): title for project_id, task_id, title in self.targets}
+        rates = self.db.get_rates()
+        self.table.setRowCount(len(rates))
+        for row, rate in enumerate(rates):
+            self.table.setItem(row, 0, QTableWidgetItem(titles.get((rate.project_id, rate.task_id), "?")))
+            self.table.setItem(row, 1, QTableWidgetItem(f"{rate.effective_from:%d.%m.%Y}"))
+            self.table.setItem(row, 2, QTableWidgetItem(str(rate.hourly_rate)))
+            btn = QPushButton("Удалить")
+            btn.clicked.connect(lambda _, r=rate: self.delete_rate(r))
+            self.table.setCellWidget(row, 3, btn)
+        self.table.resizeColumnsToContents()
+
+    def add_rate(self):
+        target = self.target_combo.currentData()
+        try:
+            hourly_rate = Decimal(self.rate_edit.text().strip().replace(',', '.'))
+        except InvalidOperation:
+            hourly_rate = None
+        if target is None or hourly_rate is None or not hourly_rate.is_finite() or hourly_rate < 0:
+            QMessageBox.warning(self, "Ошибка", "Выберите проект или задачу и укажите ставку числом")
+            return
+        project_id, task_id = target
+        self.db.add_rate(project_id, task_id, self.date_edit.date().toPyDate(), hourly_rate)
+        self.changed = True
+        self.rate_edit.clear()
+        self.populate()
+
+    def delete_rate(self, rate: Rate):
+        self.db.delete_rate(rate.id)
+        self.changed = True
+        self.populate()
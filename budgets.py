@@ -0,0 +1,220 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import (QComboBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QHBoxLayout,
+                             QMessageBox, QPushButton, QTableWidget, QTableWidgetItem,
+                             QVBoxLayout)
+
+from models import Budget, TimeRecord
+from repository import Repository
+from timer_logic import Timer
+
+PERIODS = {'day': "день", 'week': "неделя", 'total': "всего"}
+# Доли бюджета, при достижении которых выдаётся предупреждение
+THRESHOLDS = (0.8, 1.0)
+
+
+def period_start(period: str, today: date) -> Optional[date]:
+    """Первый день текущего периода бюджета (None - без ограничения)"""
+    if period == 'day':
+        return today
+    if period == 'week':
+        return today - timedelta(days=today.weekday())
+    return None
+
+
+class BudgetTracker(QObject):
+    """
+    Расход бюджетов времени проектов и задач.
+
+    Записи, попадающие под бюджеты, читаются одним запросом при запуске;
+    дальше счётчики меняются на длительность каждой добавленной или
+    удалённой записи (события базы), без пересчёта истории. Время идущих
+    сессий передаётся в progress()/check() отдельно, поэтому показ
+    прогресса на каждом тике таймера не обращается к базе.
+    """
+
+    threshold_reached = pyqtSignal(object, float)  # бюджет, достигнутая доля
+
+    def __init__(self, db: Repository, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.budgets: List[Budget] = []
+        self.used: Dict[int, int] = {}
+        # id записи -> (задача, проект, день начала, секунды)
+        self._records: Dict[int, tuple] = {}
+        self._projects: Dict[int, int] = {}  # задача -> проект
+        self._today = None
+        # (бюджет, порог, начало периода) - о чём уже предупредили
+        self._alerted = set()
+        self.reload()
+
+    def reload(self):
+        """Полный пересчёт: при изменении бюджетов и массовых изменениях записей"""
+        self.budgets = self.db.get_budgets()
+        self._records = {}
+        for record_id, task_id, project_id, start, seconds in self.db.get_budget_records():
+            self._projects[task_id] = project_id
+            self._records[record_id] = (task_id, project_id,
+                                        datetime.fromisoformat(start).date(), seconds)
+        self._recount()
+        # Уже пройденные пороги не повторяются после перезапуска или пересчёта
+        for budget in self.budgets:
+            self._crossed(budget, self.used[budget.id])
+
+    def _recount(self):
+        self._today = date.today()
+        self.used = {budget.id: 0 for budget in self.budgets}
+        for record in self._records.values():
+            self._count(record, 1)
+
+    @staticmethod
+    def _targets(budget: Budget, task_id: int, project_id: int) -> bool:
+        if budget.task_id is not None:
+            return budget.task_id == task_id
+        return budget.project_id == project_id
+
+    def _count(self, record: tuple, sign: int):
+        task_id, project_id, day, seconds = record
+        for budget in self.budgets:
+            start = period_start(budget.period, self._today)
+            if self._targets(budget, task_id, project_id) and (start is None or day >= start):
+                self.used[budget.id] += sign * seconds
+
+    def _project_of(self, task_id: int) -> Optional[int]:
+        if task_id not in self._projects:
+            task = self.db.get_task(task_id)
+            self._projects[task_id] = task.project_id if task else None
+        return self._projects[task_id]
+
+    def _add(self, record: TimeRecord):
+        project_id = self._project_of(record.task_id)
+        if not any(self._targets(b, record.task_id, project_id) for b in self.budgets):
+            return
+        entry = (record.task_id, project_id, record.start_time.date(), record.duration_seconds)
+        self._records[record.id] = entry
+        self._count(entry, 1)
+        self.check(record.task_id)
+
+    def on_db_event(self, event: str, payload):
+        if event == 'record_added':
+            self._add(payload)
+        elif event == 'records_added':
+            for record in payload:
+                self._add(record)
+        elif event == 'record_deleted':
+            entry = self._records.pop(payload, None)
+            if entry is not None:
+                self._count(entry, -1)
+        elif event == 'records_changed':
+            self.reload()
+
+    def progress(self, task_id: int, extra: int = 0) -> List[Tuple[Budget, int]]:
+        """Бюджеты задачи и её проекта с израсходованным временем (+ extra секунд)"""
+        if not self.budgets:
+            return []
+        if self._today != date.today():
+            self._recount()  # начался новый день или неделя
+        project_id = self._project_of(task_id)
+        return [(budget, self.used[budget.id] + extra) for budget in self.budgets
+                if self._targets(budget, task_id, project_id)]
+
+    def _crossed(self, budget: Budget, used: int) -> Optional[float]:
+        """Наибольший новый пройденный порог (и запоминает пройденные)"""
+        reached = None
+        for threshold in THRESHOLDS:
+            key = (budget.id, threshold, period_start(budget.period, self._today))
+            if used >= budget.seconds * threshold and key not in self._alerted:
+                self._alerted.add(key)
+                reached = threshold
+        return reached
+
+    def check(self, task_id: int, extra: int = 0):
+        """Сигнал threshold_reached для порогов, пройденных впервые в этом периоде"""
+        for budget, used in self.progress(task_id, extra):
+            if self._crossed(budget, used) is not None:
+                self.threshold_reached.emit(budget, used / budget.seconds)
+
+    def describe(self, task_id: Optional[int], extra: int = 0) -> str:
+        if task_id is None:
+            return ""
+        return " | ".join(
+            f"{PERIODS[budget.period].capitalize()}: {Timer.format_time(used)} из "
+            f"{Timer.format_time(budget.seconds)} ({used / budget.seconds:.0%})"
+            for budget, used in self.progress(task_id, extra))
+
+
+class BudgetsDialog(QDialog):
+    """Список бюджетов с добавлением и удалением"""
+
+    def __init__(self, db: Repository, targets: List[Tuple[Optional[int], Optional[int], str]],
+                 parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Бюджеты времени")
+        self.resize(560, 360)
+        self.db = db
+        # (id проекта, id задачи, название); у бюджета задачи id проекта не хранится
+        self.targets = targets
+        self.changed = False
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Проект / задача", "Период", "Часы", ""])
+        layout.addWidget(self.table)
+
+        add_layout = QHBoxLayout()
+        self.target_combo = QComboBox()
+        for project_id, task_id, title in targets:
+            self.target_combo.addItem(title, (project_id, task_id))
+        add_layout.addWidget(self.target_combo)
+        self.period_combo = QComboBox()
+        for period, name in PERIODS.items():
+            self.period_combo.addItem(name, period)
+        add_layout.addWidget(self.period_combo)
+        self.hours_spinbox = QDoubleSpinBox()
+        self.hours_spinbox.setRange(0.25, 10000)
+        self.hours_spinbox.setSingleStep(0.5)
+        self.hours_spinbox.setValue(8)
+        self.hours_spinbox.setSuffix(" ч")
+        add_layout.addWidget(self.hours_spinbox)
+        add_btn = QPushButton("Добавить")
+        add_btn.clicked.connect(self.add_budget)
+        add_layout.addWidget(add_btn)
+        layout.addLayout(add_layout)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.populate()
+
+    def populate(self):
+        titles = {(project_id, task_id): title for project_id, task_id, title in self.targets}
+        budgets = self.db.get_budgets()
+        self.table.setRowCount(len(budgets))
+        for row, budget in enumerate(budgets):
+            key = (None, budget.task_id) if budget.task_id is not None else (budget.project_id, None)
+            self.table.setItem(row, 0, QTableWidgetItem(titles.get(key, "?")))
+            self.table.setItem(row, 1, QTableWidgetItem(PERIODS[budget.period]))
+            self.table.setItem(row, 2, QTableWidgetItem(f"{budget.seconds / 3600:g}"))
+            btn = QPushButton("Удалить")
+            btn.clicked.connect(lambda _, b=budget: self.delete_budget(b))
+            self.table.setCellWidget(row, 3, btn)
+        self.table.resizeColumnsToContents()
+
+    def add_budget(self):
+        target = self.target_combo.currentData()
+        if target is None:
+            QMessageBox.warning(self, "Ошибка", "Нет проектов для бюджета")
+            return
+        project_id, task_id = target
+        self.db.add_budget(project_id, task_id, self.period_combo.currentData(),
+                           int(self.hours_spinbox.value() * 3600))
+        self.changed = True
+        self.populate()
+
+    def delete_budget(self, budget: Budget):
+        self.db.delete_budget(budget.id)
+        self.changed = True
+        self.populate()
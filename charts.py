@@ -0,0 +1,216 @@
+import math
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+from PyQt5.QtCore import Qt, QRectF, QPointF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel
+
+from analytics import Analytics, index_to_date
+from profiling import timed
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+MARGIN = 30
+
+
+def project_color(index: int) -> QColor:
+    """Цвет проекта: равномерно по кругу оттенков"""
+    return QColor.fromHsv((index * 67) % 360, 160, 220)
+
+
+class ChartWidget(QWidget):
+    """
+    Базовый класс графиков. Графики не читают записи из БД: они рисуют
+    предрасчитанные агрегаты Analytics.aggregates(), поэтому перерисовка
+    не зависит от количества записей в выбранном периоде.
+    """
+
+    def __init__(self, analytics: Analytics, parent=None):
+        super().__init__(parent)
+        self.analytics = analytics
+        self.date_from: Optional[date] = None
+        self.date_to: Optional[date] = None
+        self.project_id: Optional[int] = None
+        self.setMinimumHeight(150)
+
+    def set_filters(self, date_from: Optional[date], date_to: Optional[date],
+                    project_id: Optional[int] = None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.project_id = project_id
+        self.update()
+
+    def plot_rect(self) -> QRectF:
+        return QRectF(MARGIN, 10, max(self.width() - MARGIN - 10, 1),
+                      max(self.height() - MARGIN - 10, 1))
+
+    @timed
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), self.palette().base())
+        try:
+            self.draw(painter, self.plot_rect())
+        finally:
+            painter.end()
+
+    def draw(self, painter: QPainter, rect: QRectF):
+        raise NotImplementedError
+
+    def draw_date_axis(self, painter: QPainter, rect: QRectF, first_day: int, n_days: int):
+        painter.setPen(self.palette().text().color())
+        painter.drawLine(rect.bottomLeft(), rect.bottomRight())
+        if n_days <= 0:
+            return
+        painter.drawText(QPointF(rect.left(), rect.bottom() + 15),
+                         index_to_date(first_day).strftime("%d.%m.%Y"))
+        last = index_to_date(first_day + n_days - 1).strftime("%d.%m.%Y")
+        width = painter.fontMetrics().horizontalAdvance(last)
+        painter.drawText(QPointF(rect.right() - width, rect.bottom() + 15), last)
+
+
+class StackedBarsChart(ChartWidget):
+    """Столбцы по дням, разбитые по проектам"""
+
+    def draw(self, painter: QPainter, rect: QRectF):
+        aggregates = self.analytics.aggregates()
+        first_day, matrix = aggregates.stacked_days(self.date_from, self.date_to)
+        # Цвет столбца привязан к проекту, а не к позиции после фильтрации
+        columns = [i for i, p in enumerate(aggregates.project_ids)
+                   if not self.project_id or p == self.project_id]
+        matrix = matrix[:, columns]
+        n_days = len(matrix)
+        self.draw_date_axis(painter, rect, first_day, n_days)
+        if not n_days or not matrix.size:
+            return
+
+        # Если дней больше, чем помещается столбцов, объединяем соседние дни
+        bucket = max(1, math.ceil(n_days / max(rect.width() // 3, 1)))
+        pad = (-n_days) % bucket
+        if pad:
+            matrix = np.pad(matrix, ((0, pad), (0, 0)))
+        buckets = matrix.reshape(-1, bucket, matrix.shape[1]).sum(axis=1)
+        stacked = np.cumsum(buckets, axis=1)
+        top = stacked[:, -1].max()
+        if top <= 0:
+            return
+
+        bar_width = rect.width() / len(buckets)
+        scale = rect.height() / top
+        painter.setPen(Qt.NoPen)
+        for column in range(buckets.shape[1]):
+            painter.setBrush(project_color(columns[column]))
+            lower = stacked[:, column] - buckets[:, column]
+            for i in np.flatnonzero(buckets[:, column] > 0):
+                y = rect.bottom() - stacked[i, column] * scale
+                painter.drawRect(QRectF(rect.left() + i * bar_width, y,
+                                        max(bar_width - 1, 1),
+                                        (stacked[i, column] - lower[i]) * scale))
+
+        painter.setPen(self.palette().text().color())
+        painter.drawText(QPointF(2, rect.top() + 10), f"{top / 3600:.1f} ч")
+
+
+class HeatmapChart(ChartWidget):
+    """Теплокарта часов работы по дням недели и часам суток"""
+
+    def draw(self, painter: QPainter, rect: QRectF):
+        heat = self.analytics.aggregates().heatmap(self.date_from, self.date_to)
+        peak = heat.max()
+        cell_w = rect.width() / 24
+        cell_h = rect.height() / 7
+        painter.setPen(Qt.NoPen)
+        for weekday in range(7):
+            for hour in range(24):
+                level = heat[weekday, hour] / peak if peak > 0 else 0.0
+                color = QColor(255 - int(200 * level), 255 - int(120 * level), 255)
+                painter.setBrush(color)
+                painter.drawRect(QRectF(rect.left() + hour * cell_w,
+                                        rect.top() + weekday * cell_h,
+                                        cell_w - 1, cell_h - 1))
+
+        painter.setPen(self.palette().text().color())
+        for weekday, name in enumerate(WEEKDAYS):
+            painter.drawText(QPointF(2, rect.top() + (weekday + 0.7) * cell_h), name)
+        for hour in range(0, 24, 3):
+            painter.drawText(QPointF(rect.left() + hour * cell_w, rect.bottom() + 15), str(hour))
+
+
+class TrendChart(ChartWidget):
+    """Доля продуктивного времени (скользящее окно 7 дней)"""
+
+    window_days = 7
+
+    def draw(self, painter: QPainter, rect: QRectF):
+        first_day, ratio = self.analytics.aggregates().productivity_trend(
+            self.window_days, self.date_from, self.date_to)
+        n_days = len(ratio)
+        self.draw_date_axis(painter, rect, first_day, n_days)
+        painter.setPen(self.palette().text().color())
+        painter.drawText(QPointF(2, rect.top() + 10), "100%")
+        if n_days == 0:
+            return
+
+        # Не рисуем точек больше, чем пикселей по ширине
+        step = max(1, math.ceil(n_days / max(rect.width(), 1)))
+        indexes = np.arange(0, n_days, step)
+        xs = rect.left() + indexes * rect.width() / max(n_days - 1, 1)
+        ys = rect.bottom() - ratio[indexes] * rect.height()
+
+        path = QPainterPath()
+        pen_down = False
+        for x, y in zip(xs, ys):
+            if np.isnan(y):
+                pen_down = False
+                continue
+            if pen_down:
+                path.lineTo(x, y)
+            else:
+                path.moveTo(x, y)
+                pen_down = True
+        painter.setPen(QPen(QColor(40, 160, 70), 2))
+        painter.drawPath(path)
+
+
+class ChartsPanel(QWidget):
+    """Панель графиков вкладки статистики"""
+
+    def __init__(self, analytics: Analytics, parent=None):
+        super().__init__(parent)
+        self.analytics = analytics
+        layout = QVBoxLayout(self)
+
+        self.legend_label = QLabel("")
+        self.bars_chart = StackedBarsChart(analytics)
+        self.heatmap_chart = HeatmapChart(analytics)
+        self.trend_chart = TrendChart(analytics)
+
+        layout.addWidget(QLabel("Время по дням и проектам:"))
+        layout.addWidget(self.bars_chart, 2)
+        layout.addWidget(self.legend_label)
+        layout.addWidget(QLabel("Часы работы по дням недели:"))
+        layout.addWidget(self.heatmap_chart, 1)
+        layout.addWidget(QLabel("Продуктивность (среднее за 7 дней):"))
+        layout.addWidget(self.trend_chart, 1)
+
+    def charts(self):
+        return self.bars_chart, self.heatmap_chart, self.trend_chart
+
+    def set_filters(self, date_from: Optional[date], date_to: Optional[date],
+                    project_id: Optional[int] = None):
+        for chart in self.charts():
+            chart.set_filters(date_from, date_to, project_id)
+
+    def set_project_names(self, names: Dict[int, str]):
+        aggregates = self.analytics.aggregates()
+        parts = []
+        for column, project_id in enumerate(aggregates.project_ids):
+            color = project_color(column).name()
+            parts.append(f'<span style="color:{color}">■</span> {names.get(project_id, project_id)}')
+        self.legend_label.setText("&nbsp;&nbsp;".join(parts))
+
+    def refresh(self):
+        """Перерисовка после изменения агрегатов (без перечитывания записей)"""
+        for chart in self.charts():
+            chart.update()
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+from datetime import date, datetime
+
+from analytics import Analytics
+from billing import BillingEngine, format_hours
+from backup import backup_folder, check_integrity, create_backup, list_backups
+from database import Database
+from ical import export_ics, import_ics, rules_from_settings
+from settings import Settings
+from sync import SyncEngine, FolderTransport
+from team_server import TeamServer, RemoteRepository, TOKEN_ENV
+from reports import build_timesheet, period_bounds, prepare_report, write_report, REPORT_FORMATS
+
+
+def format_seconds(seconds) -> str:
+    mins, secs = divmod(int(seconds), 60)
+    hours, mins = divmod(mins, 60)
+    return f"{hours:02d}:{mins:02d}:{secs:02d}"
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def cmd_stats(db: Database, args) -> int:
+    analytics = Analytics(db)
+    filters = dict(date_from=args.date_from, date_to=args.date_to,
+                   project_id=args.project, task_id=args.task)
+
+    if args.by == 'day':
+        totals = analytics.totals_by_day(**filters)
+    elif args.by == 'week':
+        totals = analytics.totals_by_week(**filters)
+    elif args.by == 'project':
+        names = {p.id: p.name for p in db.get_projects()}
+        totals = {names.get(k, k): v for k, v in analytics.totals_by_project(**filters).items()}
+    else:
+        totals = analytics.totals_by_task(**filters)
+    summary = analytics.summary(**filters)
+
+    if args.json:
+        print(json.dumps({
+            'summary': summary,
+            'totals': {str(k): v for k, v in totals.items()}
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    for key, seconds in totals.items():
+        print(f"{key}\t{format_seconds(seconds)}")
+    print(f"Записей: {summary['records']}")
+    print(f"Общее время: {format_seconds(summary['total_seconds'])}")
+    print(f"В среднем за день: {format_seconds(summary['average_per_day'])}")
+    print(f"Продуктивно: {summary['productive_ratio']:.0%}")
+    return 0
+
+
+def parse_address(value: str) -> tuple:
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def cmd_sync(db: Database, args) -> int:
+    if not isinstance(db, Database):
+        print("Синхронизация доступна только для локальной базы")
+        return 1
+    folder = args.folder or Settings().sync_folder
+    if not folder:
+        print("Не задана папка синхронизации (--folder)")
+        return 1
+    pushed, applied = SyncEngine(db, FolderTransport(folder)).sync()
+    print(f"Отправлено изменений: {pushed}, получено: {applied}")
+    return 0
+
+
+def cmd_report(db: Database, args) -> int:
+    if args.date_from or args.date_to:
+        date_from = args.date_from or date(1970, 1, 1)
+        date_to = args.date_to or date.today()
+        title = "Табель"
+    else:
+        date_from, date_to = period_bounds(args.period, args.date)
+        title = "Табель за неделю" if args.period == 'week' else "Табель за месяц"
+
+    if REPORT_FORMATS.get(os.path.splitext(args.output)[1].lower()) == 'pdf':
+        # QPrinter нужен объект приложения Qt; окно не создаётся
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtGui import QGuiApplication
+        app = QGuiApplication.instance() or QGuiApplication([])
+
+    cols, names = prepare_report(Analytics(db), db, date_from, date_to, args.project, args.task)
+    try:
+        write_report(build_timesheet(cols, names, date_from, date_to, title), args.output)
+    except ValueError as e:
+        print(e)
+        return 1
+    print(f"Отчёт сохранён: {args.output}")
+    return 0
+
+
+def cmd_invoice(db: Database, args) -> int:
+    settings = Settings()
+    if args.rounding:
+        settings.billing_rounding = args.rounding
+    engine = BillingEngine(db, settings)
+    if args.year:
+        invoices = engine.monthly_invoices(args.year)
+        if args.project:
+            invoices = [i for i in invoices if i.project_id == args.project]
+    else:
+        date_from, date_to = period_bounds('month', args.date)
+        invoices = [engine.invoice(args.project, args.date_from or date_from,
+                                   args.date_to or date_to)]
+    names = {p.id: p.name for p in db.get_projects()}
+    if args.json:
+        print(json.dumps([{'project_id': i.project_id, 'from': i.date_from.isoformat(),
+                           'to': i.date_to.isoformat(), 'seconds': i.seconds,
+                           'billable_seconds': i.billable_seconds, 'amount': str(i.amount)}
+                          for i in invoices], ensure_ascii=False, indent=2))
+        return 0
+    for invoice in invoices:
+        project = names.get(invoice.project_id, "Все проекты")
+        print(f"{invoice.date_from} - {invoice.date_to}  {project:<20} "
+              f"{format_hours(invoice.billable_seconds):>8} ч  {invoice.amount:>12.2f}")
+    return 0
+
+
+def cmd_calendar(db: Database, args) -> int:
+    if bool(args.export_path) == bool(args.import_path):
+        print("Укажите --export или --import")
+        return 1
+    if args.export_path:
+        count = export_ics(db, args.export_path, args.date_from or date(1970, 1, 1),
+                           args.date_to or date.today(), args.project)
+        print(f"Выгружено событий: {count} в {args.export_path}")
+        return 0
+    settings = Settings()
+    default_project = (args.default_project if args.default_project is not None
+                       else settings.ical_default_project)
+    result = import_ics(db, args.import_path, rules_from_settings(settings), default_project,
+                        args.date_from, args.date_to)
+    print(f"Импортировано: {result.imported}, пропущено: {result.skipped}, "
+          f"пересекается с записями: {result.rejected}")
+    return 0
+
+
+def cmd_backup(db: Database, args) -> int:
+    if not isinstance(db, Database):
+        print("Резервное копирование доступно только для локальной базы")
+        return 1
+    settings = Settings()
+    folder = args.folder or backup_folder(settings)
+
+    if args.list:
+        for info in list_backups(folder):
+            print(f"{info.created:%Y-%m-%d %H:%M:%S}\t{info.size // 1024} КБ\t{info.path}")
+        return 0
+
+    if args.restore:
+        if args.restore == 'latest':
+            backups = list_backups(folder)
+            if not backups:
+                print(f"В папке {folder} нет резервных копий")
+                return 1
+            path = backups[0].path
+        else:
+            path = args.restore
+        result = check_integrity(path)
+        if result != 'ok':
+            print(f"Копия повреждена: {result}")
+            return 1
+        db.restore(path)
+        print(f"База восстановлена из {path}")
+        return 0
+
+    info = create_backup(db.db_path, folder, args.keep or settings.backup_keep)
+    print(f"Резервная копия сохранена: {info.path}")
+    return 0
+
+
+def cmd_serve(args) -> int:
+    try:
+        server = TeamServer(args.db, args.host, args.port, token=args.token)
+    except ValueError as e:
+        print(f"{e} (--token или переменная {TOKEN_ENV})")
+        return 2
+    print(f"Сервер команды: {args.host}:{args.port}, база {args.db}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='main.py', description="Таймер учёта рабочего времени")
+    parser.add_argument('--db', default='db/timer.db', help="Путь к файлу базы данных")
+    parser.add_argument('--server', help="Общий сервер команды (хост:порт) вместо локальной базы")
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f"Общий секрет сервера команды (по умолчанию из {TOKEN_ENV})")
+    commands = parser.add_subparsers(dest='command')
+
+    stats = commands.add_parser('stats', help="Статистика по записям времени")
+    stats.add_argument('--from', dest='date_from', type=parse_date, help="Дата от (ГГГГ-ММ-ДД)")
+    stats.add_argument('--to', dest='date_to', type=parse_date, help="Дата до (ГГГГ-ММ-ДД)")
+    stats.add_argument('--project', type=int, help="ID проекта")
+    stats.add_argument('--task', type=int, help="ID задачи")
+    stats.add_argument('--by', choices=['day', 'week', 'project', 'task'], default='day',
+                       help="Группировка")
+    stats.add_argument('--json', action='store_true', help="Вывод в формате JSON")
+    stats.set_defaults(handler=cmd_stats)
+
+    report = commands.add_parser('report', help="Табель за неделю, месяц или период")
+    report.add_argument('--period', choices=['week', 'month'], default='week',
+                        help="Неделя или месяц, содержащие --date")
+    report.add_argument('--date', type=parse_date, help="Дата внутри периода (по умолчанию сегодня)")
+    report.add_argument('--from', dest='date_from', type=parse_date, help="Произвольный период: от")
+    report.add_argument('--to', dest='date_to', type=parse_date, help="Произвольный период: до")
+    report.add_argument('--project', type=int, help="ID проекта")
+    report.add_argument('--task', type=int, help="ID задачи")
+    report.add_argument('--output', '-o', required=True, help="Файл отчёта: .html, .pdf или .csv")
+    report.set_defaults(handler=cmd_report)
+
+    invoice = commands.add_parser('invoice', help="Счёт по ставкам за период или помесячно за год")
+    invoice.add_argument('--year', type=int, help="Счета по каждому проекту за каждый месяц года")
+    invoice.add_argument('--date', type=parse_date, help="Дата внутри месяца (по умолчанию сегодня)")
+    invoice.add_argument('--from', dest='date_from', type=parse_date, help="Произвольный период: от")
+    invoice.add_argument('--to', dest='date_to', type=parse_date, help="Произвольный период: до")
+    invoice.add_argument('--project', type=int, help="ID проекта")
+    invoice.add_argument('--rounding', choices=['record', 'day', 'none'],
+                         help="Округление (по умолчанию из настроек)")
+    invoice.add_argument('--json', action='store_true', help="Вывод в формате JSON")
+    invoice.set_defaults(handler=cmd_invoice)
+
+    calendar = commands.add_parser('calendar', help="Экспорт и импорт календаря iCalendar (.ics)")
+    calendar.add_argument('--export', dest='export_path', metavar='FILE',
+                          help="Выгрузить записи в файл .ics")
+    calendar.add_argument('--import', dest='import_path', metavar='FILE',
+                          help="Загрузить события из файла .ics как записи")
+    calendar.add_argument('--from', dest='date_from', type=parse_date, help="Дата от (ГГГГ-ММ-ДД)")
+    calendar.add_argument('--to', dest='date_to', type=parse_date, help="Дата до (ГГГГ-ММ-ДД)")
+    calendar.add_argument('--project', type=int, help="ID проекта (экспорт)")
+    calendar.add_argument('--default-project', help="Проект для событий без правила "
+                                                    "(по умолчанию из настроек, '' - пропускать)")
+    calendar.set_defaults(handler=cmd_calendar)
+
+    sync = commands.add_parser('sync', help="Синхронизация с другими устройствами")
+    sync.add_argument('--folder', help="Общая папка синхронизации (по умолчанию из настроек)")
+    sync.set_defaults(handler=cmd_sync)
+
+    backup = commands.add_parser('backup', help="Резервная копия базы и восстановление")
+    backup.add_argument('--folder', help="Папка копий (по умолчанию из настроек)")
+    backup.add_argument('--keep', type=int, help="Сколько поколений хранить")
+    backup.add_argument('--list', action='store_true', help="Показать копии")
+    backup.add_argument('--restore', metavar='PATH',
+                        help="Восстановить базу из копии (latest - из последней)")
+    backup.set_defaults(handler=cmd_backup)
+
+    serve = commands.add_parser('serve', help="Запустить общий сервер для команды")
+    serve.add_argument('--host', default='127.0.0.1', help="Адрес для подключения клиентов")
+    serve.add_argument('--port', type=int, default=8766, help="Порт")
+    serve.set_defaults(handler=None)
+    return parser
+
+
+def run(argv) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 1
+    if args.command == 'serve':
+        return cmd_serve(args)
+    if args.server:
+        repository = RemoteRepository(*parse_address(args.server), token=args.token)
+    else:
+        repository = Database(args.db)
+    with repository as db:
+        return args.handler(db, args)
@@ -1,16 +1,181 @@
+import json
+import logging
 import os
 import sqlite3
-from typing import List
-from datetime import datetime
-from models import Project, Task, TimeRecord
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional
+from datetime import date, datetime, timedelta
+from intervals import IntervalIndex, OverlapError
+from models import Budget, Project, Rate, RecordQuery, Tag, Task, TimeRecord
+from tags import TagIndex
+from repository import Repository, ConnectionPool
 
+logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self, db_path='db/timer.db'):
+# Таблицы сущностей журнала изменений
+ENTITY_TABLES = {'project': 'projects', 'task': 'tasks', 'record': 'time_records'}
+# Журнал отмены: не больше UNDO_DEPTH операций и UNDO_MAX_BYTES данных
+# (самая свежая операция хранится в любом случае)
+UNDO_DEPTH = 50
+UNDO_MAX_BYTES = 4 * 1024 * 1024
+# Сортировки query_records: фиксированный текст ORDER BY, значения не из ввода
+RECORD_ORDERS = {
+    'start_desc': 'tr.start_time DESC, tr.id DESC',
+    'start_asc': 'tr.start_time, tr.id',
+    'duration_desc': 'tr.duration_seconds DESC, tr.id DESC',
+    'project': 'p.name, t.name, tr.start_time DESC',
+}
+# Сколько страниц результатов query_records хранится в памяти
+QUERY_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=None)
+def record_query_sql(project: bool, task: bool, productive: bool, order: str,
+                     paged: bool) -> str:
+    """
+    Текст запроса записей для набора заданных фильтров. Он зависит только от
+    того, какие фильтры заданы, но не от их значений: одинаковые фильтры
+    дают ту же строку, и sqlite3 берёт готовый запрос из кэша соединения
+    вместо повторного разбора.
+    """
+    where = ['tr.start_time >= ?', 'tr.start_time < ?']
+    if project:
+        where.append('t.project_id = ?')
+    if task:
+        where.append('tr.task_id = ?')
+    if productive:
+        where.append('tr.was_productive = ?')
+    sql = ('SELECT tr.id, p.name, t.name, tr.duration_seconds, tr.start_time, tr.was_productive '
+           'FROM time_records tr JOIN tasks t ON tr.task_id = t.id '
+           'JOIN projects p ON t.project_id = p.id '
+           f'WHERE {" AND ".join(where)} ORDER BY {RECORD_ORDERS[order]}')
+    if paged:
+        sql += ' LIMIT ? OFFSET ?'
+    return sql
+
+
+def open_database(settings, db_path: str = 'db/timer.db') -> 'Database':
+    """База в режиме из настроек: файл или память со снимками в файл"""
+    return Database(db_path, in_memory=settings.db_in_memory,
+                    snapshot_interval=settings.db_snapshot_seconds)
+
+
+class Database(Repository):
+    def __init__(self, db_path='db/timer.db', readers: int = 4, in_memory: bool = False,
+                 snapshot_interval: float = 0):
+        """
+        in_memory: база работает в памяти - загружается из db_path при открытии
+        и сохраняется в него снимками (snapshot) раз в snapshot_interval секунд
+        (0 - только при закрытии) и в close(). Запись не ждёт диска, но
+        изменения после последнего снимка при сбое теряются.
+        """
         # Создаем папку db, если ее нет
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = sqlite3.connect(db_path)
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.in_memory = in_memory
+        # Запись идёт через одно соединение (self.conn), чтение - через пул
+        # (в памяти пула нет - одно соединение на всё)
+        self.pool = ConnectionPool(':memory:' if in_memory else db_path, readers)
+        self.conn = self.pool.writer
+        # Число изменений строк на момент последнего снимка (None - снимка ещё нет)
+        self._snapshot_changes = None
+        self._snapshot_stamp = None
+        self._snapshot_stop = threading.Event()
+        self._snapshot_listeners: List[Callable[[int], None]] = []
+        if in_memory and os.path.exists(db_path):
+            self._load(db_path)
+            self._snapshot_changes = self.conn.total_changes
+        self._batch_depth = 0
+        self._savepoint = 0
+        self._listeners: List[Callable[[str, object], None]] = []
+        # Версия таблицы time_records: растёт на каждую вставку/удаление записи
+        self.records_version = 0
+        # Индексы в памяти: интервалы записей (строится при первой проверке
+        # пересечений) и битовые карты меток; сбрасываются при изменении
+        # базы другим соединением (PRAGMA data_version)
+        self._intervals: Optional[IntervalIndex] = None
+        self._tags: Optional[TagIndex] = None
+        # Страницы query_records по фильтру; очищаются после каждой транзакции записи
+        self._pages: OrderedDict = OrderedDict()
+        self._pages_lock = threading.Lock()
+        self._pages_generation = 0
+        self._data_version = None
         self._create_tables()
+        self._init_sync()
+        if in_memory and snapshot_interval > 0:
+            threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,),
+                             name='db-snapshot', daemon=True).start()
+
+    def _load(self, path: str):
+        disk = sqlite3.connect(path)
+        try:
+            disk.backup(self.conn)
+        finally:
+            disk.close()
+        self._snapshot_stamp = self._file_stamp()
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self) -> bool:
+        """
+        Записывает базу из памяти в db_path через backup API (в транзакции
+        файла - оборванный снимок не портит прежний). Пропускается, если
+        со времени прошлого снимка строки не менялись. True - снимок записан.
+        """
+        if not self.in_memory:
+            return False
+        with self.pool.writing():
+            changes = self.conn.total_changes
+            written = changes != self._snapshot_changes
+            if written:
+                self._write_snapshot()
+                self._snapshot_changes = changes
+                self._snapshot_stamp = self._file_stamp()
+        if written:
+            logger.debug("Снимок базы из памяти записан в %s", self.db_path)
+        self._notify_snapshot(changes)
+        return written
+
+    def _write_snapshot(self):
+        if self._snapshot_stamp is not None and self._file_stamp() != self._snapshot_stamp:
+            logger.warning("Файл %s изменён другим процессом - снимок из памяти "
+                           "заменит эти изменения", self.db_path)
+        disk = sqlite3.connect(self.db_path)
+        try:
+            self.conn.backup(disk)
+        finally:
+            disk.close()
+
+    def add_snapshot_listener(self, callback: Callable[[int], None]):
+        """
+        callback(changes) после снимка базы в памяти: на диске есть все
+        изменения, пока total_changes соединения записи не превышал changes.
+        Вызывается и тогда, когда снимок пропущен, потому что файл уже
+        актуален; вызов может прийти из потока снимков.
+        """
+        self._snapshot_listeners.append(callback)
+
+    def _notify_snapshot(self, changes: int):
+        for callback in list(self._snapshot_listeners):
+            callback(changes)
+
+    def _snapshot_loop(self, interval: float):
+        while not self._snapshot_stop.wait(interval):
+            try:
+                self.snapshot()
+            except sqlite3.Error:
+                logger.exception("Не удалось записать снимок базы в %s", self.db_path)
 
     def _create_tables(self):
         cursor = self.conn.cursor()
@@ -39,72 +204,500 @@ class Database:
             was_productive BOOLEAN NOT NULL,
             FOREIGN KEY (task_id) REFERENCES tasks(id)
         )''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_records_start '
+                       'ON time_records(start_time)')
+
+        # Фазы планов работы (работа и перерывы)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS phases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            phase TEXT NOT NULL,
+            start_time DATETIME NOT NULL,
+            end_time DATETIME NOT NULL,
+            duration_seconds INTEGER NOT NULL,
+            FOREIGN KEY (task_id) REFERENCES tasks(id)
+        )''')
+
+        # Текущее состояние запущенных планов (JSON)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_state (
+            task_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL
+        )''')
+
+        # Журнал изменений для синхронизации между устройствами (см. sync.py).
+        # counter - порядковый номер изменения на устройстве device_id,
+        # lamport - логические часы Лэмпорта для разрешения конфликтов
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            counter INTEGER NOT NULL,
+            lamport INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            uid TEXT NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            UNIQUE(device_id, counter)
+        )''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_changes_uid ON changes(uid, lamport)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_changes_lamport ON changes(lamport)')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )''')
+
+        # Позиция чтения изменений каждого из других устройств
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            device_id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL
+        )''')
+
+        # Одинаковые проекты/задачи, созданные на разных устройствах,
+        # сливаются в одну строку; uid проигравшей стороны ведёт сюда
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_aliases (
+            uid TEXT PRIMARY KEY,
+            target_uid TEXT NOT NULL
+        )''')
+
+        # Журнал отмены удалений и правок: items - JSON-список
+        # [сущность, uid, строка до, строка после] (None - строки нет).
+        # undone = 1 - операция отменена и её можно повторить
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS undo_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT NOT NULL,
+            created TEXT NOT NULL,
+            undone INTEGER NOT NULL DEFAULT 0,
+            items TEXT NOT NULL
+        )''')
+
+        # Метки записей времени (связь многие-ко-многим)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS record_tags (
+            record_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (record_id, tag_id),
+            FOREIGN KEY (record_id) REFERENCES time_records(id),
+            FOREIGN KEY (tag_id) REFERENCES tags(id)
+        ) WITHOUT ROWID''')
+        # Записи удаляются многими путями (каскад, синхронизация, отмена) -
+        # связи с метками чистит сама база
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS record_tags_on_record_delete
+        AFTER DELETE ON time_records BEGIN
+            DELETE FROM record_tags WHERE record_id = OLD.id;
+        END''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS record_tags_on_tag_delete
+        AFTER DELETE ON tags BEGIN
+            DELETE FROM record_tags WHERE tag_id = OLD.id;
+        END''')
+
+        # Бюджеты времени проекта (task_id NULL) или задачи (см. budgets.py).
+        # Бюджет удалённого проекта или задачи не показывается, но остаётся:
+        # отмена удаления возвращает и его
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            task_id INTEGER,
+            period TEXT NOT NULL,
+            seconds INTEGER NOT NULL
+        )''')
+
+        # Почасовые ставки (см. billing.py): ставка задачи важнее ставки
+        # проекта и действует с effective_from до следующей ставки той же
+        # задачи. Сумма хранится текстом, чтобы не терять точность Decimal
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            task_id INTEGER,
+            effective_from DATE NOT NULL,
+            hourly_rate TEXT NOT NULL
+        )''')
         self.conn.commit()
 
-    # Методы для работы с проектами
-    def add_project(self, name: str) -> Project:
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция записи. Внутри batch() вместо отдельной транзакции
+        используется точка сохранения: ошибка откатывает только эту операцию.
+        Индексы в памяти обновляются внутри транзакции, поэтому при откате
+        они сбрасываются и будут построены заново.
+        """
+        with self.pool.writing():
+            if not self._batch_depth:
+                try:
+                    with self.conn:
+                        self._begin()
+                        yield
+                except OverlapError:
+                    raise  # ничего не было записано
+                except Exception:
+                    self._reset_indexes()
+                    raise
+                finally:
+                    self.clear_query_cache()
+                return
+            self._savepoint += 1
+            name = f"sp{self._savepoint}"
+            self.conn.execute(f'SAVEPOINT {name}')
+            try:
+                yield
+            except Exception as e:
+                self.conn.execute(f'ROLLBACK TO {name}')
+                self.conn.execute(f'RELEASE {name}')
+                if not isinstance(e, OverlapError):
+                    self._reset_indexes()
+                raise
+            self.conn.execute(f'RELEASE {name}')
+
+    @contextmanager
+    def batch(self):
+        """Объединяет несколько операций записи в одну транзакцию"""
+        with self.pool.writing():
+            if self._batch_depth:
+                yield
+                return
+            self._begin()
+            self._batch_depth += 1
+            try:
+                with self.conn:
+                    yield
+            except Exception:
+                # Пачка откатилась целиком - индексы могли получить её записи
+                self._reset_indexes()
+                raise
+            finally:
+                self._batch_depth -= 1
+                self.clear_query_cache()
+
+    def _begin(self):
+        """
+        Сразу берёт блокировку записи: номера в журнале изменений читаются
+        внутри транзакции, и другой процесс с той же базой (CLI, API,
+        сервер команды) не должен вклиниться между чтением и вставкой
+        """
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+
+    def _init_sync(self):
+        """Глобальные uid строк, идентификатор устройства и счётчики журнала"""
         cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO projects (name) VALUES (?)', (name,))
+        for table in ('projects', 'tasks', 'time_records'):
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+            if 'uid' not in columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN uid TEXT')
+            cursor.execute(f'UPDATE {table} SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL')
+            cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uid ON {table}(uid)')
+
+        row = cursor.execute("SELECT value FROM sync_meta WHERE key = 'device_id'").fetchone()
+        self.device_id = row[0] if row else uuid.uuid4().hex
         self.conn.commit()
-        return Project(id=cursor.lastrowid, name=name)
+
+        if not row:
+            # Первый запуск с журналом: уже существующие данные тоже
+            # должны попасть на другие устройства
+            with self.transaction():
+                cursor.execute("INSERT INTO sync_meta (key, value) VALUES ('device_id', ?)",
+                               (self.device_id,))
+                for uid, name in cursor.execute('SELECT uid, name FROM projects').fetchall():
+                    self._log_change(cursor, 'project', uid, 'upsert', {'name': name})
+                for uid, project_id, name in cursor.execute(
+                        'SELECT uid, project_id, name FROM tasks').fetchall():
+                    self._log_change(cursor, 'task', uid, 'upsert', {
+                        'project_uid': self._uid_of('projects', project_id), 'name': name})
+                for row in cursor.execute('''
+                SELECT uid, task_id, start_time, end_time, duration_seconds, was_productive
+                FROM time_records''').fetchall():
+                    self._log_record(cursor, *row)
+
+    @staticmethod
+    def _new_uid() -> str:
+        return uuid.uuid4().hex
+
+    def _uid_of(self, table: str, row_id: int) -> Optional[str]:
+        row = self.conn.execute(f'SELECT uid FROM {table} WHERE id = ?', (row_id,)).fetchone()
+        return row[0] if row else None
+
+    def _last_change(self, cursor) -> tuple:
+        """
+        Последние номер изменения этого устройства и lamport в журнале. Не
+        кэшируются: в ту же базу пишут и другие процессы. После restore()
+        журнал может оказаться старше уже отправленного, поэтому учитываются
+        и сохранённые там нижние границы
+        """
+        return cursor.execute('''
+        SELECT MAX(COALESCE((SELECT MAX(counter) FROM changes WHERE device_id = ?), 0),
+                   COALESCE((SELECT CAST(value AS INTEGER) FROM sync_meta
+                             WHERE key = 'counter_floor'), 0)),
+               MAX(COALESCE((SELECT MAX(lamport) FROM changes), 0),
+                   COALESCE((SELECT CAST(value AS INTEGER) FROM sync_meta
+                             WHERE key = 'lamport_floor'), 0))''',
+                              (self.device_id,)).fetchone()
+
+    def _log_change(self, cursor, entity: str, uid: str, op: str, payload: dict):
+        """Записывает локальное изменение в журнал (в текущей транзакции)"""
+        counter, lamport = self._last_change(cursor)
+        cursor.execute('''
+        INSERT INTO changes (device_id, counter, lamport, entity, uid, op, payload)
+        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                       (self.device_id, counter + 1, lamport + 1, entity, uid, op,
+                        json.dumps(payload, ensure_ascii=False)))
+
+    def _log_record(self, cursor, uid: str, task_id: int, start_time: str, end_time: str,
+                    duration_seconds: int, was_productive: bool, tags: List[str] = None):
+        """Без tags метки записи на других устройствах не меняются"""
+        payload = {
+            'task_uid': self._uid_of('tasks', task_id),
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration_seconds': duration_seconds,
+            'was_productive': bool(was_productive)
+        }
+        if tags is not None:
+            payload['tags'] = tags
+        self._log_change(cursor, 'record', uid, 'upsert', payload)
+
+    # Подписка на изменения записей времени
+    def add_listener(self, callback: Callable[[str, object], None]):
+        """
+        Подписывает callback на изменения записей времени.
+        Вызывается после коммита как callback('record_added', TimeRecord),
+        callback('records_added', [TimeRecord, ...]) для пакетной вставки,
+        callback('record_deleted', record_id) или callback('records_changed', None),
+        если записи изменились массово (каскадное удаление, синхронизация)
+        или запись была отредактирована. Изменения проектов, задач и меток -
+        callback('catalog_changed', 'project' | 'task' | 'tag' | 'all').
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, object], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, event: str, payload):
+        for callback in list(self._listeners):
+            callback(event, payload)
+
+    # Методы для работы с проектами
+    def add_project(self, name: str) -> Project:
+        uid = self._new_uid()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO projects (name, uid) VALUES (?, ?)', (name, uid))
+            project_id = cursor.lastrowid
+            self._log_change(cursor, 'project', uid, 'upsert', {'name': name})
+        self._notify('catalog_changed', 'project')
+        return Project(id=project_id, name=name)
 
     def get_projects(self) -> List[Project]:
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name FROM projects')
-        return [Project(id=row[0], name=row[1]) for row in cursor.fetchall()]
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name FROM projects')
+            return [Project(id=row[0], name=row[1]) for row in cursor.fetchall()]
 
     def delete_project(self, project_id: int) -> bool:
+        """Удаляет проект вместе с его задачами и их записями времени"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
-            self.conn.commit()
-            return cursor.rowcount > 0
+            with self.transaction():
+                cursor = self.conn.cursor()
+                task_ids = [row[0] for row in cursor.execute(
+                    'SELECT id FROM tasks WHERE project_id = ?', (project_id,))]
+                undo_items = [self._undo_item(cursor, 'project', project_id)]
+                for task_id in task_ids:
+                    undo_items += self._task_undo_items(cursor, task_id)
+                deleted_records = sum(self._delete_task_rows(cursor, task_id) for task_id in task_ids)
+                uid = self._uid_of('projects', project_id)
+                cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    self._log_change(cursor, 'project', uid, 'delete', {})
+                    self._journal(cursor, f"Удаление проекта «{undo_items[0][2]['name']}»",
+                                  undo_items)
         except sqlite3.IntegrityError:
             return False
+        if deleted_records:
+            self._reset_indexes()
+            self._records_changed()
+            self._notify('records_changed', None)
+        if deleted:
+            self._notify('catalog_changed', 'project')
+        return deleted
 
     # Методы для работы с задачами
     def add_task(self, project_id: int, name: str) -> Task:
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO tasks (project_id, name) VALUES (?, ?)', (project_id, name))
-        self.conn.commit()
-        return Task(id=cursor.lastrowid, project_id=project_id, name=name)
+        uid = self._new_uid()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO tasks (project_id, name, uid) VALUES (?, ?, ?)',
+                           (project_id, name, uid))
+            task_id = cursor.lastrowid
+            self._log_change(cursor, 'task', uid, 'upsert', {
+                'project_uid': self._uid_of('projects', project_id), 'name': name})
+        self._notify('catalog_changed', 'task')
+        return Task(id=task_id, project_id=project_id, name=name)
 
     def get_tasks_for_project(self, project_id: int) -> List[Task]:
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, project_id, name FROM tasks WHERE project_id = ?', (project_id,))
-        return [Task(id=row[0], project_id=row[1], name=row[2]) for row in cursor.fetchall()]
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, project_id, name FROM tasks WHERE project_id = ?', (project_id,))
+            return [Task(id=row[0], project_id=row[1], name=row[2]) for row in cursor.fetchall()]
+
+    def get_task(self, task_id: int) -> Optional[Task]:
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, project_id, name FROM tasks WHERE id = ?', (task_id,))
+            row = cursor.fetchone()
+            return Task(id=row[0], project_id=row[1], name=row[2]) if row else None
+
+    def find_task(self, project_name: str, task_name: str) -> Optional[Task]:
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT t.id, t.project_id, t.name FROM tasks t
+            JOIN projects p ON t.project_id = p.id
+            WHERE p.name = ? AND t.name = ?''', (project_name, task_name))
+            row = cursor.fetchone()
+            return Task(id=row[0], project_id=row[1], name=row[2]) if row else None
 
     def delete_task(self, task_id: int) -> bool:
+        """Удаляет задачу вместе с её записями времени"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-            self.conn.commit()
-            return cursor.rowcount > 0
+            with self.transaction():
+                cursor = self.conn.cursor()
+                exists = cursor.execute('SELECT 1 FROM tasks WHERE id = ?', (task_id,)).fetchone()
+                if exists:
+                    undo_items = self._task_undo_items(cursor, task_id)
+                    self._journal(cursor, f"Удаление задачи «{undo_items[0][2]['name']}»",
+                                  undo_items)
+                deleted_records = self._delete_task_rows(cursor, task_id)
         except sqlite3.IntegrityError:
             return False
+        if deleted_records:
+            self._reset_indexes()
+            self._records_changed()
+            self._notify('records_changed', None)
+        if exists:
+            self._notify('catalog_changed', 'task')
+        return exists is not None
+
+    def _delete_task_rows(self, cursor, task_id: int) -> int:
+        """Удаляет задачу и её записи с записью в журнал; возвращает число записей"""
+        record_uids = [row[0] for row in cursor.execute(
+            'SELECT uid FROM time_records WHERE task_id = ?', (task_id,))]
+        for uid in record_uids:
+            self._log_change(cursor, 'record', uid, 'delete', {})
+        cursor.execute('DELETE FROM time_records WHERE task_id = ?', (task_id,))
+        uid = self._uid_of('tasks', task_id)
+        cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+        if cursor.rowcount > 0:
+            self._log_change(cursor, 'task', uid, 'delete', {})
+        return len(record_uids)
 
     # Методы для работы с записями времени
     def add_time_record(self, task_id: int, start_time: datetime, end_time: datetime,
                         duration_seconds: int, was_productive: bool) -> TimeRecord:
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        INSERT INTO time_records 
-        (task_id, start_time, end_time, duration_seconds, was_productive) 
-        VALUES (?, ?, ?, ?, ?)''',
-                       (task_id,
-                        start_time.strftime("%Y-%m-%d %H:%M:%S"),  # Форматируем дату
-                        end_time.strftime("%Y-%m-%d %H:%M:%S"),  # перед сохранением
-                        duration_seconds,
-                        was_productive))
-        self.conn.commit()
-        return TimeRecord(
-            id=cursor.lastrowid,
+        uid = self._new_uid()
+        start_str = start_time.strftime("%Y-%m-%d %H:%M:%S")  # Форматируем дату
+        end_str = end_time.strftime("%Y-%m-%d %H:%M:%S")  # перед сохранением
+        with self.transaction():
+            self._check_overlap(task_id, start_str, end_str)
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            INSERT INTO time_records 
+            (task_id, start_time, end_time, duration_seconds, was_productive, uid) 
+            VALUES (?, ?, ?, ?, ?, ?)''',
+                           (task_id, start_str, end_str, duration_seconds, was_productive, uid))
+            record_id = cursor.lastrowid
+            self._log_record(cursor, uid, task_id, start_str, end_str,
+                             duration_seconds, was_productive)
+            self._index_record(record_id, task_id, start_str, end_str)
+        self._records_changed()
+        record = TimeRecord(
+            id=record_id,
             task_id=task_id,
             start_time=start_time,
             end_time=end_time,
             duration_seconds=duration_seconds,
             was_productive=was_productive
         )
+        self._notify('record_added', record)
+        return record
+
+    def add_time_records(self, records: List[tuple]) -> List[TimeRecord]:
+        """
+        Добавляет несколько записей времени одной транзакцией: либо
+        сохраняются все, либо ни одной.
+
+        Args:
+            records: кортежи (task_id, start_time, end_time, duration_seconds, was_productive)
+                и, необязательно, uid записи шестым элементом (None - новый uid)
+                и список id меток седьмым. Записи с уже существующим uid
+                пропускаются - повторная вставка безопасна; из записей
+                с одинаковым uid внутри пачки сохраняется первая.
+        """
+        saved = []
+        with self.transaction():
+            cursor = self.conn.cursor()
+            rows = []
+            uids = set()
+            for record in records:
+                task_id, start_time, end_time, duration_seconds, was_productive = record[:5]
+                uid = record[5] if len(record) > 5 and record[5] else self._new_uid()
+                tag_ids = record[6] if len(record) > 6 else None
+                if uid in uids or len(record) > 5 and cursor.execute(
+                        'SELECT 1 FROM time_records WHERE uid = ?', (uid,)).fetchone():
+                    continue
+                uids.add(uid)
+                rows.append((start_time, end_time, uid, tag_ids,
+                             (task_id, start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                              end_time.strftime("%Y-%m-%d %H:%M:%S"), duration_seconds,
+                              was_productive)))
+
+            # Сначала проверка всех записей (и между собой), затем вставка
+            batch = IntervalIndex()
+            for number, (_, _, _, _, (task_id, start_str, end_str, _, _)) in enumerate(rows):
+                self._check_overlap(task_id, start_str, end_str, batch=batch)
+                batch.add(-number - 1, task_id, datetime.fromisoformat(start_str),
+                          datetime.fromisoformat(end_str))
+
+            for start_time, end_time, uid, tag_ids, row in rows:
+                cursor.execute('''
+                INSERT INTO time_records 
+                (task_id, start_time, end_time, duration_seconds, was_productive, uid) 
+                VALUES (?, ?, ?, ?, ?, ?)''', row + (uid,))
+                record_id = cursor.lastrowid
+                tags = None
+                if tag_ids:
+                    self._write_record_tags(cursor, record_id, tag_ids)
+                    tags = self._record_tag_names(cursor, record_id)
+                self._log_record(cursor, uid, *row, tags=tags)
+                self._index_record(record_id, row[0], row[1], row[2])
+                saved.append(TimeRecord(
+                    id=record_id,
+                    task_id=row[0],
+                    start_time=start_time,
+                    end_time=end_time,
+                    duration_seconds=row[3],
+                    was_productive=row[4]
+                ))
+        if saved:
+            self._records_changed(len(saved))
+            self._notify('records_added', saved)
+        return saved
 
     def get_time_records_for_task(self, task_id: int) -> List[TimeRecord]:
         """
@@ -117,102 +710,908 @@ class Database:
             Список объектов TimeRecord для указанной задачи,
             отсортированный по времени начала (новые сначала)
         """
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT 
-            tr.id,
-            tr.task_id,
-            tr.start_time,
-            tr.end_time,
-            tr.duration_seconds,
-            tr.was_productive,
-            p.name as project_name,
-            t.name as task_name
-        FROM time_records tr
-        JOIN tasks t ON tr.task_id = t.id
-        JOIN projects p ON t.project_id = p.id
-        WHERE tr.task_id = ?
-        ORDER BY tr.start_time DESC
-        ''', (task_id,))
-
-        records = []
-        for row in cursor.fetchall():
-            record = TimeRecord(
-                id=row[0],
-                task_id=row[1],
-                start_time=datetime.fromisoformat(row[2]),
-                end_time=datetime.fromisoformat(row[3]),
-                duration_seconds=row[4],
-                was_productive=bool(row[5]),
-                project_name=row[6],
-                task_name=row[7]
-            )
-            records.append(record)
-
-        return records
-
-    def get_all_time_records(self) -> List[TimeRecord]:
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT 
-            tr.id, 
-            tr.task_id, 
-            tr.start_time, 
-            tr.end_time, 
-            tr.duration_seconds, 
-            tr.was_productive,
-            p.name as project_name,
-            t.name as task_name
-        FROM time_records tr
-        JOIN tasks t ON tr.task_id = t.id
-        JOIN projects p ON t.project_id = p.id
-        ORDER BY tr.start_time DESC
-        ''')
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT 
+                tr.id,
+                tr.task_id,
+                tr.start_time,
+                tr.end_time,
+                tr.duration_seconds,
+                tr.was_productive,
+                p.name as project_name,
+                t.name as task_name
+            FROM time_records tr
+            JOIN tasks t ON tr.task_id = t.id
+            JOIN projects p ON t.project_id = p.id
+            WHERE tr.task_id = ?
+            ORDER BY tr.start_time DESC
+            ''', (task_id,))
 
-        records = []
-        for row in cursor.fetchall():
-            records.append(
-                TimeRecord(
+            records = []
+            for row in cursor.fetchall():
+                record = TimeRecord(
                     id=row[0],
                     task_id=row[1],
                     start_time=datetime.fromisoformat(row[2]),
                     end_time=datetime.fromisoformat(row[3]),
                     duration_seconds=row[4],
                     was_productive=bool(row[5]),
-                    # Добавляем дополнительную информацию для удобства
                     project_name=row[6],
                     task_name=row[7]
                 )
-            )
-        return records
+                records.append(record)
+
+            return records
+
+    def get_all_time_records(self) -> List[TimeRecord]:
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT 
+                tr.id, 
+                tr.task_id, 
+                tr.start_time, 
+                tr.end_time, 
+                tr.duration_seconds, 
+                tr.was_productive,
+                p.name as project_name,
+                t.name as task_name
+            FROM time_records tr
+            JOIN tasks t ON tr.task_id = t.id
+            JOIN projects p ON t.project_id = p.id
+            ORDER BY tr.start_time DESC
+            ''')
+
+            records = []
+            for row in cursor.fetchall():
+                records.append(
+                    TimeRecord(
+                        id=row[0],
+                        task_id=row[1],
+                        start_time=datetime.fromisoformat(row[2]),
+                        end_time=datetime.fromisoformat(row[3]),
+                        duration_seconds=row[4],
+                        was_productive=bool(row[5]),
+                        # Добавляем дополнительную информацию для удобства
+                        project_name=row[6],
+                        task_name=row[7]
+                    )
+                )
+            return records
+
+    def get_time_record_columns(self) -> List[tuple]:
+        """
+        Получает все записи времени одним запросом в виде "сырых" строк
+        для аналитики: (id, task_id, project_id, начало, конец, длительность,
+        продуктивность). Время возвращается в секундах от эпохи.
+        """
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT 
+                tr.id,
+                tr.task_id,
+                t.project_id,
+                CAST(strftime('%s', tr.start_time) AS INTEGER),
+                CAST(strftime('%s', tr.end_time) AS INTEGER),
+                tr.duration_seconds,
+                tr.was_productive
+            FROM time_records tr
+            JOIN tasks t ON tr.task_id = t.id
+            ORDER BY tr.start_time
+            ''')
+            return cursor.fetchall()
+
+    def query_records(self, query: RecordQuery) -> List[tuple]:
+        """
+        Записи по фильтру: (id, проект, задача, длительность, начало,
+        продуктивность). Результат запоминается по фильтру до следующей
+        транзакции записи (или изменения базы другим соединением), поэтому
+        повторные обновления таблицы с тем же фильтром не обращаются к базе.
+        """
+        if query.order not in RECORD_ORDERS:
+            raise ValueError(f"Неизвестная сортировка: {query.order}")
+        # Соединение записи не потокобезопасно - читаем версию под его блокировкой
+        with self.pool.writing() as conn:
+            key = (query, conn.execute('PRAGMA data_version').fetchone()[0])
+        with self._pages_lock:
+            rows = self._pages.get(key)
+            if rows is not None:
+                self._pages.move_to_end(key)
+                return list(rows)
+            generation = self._pages_generation
+
+        paged = query.limit is not None or query.offset > 0
+        params = [query.date_from.isoformat(), (query.date_to + timedelta(days=1)).isoformat()]
+        for value in (query.project_id, query.task_id, query.productive):
+            if value is not None:
+                params.append(value)
+        if paged:
+            params += [query.limit if query.limit is not None else -1, query.offset]
+        sql = record_query_sql(query.project_id is not None, query.task_id is not None,
+                               query.productive is not None, query.order, paged)
+        with self.pool.reader() as conn:
+            rows = tuple(conn.execute(sql, params).fetchall())
+
+        with self._pages_lock:
+            # Пока шёл запрос, запись могла завершиться - такой результат не запоминаем
+            if generation == self._pages_generation:
+                self._pages[key] = rows
+                if len(self._pages) > QUERY_CACHE_SIZE:
+                    self._pages.popitem(last=False)
+        return list(rows)
+
+    def clear_query_cache(self):
+        with self._pages_lock:
+            self._pages.clear()
+            self._pages_generation += 1
+
+    def get_change_counter(self) -> tuple:
+        """
+        Счётчик изменений записей времени: (PRAGMA data_version, records_version).
+        Первое число меняется при записи в БД через другие соединения, второе -
+        при каждом изменении time_records через этот объект.
+        Используется как ключ для кэшей.
+        """
+        with self.pool.writing() as conn:
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        return data_version, self.records_version
+
+    def _records_changed(self, count: int = 1):
+        self.records_version += count
+
+    # Пересечения и промежутки между записями (см. intervals.py)
+    def _reset_indexes(self):
+        self._intervals = None
+        self._tags = None
+
+    def _check_data_version(self):
+        """Сбрасывает индексы в памяти, если базу изменило другое соединение"""
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._reset_indexes()
+            self._data_version = version
+
+    def _interval_index(self) -> IntervalIndex:
+        """Индекс интервалов всех записей. Вызывается под блокировкой записи"""
+        self._check_data_version()
+        if self._intervals is None:
+            rows = self.conn.execute(
+                'SELECT start_time, end_time, id, task_id FROM time_records').fetchall()
+            self._intervals = IntervalIndex(
+                (datetime.fromisoformat(start), datetime.fromisoformat(end), record_id, task_id)
+                for start, end, record_id, task_id in rows)
+        return self._intervals
+
+    def _index_record(self, record_id: int, task_id: int, start_str: str, end_str: str):
+        if self._intervals is not None:
+            self._intervals.add(record_id, task_id, datetime.fromisoformat(start_str),
+                                datetime.fromisoformat(end_str))
+
+    def _check_overlap(self, task_id: int, start_str: str, end_str: str,
+                       exclude_id: int = None, batch: IntervalIndex = None):
+        """
+        Не даёт сохранить запись, пересекающую другую запись той же задачи.
+        Записи разных задач могут пересекаться: задачи идут параллельно.
+        """
+        start = datetime.fromisoformat(start_str)
+        end = datetime.fromisoformat(end_str)
+        if end < start:
+            raise ValueError("Конец записи раньше её начала")
+        conflicts = self._interval_index().overlapping(start, end, task_id, exclude_id)
+        if batch is not None:
+            conflicts += batch.overlapping(start, end, task_id)
+        if conflicts:
+            raise OverlapError(conflicts)
+
+    def find_overlaps(self, start_time: datetime, end_time: datetime, task_id: int = None,
+                      exclude_id: int = None) -> List[tuple]:
+        """
+        Записи, пересекающие [start_time, end_time): кортежи
+        (начало, конец, id записи, id задачи). Без task_id - записи всех задач.
+        """
+        with self.pool.writing():
+            return self._interval_index().overlapping(start_time.replace(microsecond=0),
+                                                      end_time.replace(microsecond=0),
+                                                      task_id, exclude_id)
+
+    def get_gaps(self, start_time: datetime, end_time: datetime,
+                 min_seconds: int = 0) -> List[tuple]:
+        """Промежутки (начало, конец) внутри периода, когда ни одна задача не записана"""
+        with self.pool.writing():
+            return self._interval_index().gaps(start_time, end_time, timedelta(seconds=min_seconds))
+
+    def get_time_record(self, record_id: int) -> Optional[TimeRecord]:
+        with self.pool.reader() as conn:
+            row = conn.execute('''
+            SELECT tr.id, tr.task_id, tr.start_time, tr.end_time, tr.duration_seconds,
+                   tr.was_productive, p.name, t.name
+            FROM time_records tr
+            JOIN tasks t ON tr.task_id = t.id
+            JOIN projects p ON t.project_id = p.id
+            WHERE tr.id = ?''', (record_id,)).fetchone()
+        if not row:
+            return None
+        return TimeRecord(
+            id=row[0],
+            task_id=row[1],
+            start_time=datetime.fromisoformat(row[2]),
+            end_time=datetime.fromisoformat(row[3]),
+            duration_seconds=row[4],
+            was_productive=bool(row[5]),
+            project_name=row[6],
+            task_name=row[7]
+        )
+
+    def update_time_record(self, record_id: int, task_id: int, start_time: datetime,
+                           end_time: datetime, duration_seconds: int, was_productive: bool,
+                           tag_ids: Optional[List[int]] = None) -> bool:
+        """
+        Изменяет запись времени. Новое время проверяется на пересечение
+        с остальными записями задачи (OverlapError). С tag_ids метки
+        заменяются в той же транзакции - правка отменяется одним шагом.
+        """
+        start_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
+        end_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
+        with self.transaction():
+            self._check_overlap(task_id, start_str, end_str, exclude_id=record_id)
+            cursor = self.conn.cursor()
+            before = self._undo_item(cursor, 'record', record_id)
+            cursor.execute('''
+            UPDATE time_records SET task_id = ?, start_time = ?, end_time = ?,
+            duration_seconds = ?, was_productive = ? WHERE id = ?''',
+                           (task_id, start_str, end_str, duration_seconds, was_productive, record_id))
+            updated = cursor.rowcount > 0
+            if updated:
+                tags = None
+                if tag_ids is not None:
+                    self._write_record_tags(cursor, record_id, tag_ids)
+                    tags = self._record_tag_names(cursor, record_id)
+                self._log_record(cursor, self._uid_of('time_records', record_id), task_id,
+                                 start_str, end_str, duration_seconds, was_productive, tags=tags)
+                self._index_record(record_id, task_id, start_str, end_str)
+                after = self._undo_item(cursor, 'record', record_id)
+                self._journal(cursor, "Изменение записи", [before[:3] + after[2:3]])
+        if updated:
+            self._records_changed()
+            self._notify('records_changed', None)
+        return updated
 
     def delete_time_record(self, record_id: int) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM time_records WHERE id = ?', (record_id,))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            uid = self._uid_of('time_records', record_id)
+            undo_item = self._undo_item(cursor, 'record', record_id)
+            cursor.execute('DELETE FROM time_records WHERE id = ?', (record_id,))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._log_change(cursor, 'record', uid, 'delete', {})
+                self._journal(cursor, "Удаление записи", [undo_item])
+                if self._intervals is not None:
+                    self._intervals.remove(record_id)
+                if self._tags is not None:
+                    self._tags.discard(record_id)
+        if deleted:
+            self._records_changed()
+            self._notify('record_deleted', record_id)
+        return deleted
+
+    # Метки записей времени (см. tags.py)
+    def _tag_index(self) -> TagIndex:
+        """Битовые карты меток. Вызывается под блокировкой записи"""
+        self._check_data_version()
+        if self._tags is None:
+            self._tags = TagIndex(self.conn.execute(
+                'SELECT record_id, tag_id FROM record_tags').fetchall())
+        return self._tags
+
+    def _write_record_tags(self, cursor, record_id: int, tag_ids):
+        tag_ids = sorted(set(tag_ids))
+        cursor.execute('DELETE FROM record_tags WHERE record_id = ?', (record_id,))
+        cursor.executemany('INSERT INTO record_tags (record_id, tag_id) VALUES (?, ?)',
+                           [(record_id, tag_id) for tag_id in tag_ids])
+        if self._tags is not None:
+            self._tags.set_tags(record_id, tag_ids)
+
+    def _record_tag_names(self, cursor, record_id: int) -> List[str]:
+        return [row[0] for row in cursor.execute('''
+        SELECT g.name FROM record_tags rt JOIN tags g ON rt.tag_id = g.id
+        WHERE rt.record_id = ? ORDER BY g.name''', (record_id,))]
+
+    def _set_tag_names(self, cursor, record_id: int, names: List[str]):
+        """Метки по именам (из синхронизации и журнала отмены); новые имена создаются"""
+        tag_ids = []
+        for name in names:
+            cursor.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (name,))
+            tag_ids.append(cursor.execute('SELECT id FROM tags WHERE name = ?',
+                                          (name,)).fetchone()[0])
+        self._write_record_tags(cursor, record_id, tag_ids)
+
+    def add_tag(self, name: str) -> Tag:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO tags (name) VALUES (?)', (name,))
+        self._notify('catalog_changed', 'tag')
+        return Tag(id=cursor.lastrowid, name=name)
+
+    def get_tags(self) -> List[Tag]:
+        with self.pool.reader() as conn:
+            return [Tag(id=row[0], name=row[1])
+                    for row in conn.execute('SELECT id, name FROM tags ORDER BY name')]
+
+    def delete_tag(self, tag_id: int) -> bool:
+        """Удаляет метку и снимает её со всех записей (отменяемо)"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            row = cursor.execute('SELECT name FROM tags WHERE id = ?', (tag_id,)).fetchone()
+            if row is None:
+                return False
+            record_ids = [r[0] for r in cursor.execute(
+                'SELECT record_id FROM record_tags WHERE tag_id = ?', (tag_id,)).fetchall()]
+            before = [self._undo_item(cursor, 'record', record_id) for record_id in record_ids]
+            cursor.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
+            items = []
+            for item in before:
+                after = self._undo_item(cursor, 'record', item[2]['id'])
+                self._log_change(cursor, 'record', item[1], 'upsert',
+                                 {k: v for k, v in after[2].items() if k != 'id'})
+                items.append(item[:3] + after[2:3])
+            if items:
+                self._journal(cursor, f"Удаление метки «{row[0]}»", items)
+            if self._tags is not None:
+                self._tags.drop_tag(tag_id)
+        if record_ids:
+            self._records_changed()
+            self._notify('records_changed', None)
+        self._notify('catalog_changed', 'tag')
+        return True
+
+    def set_record_tags(self, record_id: int, tag_ids: List[int]) -> bool:
+        """Заменяет метки записи; изменение можно отменить"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            before = self._undo_item(cursor, 'record', record_id)
+            if before is None:
+                return False
+            self._write_record_tags(cursor, record_id, tag_ids)
+            after = self._undo_item(cursor, 'record', record_id)
+            if after[2]['tags'] == before[2]['tags']:
+                return True
+            self._log_change(cursor, 'record', before[1], 'upsert',
+                             {k: v for k, v in after[2].items() if k != 'id'})
+            self._journal(cursor, "Изменение меток", [before[:3] + after[2:3]])
+        self._records_changed()
+        self._notify('records_changed', None)
+        return True
+
+    def get_record_tags(self, record_ids: List[int]) -> Dict[int, List[int]]:
+        """id меток для каждой из записей (по индексу в памяти)"""
+        with self.pool.writing():
+            index = self._tag_index()
+            return {record_id: index.tags_of(record_id) for record_id in record_ids}
+
+    def find_tagged_records(self, tag_ids: List[int], match_all: bool = True) -> bytes:
+        """
+        Битовая карта id записей со всеми (или любой из) метками: бит
+        record_id & 7 байта record_id >> 3 (см. tags.has_record).
+        """
+        with self.pool.writing():
+            return self._tag_index().matching(tag_ids, match_all)
+
+    # Бюджеты времени (см. budgets.py)
+    def add_budget(self, project_id: Optional[int], task_id: Optional[int], period: str,
+                   seconds: int) -> Budget:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO budgets (project_id, task_id, period, seconds) '
+                           'VALUES (?, ?, ?, ?)', (project_id, task_id, period, seconds))
+        return Budget(id=cursor.lastrowid, project_id=project_id, task_id=task_id,
+                      period=period, seconds=seconds)
+
+    def get_budgets(self) -> List[Budget]:
+        with self.pool.reader() as conn:
+            rows = conn.execute('''
+            SELECT b.id, b.project_id, b.task_id, b.period, b.seconds FROM budgets b
+            LEFT JOIN projects p ON b.project_id = p.id
+            LEFT JOIN tasks t ON b.task_id = t.id
+            WHERE p.id IS NOT NULL OR t.id IS NOT NULL
+            ORDER BY b.id''').fetchall()
+        return [Budget(id=row[0], project_id=row[1], task_id=row[2], period=row[3],
+                       seconds=row[4]) for row in rows]
+
+    def delete_budget(self, budget_id: int) -> bool:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM budgets WHERE id = ?', (budget_id,))
         return cursor.rowcount > 0
 
-    def close(self):
-        self.conn.close()
+    def get_budget_records(self) -> List[tuple]:
+        """
+        Записи задач и проектов, у которых есть бюджеты:
+        (id, id задачи, id проекта, начало, длительность)
+        """
+        with self.pool.reader() as conn:
+            return conn.execute('''
+            SELECT tr.id, tr.task_id, t.project_id, tr.start_time, tr.duration_seconds
+            FROM time_records tr JOIN tasks t ON tr.task_id = t.id
+            WHERE tr.task_id IN (SELECT task_id FROM budgets WHERE task_id IS NOT NULL)
+               OR t.project_id IN (SELECT project_id FROM budgets WHERE project_id IS NOT NULL)
+            ''').fetchall()
+
+    # Ставки и выборка записей для счетов (см. billing.py)
+    def add_rate(self, project_id: int, task_id: Optional[int], effective_from: date,
+                 hourly_rate: Decimal) -> Rate:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO rates (project_id, task_id, effective_from, hourly_rate) '
+                           'VALUES (?, ?, ?, ?)',
+                           (project_id, task_id, effective_from.isoformat(), str(hourly_rate)))
+        return Rate(id=cursor.lastrowid, project_id=project_id, task_id=task_id,
+                    effective_from=effective_from, hourly_rate=Decimal(hourly_rate))
+
+    def get_rates(self) -> List[Rate]:
+        with self.pool.reader() as conn:
+            rows = conn.execute('SELECT id, project_id, task_id, effective_from, hourly_rate '
+                                'FROM rates ORDER BY effective_from, id').fetchall()
+        return [Rate(id=row[0], project_id=row[1], task_id=row[2],
+                     effective_from=date.fromisoformat(row[3]), hourly_rate=Decimal(row[4]))
+                for row in rows]
+
+    def delete_rate(self, rate_id: int) -> bool:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM rates WHERE id = ?', (rate_id,))
+        return cursor.rowcount > 0
+
+    def iter_time_records(self, date_from: date, date_to: date, project_id: int = None,
+                          chunk_size: int = 1000) -> Iterator[tuple]:
+        """
+        Записи за период порциями по chunk_size строк, без загрузки всей
+        выборки в память: (id задачи, id проекта, начало, длительность),
+        по возрастанию начала.
+        """
+        query = '''
+        SELECT tr.task_id, t.project_id, tr.start_time, tr.duration_seconds
+        FROM time_records tr JOIN tasks t ON tr.task_id = t.id
+        WHERE tr.start_time >= ? AND tr.start_time < ?'''
+        params = [date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()]
+        if project_id:
+            query += ' AND t.project_id = ?'
+            params.append(project_id)
+        with self.pool.reader() as conn:
+            cursor = conn.execute(query + ' ORDER BY tr.start_time', params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
+
+    def iter_calendar_records(self, date_from: date, date_to: date, project_id: int = None,
+                              chunk_size: int = 1000) -> Iterator[tuple]:
+        """
+        Записи за период для календаря порциями по chunk_size строк:
+        (uid, проект, задача, начало, конец, продуктивность), по возрастанию начала.
+        """
+        query = '''
+        SELECT tr.uid, p.name, t.name, tr.start_time, tr.end_time, tr.was_productive
+        FROM time_records tr
+        JOIN tasks t ON tr.task_id = t.id
+        JOIN projects p ON t.project_id = p.id
+        WHERE tr.start_time >= ? AND tr.start_time < ?'''
+        params = [date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()]
+        if project_id:
+            query += ' AND t.project_id = ?'
+            params.append(project_id)
+        with self.pool.reader() as conn:
+            cursor = conn.execute(query + ' ORDER BY tr.start_time', params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
+
+    # Методы для работы с фазами планов
+    def add_phase(self, task_id: int, phase: str, start_time: datetime, end_time: datetime) -> int:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            INSERT INTO phases (task_id, phase, start_time, end_time, duration_seconds)
+            VALUES (?, ?, ?, ?, ?)''',
+                           (task_id,
+                            phase,
+                            start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                            end_time.strftime("%Y-%m-%d %H:%M:%S"),
+                            int((end_time - start_time).total_seconds())))
+        return cursor.lastrowid
+
+    def get_phase_totals(self, date_from: datetime, date_to: datetime) -> Dict[str, int]:
+        """Суммарное время по типам фаз за период"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT phase, SUM(duration_seconds) FROM phases
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY phase''', (date_from.isoformat(), date_to.isoformat()))
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def save_plan_state(self, task_id: int, state: dict):
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT OR REPLACE INTO plan_state (task_id, state) VALUES (?, ?)',
+                           (task_id, json.dumps(state)))
+
+    def get_plan_states(self) -> Dict[int, dict]:
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT task_id, state FROM plan_state')
+            return {row[0]: json.loads(row[1]) for row in cursor.fetchall()}
+
+    def delete_plan_state(self, task_id: int):
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM plan_state WHERE task_id = ?', (task_id,))
 
-    def __enter__(self):
-        return self
+    def close(self):
+        self._snapshot_stop.set()
+        self.snapshot()
+        self.pool.close()
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+    def restore(self, path: str):
+        """
+        Заменяет содержимое базы резервной копией (см. backup.py) через
+        backup API - открытые соединения сразу видят восстановленные данные.
+        Счётчики журнала синхронизации не уменьшаются, чтобы новые изменения
+        не повторили номера уже отправленных.
+        """
+        source = sqlite3.connect(path)
+        try:
+            with self.pool.writing():
+                counter, lamport = self._last_change(self.conn.cursor())
+                source.backup(self.conn)
+                self._create_tables()
+                self._init_sync()
+                with self.transaction():
+                    cursor = self.conn.cursor()
+                    restored_counter, restored_lamport = self._last_change(cursor)
+                    cursor.executemany(
+                        'INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)',
+                        [('counter_floor', str(max(counter, restored_counter))),
+                         ('lamport_floor', str(max(lamport, restored_lamport)))])
+                self._reset_indexes()
+                self._snapshot_changes = None  # backup API не меняет total_changes
+        finally:
+            source.close()
+            self.clear_query_cache()
+        self._records_changed()
+        self._notify('records_changed', None)
+        self._notify('catalog_changed', 'all')
 
     def update_project(self, project_id: int, new_name: str) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "UPDATE projects SET name = ? WHERE id = ?",
-            (new_name, project_id))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "UPDATE projects SET name = ? WHERE id = ?",
+                (new_name, project_id))
+            if cursor.rowcount > 0:
+                self._log_change(cursor, 'project', self._uid_of('projects', project_id),
+                                 'upsert', {'name': new_name})
+        if cursor.rowcount > 0:
+            self._notify('catalog_changed', 'project')
         return cursor.rowcount > 0
 
     def update_task(self, task_id: int, new_name: str) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "UPDATE tasks SET name = ? WHERE id = ?",
-            (new_name, task_id))
-        self.conn.commit()
-        return cursor.rowcount > 0
\ No newline at end of file
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "UPDATE tasks SET name = ? WHERE id = ?",
+                (new_name, task_id))
+            if cursor.rowcount > 0:
+                row = cursor.execute('SELECT t.uid, p.uid FROM tasks t JOIN projects p '
+                                     'ON t.project_id = p.id WHERE t.id = ?', (task_id,)).fetchone()
+                self._log_change(cursor, 'task', row[0], 'upsert',
+                                 {'project_uid': row[1], 'name': new_name})
+        if cursor.rowcount > 0:
+            self._notify('catalog_changed', 'task')
+        return cursor.rowcount > 0
+
+    # Журнал отмены: удаления и правки можно отменить и повторить
+    def _undo_item(self, cursor, entity: str, row_id: int) -> Optional[list]:
+        """[сущность, uid, текущая строка, None] - строка до удаления или правки"""
+        if entity == 'project':
+            row = cursor.execute('SELECT uid, id, name FROM projects WHERE id = ?',
+                                 (row_id,)).fetchone()
+            data = row and {'id': row[1], 'name': row[2]}
+        elif entity == 'task':
+            row = cursor.execute('''
+            SELECT t.uid, t.id, p.uid, t.name FROM tasks t JOIN projects p ON t.project_id = p.id
+            WHERE t.id = ?''', (row_id,)).fetchone()
+            data = row and {'id': row[1], 'project_uid': row[2], 'name': row[3]}
+        else:
+            row = cursor.execute('''
+            SELECT tr.uid, tr.id, t.uid, tr.start_time, tr.end_time, tr.duration_seconds,
+                   tr.was_productive
+            FROM time_records tr JOIN tasks t ON tr.task_id = t.id
+            WHERE tr.id = ?''', (row_id,)).fetchone()
+            data = row and {'id': row[1], 'task_uid': row[2], 'start_time': row[3],
+                            'end_time': row[4], 'duration_seconds': row[5],
+                            'was_productive': bool(row[6]),
+                            'tags': self._record_tag_names(cursor, row_id)}
+        return [entity, row[0], data, None] if row else None
+
+    def _task_undo_items(self, cursor, task_id: int) -> List[list]:
+        items = [self._undo_item(cursor, 'task', task_id)]
+        for (record_id,) in cursor.execute('SELECT id FROM time_records WHERE task_id = ?',
+                                           (task_id,)).fetchall():
+            items.append(self._undo_item(cursor, 'record', record_id))
+        return items
+
+    def _journal(self, cursor, label: str, items: List[list]):
+        """
+        Запоминает операцию для отмены (в её же транзакции). Новая операция
+        сбрасывает отменённые, старые записи вытесняются по числу и объёму.
+        """
+        cursor.execute('DELETE FROM undo_log WHERE undone = 1')
+        cursor.execute('INSERT INTO undo_log (label, created, items) VALUES (?, ?, ?)',
+                       (label, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        json.dumps(items, ensure_ascii=False)))
+        total = 0
+        for number, (entry_id, size) in enumerate(cursor.execute(
+                'SELECT id, length(items) FROM undo_log ORDER BY id DESC').fetchall()):
+            total += size
+            if number >= UNDO_DEPTH or (number and total > UNDO_MAX_BYTES):
+                cursor.execute('DELETE FROM undo_log WHERE id <= ?', (entry_id,))
+                break
+
+    def get_undo_state(self) -> tuple:
+        """Названия операций, которые отменит undo() и повторит redo() (или None)"""
+        with self.pool.reader() as conn:
+            undo = conn.execute('SELECT label FROM undo_log WHERE undone = 0 '
+                                'ORDER BY id DESC LIMIT 1').fetchone()
+            redo = conn.execute('SELECT label FROM undo_log WHERE undone = 1 '
+                                'ORDER BY id LIMIT 1').fetchone()
+        return (undo[0] if undo else None), (redo[0] if redo else None)
+
+    def undo(self) -> Optional[str]:
+        """Отменяет последнюю операцию одной транзакцией; возвращает её название"""
+        return self._undo_step(undo=True)
+
+    def redo(self) -> Optional[str]:
+        """Повторяет последнюю отменённую операцию"""
+        return self._undo_step(undo=False)
+
+    def _undo_step(self, undo: bool) -> Optional[str]:
+        with self.transaction():
+            cursor = self.conn.cursor()
+            if undo:
+                entry = cursor.execute('SELECT id, label, items FROM undo_log WHERE undone = 0 '
+                                       'ORDER BY id DESC LIMIT 1').fetchone()
+            else:
+                entry = cursor.execute('SELECT id, label, items FROM undo_log WHERE undone = 1 '
+                                       'ORDER BY id LIMIT 1').fetchone()
+            if entry is None:
+                return None
+            # Отмена возвращает строки "до", повтор - строки "после"
+            states = [(entity, uid, before if undo else after)
+                      for entity, uid, before, after in json.loads(entry[2])]
+            order = list(ENTITY_TABLES)
+            # Удаление - от записей к проектам, восстановление - от проектов к записям
+            deletes = sorted((s for s in states if s[2] is None), key=lambda s: -order.index(s[0]))
+            upserts = sorted((s for s in states if s[2] is not None), key=lambda s: order.index(s[0]))
+            for entity, uid, row in deletes + upserts:
+                self._restore_row(cursor, entity, uid, row)
+            cursor.execute('UPDATE undo_log SET undone = ? WHERE id = ?', (int(undo), entry[0]))
+        self._reset_indexes()
+        self._records_changed()
+        self._notify('records_changed', None)
+        if any(entity != 'record' for entity, _, _ in states):
+            self._notify('catalog_changed', 'all')
+        return entry[1]
+
+    def _restore_row(self, cursor, entity: str, uid: str, row: Optional[dict]):
+        """Приводит строку с данным uid к сохранённому состоянию (с записью в журнал синхронизации)"""
+        table = ENTITY_TABLES[entity]
+        row_id = self._id_by_uid(cursor, table, uid)
+        if row is None:
+            if row_id is not None:
+                cursor.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+                self._log_change(cursor, entity, uid, 'delete', {})
+            return
+
+        payload = {key: value for key, value in row.items() if key != 'id'}
+        if entity == 'project':
+            columns = {'name': row['name']}
+        elif entity == 'task':
+            columns = {'project_id': self._id_by_uid(cursor, 'projects', row['project_uid']),
+                       'name': row['name']}
+        else:
+            columns = dict(payload, task_id=self._id_by_uid(cursor, 'tasks', row['task_uid']))
+            del columns['task_uid']
+            columns.pop('tags', None)
+            self._check_overlap(columns['task_id'], row['start_time'], row['end_time'],
+                                exclude_id=row_id)
+        if row_id is None:
+            # id не переиспользуются (AUTOINCREMENT), строка получает прежний id
+            columns.update(id=row['id'], uid=uid)
+            names = ', '.join(columns)
+            cursor.execute(f'INSERT INTO {table} ({names}) VALUES ({", ".join("?" * len(columns))})',
+                           list(columns.values()))
+            row_id = row['id']
+        else:
+            assignments = ', '.join(f'{name} = ?' for name in columns)
+            cursor.execute(f'UPDATE {table} SET {assignments} WHERE id = ?',
+                           list(columns.values()) + [row_id])
+        if 'tags' in row:
+            self._set_tag_names(cursor, row_id, row['tags'])
+        self._log_change(cursor, entity, uid, 'upsert', payload)
+
+    # Синхронизация: журнал изменений (см. sync.py)
+    def get_local_changes(self, after_counter: int, limit: int = 1000) -> List[dict]:
+        """Изменения этого устройства с номером больше after_counter"""
+        with self.pool.reader() as conn:
+            rows = conn.execute('''
+            SELECT device_id, counter, lamport, entity, uid, op, payload FROM changes
+            WHERE device_id = ? AND counter > ?
+            ORDER BY counter LIMIT ?''', (self.device_id, after_counter, limit)).fetchall()
+        return [{'device_id': row[0], 'counter': row[1], 'lamport': row[2], 'entity': row[3],
+                 'uid': row[4], 'op': row[5], 'payload': json.loads(row[6])}
+                for row in rows]
+
+    def get_sync_value(self, key: str, default: str = None) -> Optional[str]:
+        with self.pool.reader() as conn:
+            row = conn.execute('SELECT value FROM sync_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_sync_value(self, key: str, value: str):
+        with self.transaction():
+            self.conn.execute('INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)',
+                              (key, value))
+
+    def get_peer_positions(self) -> Dict[str, int]:
+        with self.pool.reader() as conn:
+            return {row[0]: row[1] for row in conn.execute('SELECT device_id, position FROM sync_peers')}
+
+    def apply_remote_changes(self, changes: List[dict], positions: Dict[str, int]) -> int:
+        """
+        Применяет изменения других устройств одной транзакцией и сохраняет
+        позиции чтения. Уже виденные изменения пропускаются, а из конкурирующих
+        побеждает изменение с большими (lamport, device_id), поэтому слияние
+        детерминировано и его можно повторять. Возвращает число применённых.
+        """
+        applied = 0
+        records_touched = catalog_touched = False
+        with self.transaction():
+            cursor = self.conn.cursor()
+            for change in changes:
+                seen = cursor.execute('SELECT 1 FROM changes WHERE device_id = ? AND counter = ?',
+                                      (change['device_id'], change['counter'])).fetchone()
+                if seen:
+                    continue
+                uid = self._resolve_uid(cursor, change['uid'])
+                latest = cursor.execute(
+                    'SELECT lamport, device_id FROM changes WHERE uid = ? '
+                    'ORDER BY lamport DESC, device_id DESC LIMIT 1', (uid,)).fetchone()
+                cursor.execute('''
+                INSERT INTO changes (device_id, counter, lamport, entity, uid, op, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                               (change['device_id'], change['counter'], change['lamport'],
+                                change['entity'], uid, change['op'],
+                                json.dumps(change['payload'], ensure_ascii=False)))
+                if latest and tuple(latest) > (change['lamport'], change['device_id']):
+                    continue  # более позднее изменение уже применено
+                if self._apply_change(cursor, change['entity'], uid, change['op'], change['payload']):
+                    applied += 1
+                    records_touched = records_touched or change['entity'] != 'project'
+                    catalog_touched = catalog_touched or change['entity'] != 'record'
+            for device_id, position in positions.items():
+                cursor.execute('INSERT OR REPLACE INTO sync_peers (device_id, position) VALUES (?, ?)',
+                               (device_id, position))
+        if records_touched:
+            self._reset_indexes()
+            self._records_changed()
+            self._notify('records_changed', None)
+        if catalog_touched:
+            self._notify('catalog_changed', 'all')
+        return applied
+
+    def _resolve_uid(self, cursor, uid: str) -> str:
+        row = cursor.execute('SELECT target_uid FROM sync_aliases WHERE uid = ?', (uid,)).fetchone()
+        return row[0] if row else uid
+
+    def _id_by_uid(self, cursor, table: str, uid: Optional[str]) -> Optional[int]:
+        if uid is None:
+            return None
+        uid = self._resolve_uid(cursor, uid)
+        row = cursor.execute(f'SELECT id FROM {table} WHERE uid = ?', (uid,)).fetchone()
+        return row[0] if row else None
+
+    def _merge_duplicate(self, cursor, table: str, row_id: int, row_uid: str, uid: str):
+        """
+        Такая же строка (по уникальному имени) уже есть под другим uid.
+        Оставляем меньший uid, второй становится псевдонимом - на обоих
+        устройствах результат одинаковый.
+        """
+        keep, alias = sorted((row_uid, uid))
+        cursor.execute(f'UPDATE {table} SET uid = ? WHERE id = ?', (keep, row_id))
+        cursor.execute('INSERT OR REPLACE INTO sync_aliases (uid, target_uid) VALUES (?, ?)',
+                       (alias, keep))
+        cursor.execute('UPDATE changes SET uid = ? WHERE uid = ?', (keep, alias))
+
+    def _apply_change(self, cursor, entity: str, uid: str, op: str, payload: dict) -> bool:
+        if entity == 'project':
+            project_id = self._id_by_uid(cursor, 'projects', uid)
+            if op == 'delete':
+                if project_id is None:
+                    return False
+                for (task_id,) in cursor.execute('SELECT id FROM tasks WHERE project_id = ?',
+                                                 (project_id,)).fetchall():
+                    cursor.execute('DELETE FROM time_records WHERE task_id = ?', (task_id,))
+                cursor.execute('DELETE FROM tasks WHERE project_id = ?', (project_id,))
+                cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+                return True
+            same_name = cursor.execute('SELECT id, uid FROM projects WHERE name = ?',
+                                       (payload['name'],)).fetchone()
+            if same_name and same_name[0] != project_id:
+                if project_id is None:
+                    self._merge_duplicate(cursor, 'projects', same_name[0], same_name[1], uid)
+                    return True
+                return False  # переименование в уже занятое имя
+            if project_id is None:
+                cursor.execute('INSERT INTO projects (name, uid) VALUES (?, ?)', (payload['name'], uid))
+            else:
+                cursor.execute('UPDATE projects SET name = ? WHERE id = ?', (payload['name'], project_id))
+            return True
+
+        if entity == 'task':
+            task_id = self._id_by_uid(cursor, 'tasks', uid)
+            if op == 'delete':
+                if task_id is None:
+                    return False
+                cursor.execute('DELETE FROM time_records WHERE task_id = ?', (task_id,))
+                cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+                return True
+            project_id = self._id_by_uid(cursor, 'projects', payload['project_uid'])
+            if project_id is None:
+                return False  # проект удалён
+            same_name = cursor.execute('SELECT id, uid FROM tasks WHERE project_id = ? AND name = ?',
+                                       (project_id, payload['name'])).fetchone()
+            if same_name and same_name[0] != task_id:
+                if task_id is None:
+                    self._merge_duplicate(cursor, 'tasks', same_name[0], same_name[1], uid)
+                    return True
+                return False
+            if task_id is None:
+                cursor.execute('INSERT INTO tasks (project_id, name, uid) VALUES (?, ?, ?)',
+                               (project_id, payload['name'], uid))
+            else:
+                cursor.execute('UPDATE tasks SET project_id = ?, name = ? WHERE id = ?',
+                               (project_id, payload['name'], task_id))
+            return True
+
+        if entity == 'record':
+            record_id = self._id_by_uid(cursor, 'time_records', uid)
+            if op == 'delete':
+                if record_id is None:
+                    return False
+                cursor.execute('DELETE FROM time_records WHERE id = ?', (record_id,))
+                return True
+            task_id = self._id_by_uid(cursor, 'tasks', payload['task_uid'])
+            if task_id is None:
+                return False  # задача удалена
+            values = (task_id, payload['start_time'], payload['end_time'],
+                      payload['duration_seconds'], payload['was_productive'])
+            if record_id is None:
+                cursor.execute('''
+                INSERT INTO time_records
+                (task_id, start_time, end_time, duration_seconds, was_productive, uid)
+                VALUES (?, ?, ?, ?, ?, ?)''', values + (uid,))
+                record_id = cursor.lastrowid
+            else:
+                cursor.execute('''
+                UPDATE time_records SET task_id = ?, start_time = ?, end_time = ?,
+                duration_seconds = ?, was_productive = ? WHERE id = ?''', values + (record_id,))
+            if 'tags' in payload:
+                self._set_tag_names(cursor, record_id, payload['tags'])
+            return True
+        return False
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Внутренняя шина событий окна.
+
+Источники (база, таймеры, настройки) публикуют типизированные события,
+а шина собирает их в пачку и раздаёт подписчикам в цикле событий Qt:
+сто записей, вставленных импортом, - это одно обновление таблицы, а не сто.
+Подписчик получает список событий своих типов в порядке публикации и сам
+решает, применить их сразу или отложить, пока его вкладка не видна.
+"""
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+
+from models import TimeRecord
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecordsAdded:
+    records: Tuple[TimeRecord, ...]
+
+
+@dataclass(frozen=True)
+class RecordDeleted:
+    record_id: int
+
+
+@dataclass(frozen=True)
+class RecordsChanged:
+    """Записи изменились массово или отредактированы - нужно перечитать"""
+
+
+@dataclass(frozen=True)
+class CatalogChanged:
+    kind: str  # 'project', 'task', 'tag' или 'all'
+
+
+@dataclass(frozen=True)
+class TimerStateChanged:
+    """Запущена, остановлена или сброшена сессия либо сменилась текущая задача"""
+    task_id: Optional[int]
+    running: bool
+
+
+@dataclass(frozen=True)
+class SettingsChanged:
+    names: FrozenSet[str]
+
+
+RECORD_EVENTS = (RecordsAdded, RecordDeleted, RecordsChanged)
+
+
+def from_db_event(event: str, payload):
+    """Событие Database.add_listener в типизированном виде (None - неизвестное)"""
+    if event == 'record_added':
+        return RecordsAdded((payload,))
+    if event == 'records_added':
+        return RecordsAdded(tuple(payload))
+    if event == 'record_deleted':
+        return RecordDeleted(payload)
+    if event == 'records_changed':
+        return RecordsChanged()
+    if event == 'catalog_changed':
+        return CatalogChanged(payload)
+    return None
+
+
+class EventBus(QObject):
+    """
+    Публиковать можно из любого потока; подписчики вызываются в потоке
+    шины (GUI) после того, как текущий обработчик вернёт управление циклу.
+    """
+
+    _wake = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._handlers: Dict[type, List[Callable[[list], None]]] = defaultdict(list)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake.connect(self.dispatch, Qt.QueuedConnection)
+
+    def subscribe(self, event_types, handler: Callable[[list], None]):
+        """handler(events) вызывается с непустым списком событий типов event_types"""
+        if isinstance(event_types, type):
+            event_types = (event_types,)
+        for event_type in event_types:
+            self._handlers[event_type].append(handler)
+
+    def unsubscribe(self, handler: Callable[[list], None]):
+        for handlers in self._handlers.values():
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def publish(self, event):
+        with self._lock:
+            self._pending.append(event)
+            wake = len(self._pending) == 1
+        if wake:
+            self._wake.emit()
+
+    def on_db_event(self, event: str, payload):
+        """Обработчик Database.add_listener: изменения базы попадают на шину"""
+        typed = from_db_event(event, payload)
+        if typed is not None:
+            self.publish(typed)
+
+    def dispatch(self):
+        """Раздаёт накопленные события; вызывается циклом Qt, можно и напрямую"""
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return
+        batches: Dict[Callable, list] = {}
+        for event in events:
+            for handler in self._handlers.get(type(event), ()):
+                batches.setdefault(handler, []).append(event)
+        for handler, batch in batches.items():
+            try:
+                handler(batch)
+            except Exception:
+                # Ошибка одного подписчика не должна лишать событий остальных
+                logger.exception("Ошибка обработчика событий %r", handler)
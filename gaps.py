@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from PyQt5.QtWidgets import (QComboBox, QDialog, QDialogButtonBox, QHBoxLayout, QLabel,
+                             QMessageBox, QPushButton, QTableWidget, QTableWidgetItem,
+                             QVBoxLayout)
+
+from intervals import OverlapError
+from repository import Repository
+from settings import Settings
+
+# Соседние записи дальше этого не влияют на выбор задачи для пропуска
+NEIGHBOUR_DISTANCE = timedelta(hours=4)
+
+
+@dataclass
+class Gap:
+    start: datetime
+    end: datetime
+    task_id: Optional[int] = None  # предлагаемая задача
+
+    @property
+    def seconds(self) -> int:
+        return int((self.end - self.start).total_seconds())
+
+
+def parse_time(value: str) -> time:
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def working_windows(date_from: date, date_to: date, work_start: time, work_end: time,
+                    work_days: Sequence[int], now: datetime = None) -> Iterator[Tuple[datetime, datetime]]:
+    """Рабочие часы каждого рабочего дня периода; будущее время отрезается"""
+    now = now or datetime.now()
+    day = date_from
+    while day <= date_to:
+        if day.weekday() in work_days:
+            start = datetime.combine(day, work_start)
+            end = min(datetime.combine(day, work_end), now)
+            if end > start:
+                yield start, end
+        day += timedelta(days=1)
+
+
+def find_gaps(intervals: Sequence[tuple], windows: Sequence[Tuple[datetime, datetime]],
+              min_length: timedelta = timedelta(0)) -> List[Gap]:
+    """
+    Незанятые промежутки внутри окон за один проход.
+
+    intervals - записи (начало, конец, id, id задачи), отсортированные по
+    началу; windows - непересекающиеся окна по возрастанию. Указатель по
+    записям только движется вперёд, поэтому проход стоит O(записи + окна).
+    Задача для пропуска - задача соседней записи: общая, если до и после
+    пропуска работали над одной задачей, иначе - ближайшей по времени.
+    """
+    gaps = []
+    first = 0  # первая запись, которая может задеть текущее окно
+    for window_start, window_end in windows:
+        while first < len(intervals) and intervals[first][1] <= window_start:
+            first += 1
+        cursor = window_start
+        previous = intervals[first - 1] if first else None
+        i = first
+        while True:
+            record = intervals[i] if i < len(intervals) and intervals[i][0] < window_end else None
+            stop = record[0] if record else window_end
+            if stop > cursor and stop - cursor >= min_length:
+                following = record or (intervals[i] if i < len(intervals) else None)
+                gaps.append(Gap(cursor, stop, _suggest_task(cursor, stop, previous, following)))
+            if record is None:
+                break
+            if record[1] > cursor:
+                cursor = record[1]
+                previous = record
+            i += 1
+    return gaps
+
+
+def _suggest_task(start: datetime, end: datetime, previous, following) -> Optional[int]:
+    before = previous if previous and start - previous[1] <= NEIGHBOUR_DISTANCE else None
+    after = following if following and following[0] - end <= NEIGHBOUR_DISTANCE else None
+    if before and after:
+        if before[3] == after[3]:
+            return before[3]
+        return before[3] if start - before[1] <= after[0] - end else after[3]
+    if before or after:
+        return (before or after)[3]
+    return None
+
+
+def analyze(db: Repository, settings: Settings, date_from: date, date_to: date,
+            now: datetime = None) -> List[Gap]:
+    """Пропуски в рабочих часах за период (по настройкам рабочего дня)"""
+    windows = list(working_windows(date_from, date_to, parse_time(settings.work_start),
+                                   parse_time(settings.work_end), settings.work_days, now))
+    if not windows:
+        return []
+    # Записи с запасом по краям периода - соседи первого и последнего пропуска
+    intervals = db.find_overlaps(windows[0][0] - NEIGHBOUR_DISTANCE,
+                                 windows[-1][1] + NEIGHBOUR_DISTANCE)
+    return find_gaps(intervals, windows, timedelta(minutes=settings.gap_min_minutes))
+
+
+class GapsDialog(QDialog):
+    """Список пропусков с заполнением одной кнопкой"""
+
+    def __init__(self, db: Repository, gaps: List[Gap], task_titles: List[Tuple[int, str]],
+                 parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Пропуски в рабочем времени")
+        self.resize(640, 400)
+        self.db = db
+        self.gaps = list(gaps)
+        self.task_titles = task_titles
+        self.filled = 0
+
+        layout = QVBoxLayout(self)
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Период", "Длительность", "Задача", ""])
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        fill_all_btn = QPushButton("Заполнить все")
+        fill_all_btn.clicked.connect(self.fill_all)
+        buttons.addWidget(fill_all_btn)
+        close_buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        close_buttons.rejected.connect(self.reject)
+        buttons.addWidget(close_buttons)
+        layout.addLayout(buttons)
+
+        self.populate()
+
+    def populate(self):
+        self.table.setRowCount(len(self.gaps))
+        total = 0
+        for row, gap in enumerate(self.gaps):
+            total += gap.seconds
+            self.table.setItem(row, 0, QTableWidgetItem(
+                f"{gap.start:%d.%m.%Y %H:%M} - {gap.end:%H:%M}"))
+            hours, rest = divmod(gap.seconds, 3600)
+            self.table.setItem(row, 1, QTableWidgetItem(f"{hours:02d}:{rest // 60:02d}"))
+
+            combo = QComboBox()
+            combo.addItem("(не выбрана)", None)
+            for task_id, title in self.task_titles:
+                combo.addItem(title, task_id)
+            combo.setCurrentIndex(max(combo.findData(gap.task_id), 0))
+            self.table.setCellWidget(row, 2, combo)
+
+            btn = QPushButton("Заполнить")
+            btn.clicked.connect(lambda _, g=gap: self.fill(g))
+            self.table.setCellWidget(row, 3, btn)
+        self.table.resizeColumnsToContents()
+        hours, rest = divmod(total, 3600)
+        self.info_label.setText(f"Пропусков: {len(self.gaps)}, всего {hours} ч {rest // 60} мин")
+
+    def _task_for(self, gap: Gap) -> Optional[int]:
+        return self.table.cellWidget(self.gaps.index(gap), 2).currentData()
+
+    def fill(self, gap: Gap):
+        task_id = self._task_for(gap)
+        if task_id is None:
+            QMessageBox.warning(self, "Ошибка", "Выберите задачу для пропуска")
+            return
+        try:
+            self.db.add_time_record(task_id, gap.start, gap.end, gap.seconds, True)
+        except OverlapError as e:
+            QMessageBox.warning(self, "Пересечение записей", str(e))
+            return
+        self.filled += 1
+        self.gaps.remove(gap)
+        self.populate()
+
+    def fill_all(self):
+        """Все пропуски с выбранной задачей - одной транзакцией"""
+        chosen = [(gap, self._task_for(gap)) for gap in self.gaps]
+        records = [(task_id, gap.start, gap.end, gap.seconds, True)
+                   for gap, task_id in chosen if task_id is not None]
+        if not records:
+            return
+        try:
+            self.db.add_time_records(records)
+        except OverlapError as e:
+            QMessageBox.warning(self, "Пересечение записей", str(e))
+            return
+        self.filled += len(records)
+        self.gaps = [gap for gap, task_id in chosen if task_id is None]
+        self.populate()
@@ -0,0 +1,414 @@
+import logging
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from intervals import OverlapError
+from repository import Repository
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//desktopTimer//RU'
+# Суффикс UID событий, выгруженных из таймера: при обратном импорте
+# по нему восстанавливается uid записи, и повторный импорт ничего не дублирует
+UID_SUFFIX = '@desktopTimer'
+MAX_LINE_OCTETS = 75
+IMPORT_BATCH_SIZE = 500
+
+_PARAM_SPLIT = re.compile(r';(?=(?:[^"]*"[^"]*")*[^"]*$)')
+_DURATION = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def escape_text(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def unescape_text(value: str) -> str:
+    if '\\' not in value:
+        return value
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def fold_line(line: str) -> str:
+    """Строка содержимого, перенесённая по 75 байт (RFC 5545, 3.1), с CRLF"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+    parts = []
+    start, limit = 0, MAX_LINE_OCTETS
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1  # не разрываем многобайтовый символ
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, MAX_LINE_OCTETS - 1  # продолжение начинается с пробела
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_utc(value: datetime) -> str:
+    """Локальное время записи в UTC-формате iCalendar"""
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local(value: datetime) -> datetime:
+    """Время с часовым поясом - в локальное без пояса (как в базе)"""
+    return value.astimezone().replace(tzinfo=None)
+
+
+def _parse_stamp(value: str) -> datetime:
+    """'ГГГГММДДTЧЧММСС' без strptime: разбор срезами в несколько раз быстрее"""
+    if len(value) != 15 or value[8] != 'T':
+        raise ValueError(f"Неверное время: {value}")
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                    int(value[9:11]), int(value[11:13]), int(value[13:15]))
+
+
+def parse_datetime(value: str, params: Dict[str, str]) -> Tuple[datetime, bool]:
+    """
+    Значение DTSTART/DTEND: (локальное время, весь день). Время в UTC и
+    с TZID переводится в локальный пояс; «плавающее» время остаётся как есть.
+    """
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime(int(value[:4]), int(value[4:6]), int(value[6:8])), True
+    if value.endswith('Z'):
+        return _local(_parse_stamp(value[:-1]).replace(tzinfo=timezone.utc)), False
+    parsed = _parse_stamp(value)
+    if 'TZID' in params:
+        try:
+            from zoneinfo import ZoneInfo
+            return _local(parsed.replace(tzinfo=ZoneInfo(params['TZID'].strip('"')))), False
+        except (ImportError, KeyError, ValueError):
+            # Пояс в стиле Windows или неизвестный - считаем время локальным
+            logger.debug("Неизвестный часовой пояс %s", params['TZID'])
+    return parsed, False
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    match = _DURATION.match(value.strip())
+    if not match:
+        return None
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+
+def parse_content_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """'NAME;PARAM=v:значение' -> (NAME, {PARAM: v}, значение); кавычки учитываются"""
+    if '"' in line:
+        quoted = False
+        colon = len(line)
+        for index, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ':' and not quoted:
+                colon = index
+                break
+        head, value = line[:colon], line[colon + 1:]
+        name, *raw_params = _PARAM_SPLIT.split(head)
+    else:
+        # Обычная строка без кавычек - без посимвольного разбора
+        head, _, value = line.partition(':')
+        if ';' not in head:
+            return head.upper(), {}, value
+        name, *raw_params = head.split(';')
+    params = {}
+    for param in raw_params:
+        key, _, param_value = param.partition('=')
+        params[key.upper()] = param_value
+    return name.upper(), params, value
+
+
+def unfold(lines: Iterable[str]) -> Iterator[str]:
+    """Склеивает перенесённые строки; читает поток по одной строке"""
+    pending = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if pending is not None:
+                pending += line[1:]
+            continue
+        if pending:
+            yield pending
+        pending = line
+    if pending:
+        yield pending
+
+
+@dataclass
+class CalendarEvent:
+    uid: str
+    start: datetime
+    end: datetime
+    summary: str = ''
+    description: str = ''
+    location: str = ''
+    categories: List[str] = field(default_factory=list)
+    status: str = ''
+    # Свойства X-DESKTOPTIMER-* из выгрузки таймера
+    extra: Dict[str, str] = field(default_factory=dict)
+
+
+def _build_event(props: Dict[str, Tuple[Dict[str, str], str]],
+                 categories: List[str]) -> Optional[CalendarEvent]:
+    """Событие со временем начала и конца; события на весь день и без начала - None"""
+    if 'DTSTART' not in props:
+        return None
+    start, all_day = parse_datetime(props['DTSTART'][1], props['DTSTART'][0])
+    if all_day:
+        return None
+    if 'DTEND' in props:
+        end, _ = parse_datetime(props['DTEND'][1], props['DTEND'][0])
+    else:
+        duration = parse_duration(props['DURATION'][1]) if 'DURATION' in props else None
+        end = start + (duration or timedelta())
+    uid = props.get('UID', ({}, ''))[1]
+    if 'RECURRENCE-ID' in props:
+        uid += '/' + props['RECURRENCE-ID'][1]  # изменённый экземпляр повторяющегося события
+    text = {name: unescape_text(props[name][1]) if name in props else ''
+            for name in ('SUMMARY', 'DESCRIPTION', 'LOCATION', 'STATUS')}
+    return CalendarEvent(uid=uid, start=start, end=end, summary=text['SUMMARY'],
+                         description=text['DESCRIPTION'], location=text['LOCATION'],
+                         categories=categories, status=text['STATUS'].upper(),
+                         extra={name: unescape_text(value) for name, (_, value) in props.items()
+                                if name.startswith('X-DESKTOPTIMER-')})
+
+
+def iter_events(lines: Iterable[str]) -> Iterator[CalendarEvent]:
+    """
+    События VEVENT из потока строк календаря. Файл не загружается целиком:
+    в памяти только свойства текущего события. Вложенные компоненты
+    (напоминания VALARM) пропускаются. Правила повторения (RRULE) не
+    разворачиваются - импортируется первое вхождение и изменённые экземпляры.
+    """
+    props = None
+    categories = []
+    nested = 0
+    for line in unfold(lines):
+        name, params, value = parse_content_line(line)
+        if name == 'BEGIN':
+            if value.upper() == 'VEVENT':
+                props, categories, nested = {}, [], 0
+            elif props is not None:
+                nested += 1
+        elif name == 'END' and props is not None:
+            if nested:
+                nested -= 1
+            elif value.upper() == 'VEVENT':
+                try:
+                    event = _build_event(props, categories)
+                except ValueError:
+                    logger.warning("Пропущено событие с неверной датой: %s",
+                                   props.get('UID', ({}, '?'))[1])
+                    event = None
+                props = None
+                if event is not None:
+                    yield event
+        elif props is not None and not nested:
+            if name == 'CATEGORIES':
+                categories += [unescape_text(c).strip()
+                               for c in re.split(r'(?<!\\),', value) if c.strip()]
+            else:
+                props.setdefault(name, (params, value))
+
+
+def write_ics(rows: Iterable[tuple], stream: TextIO) -> int:
+    """
+    Пишет календарь с событием на каждую запись (uid, проект, задача,
+    начало, конец, продуктивность), строка за строкой - строки записей
+    не накапливаются. Поток нужно открыть с newline=''. Возвращает число событий.
+    """
+    stamp = format_utc(datetime.now())
+    stream.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n')
+    stream.write(fold_line(f'PRODID:{PRODID}'))
+    stream.write('CALSCALE:GREGORIAN\r\n')
+    count = 0
+    for uid, project, task, start, end, productive in rows:
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{uid}{UID_SUFFIX}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{format_utc(datetime.fromisoformat(start))}',
+            f'DTEND:{format_utc(datetime.fromisoformat(end))}',
+            f'SUMMARY:{escape_text(f"{project} / {task}")}',
+            f'CATEGORIES:{escape_text(project)}',
+            f'X-DESKTOPTIMER-PROJECT:{escape_text(project)}',
+            f'X-DESKTOPTIMER-TASK:{escape_text(task)}',
+            f'X-DESKTOPTIMER-PRODUCTIVE:{"TRUE" if productive else "FALSE"}',
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ]
+        stream.write(''.join(fold_line(line) for line in lines))
+        count += 1
+    stream.write('END:VCALENDAR\r\n')
+    return count
+
+
+def export_ics(db: Repository, path: str, date_from: date, date_to: date,
+               project_id: int = None) -> int:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        return write_ics(db.iter_calendar_records(date_from, date_to, project_id), f)
+
+
+@dataclass
+class MappingRule:
+    """
+    Правило импорта: регулярное выражение по полю события (summary,
+    description, location, categories). Задача может ссылаться на группы
+    выражения (\\1, \\g<name>); пустая задача - название события.
+    Пустой проект - событие пропускается.
+    """
+    pattern: str
+    project: str
+    task: str = ''
+    field: str = 'summary'
+    productive: bool = True
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern, re.IGNORECASE)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'MappingRule':
+        return cls(pattern=str(data['pattern']), project=str(data.get('project', '')),
+                   task=str(data.get('task', '')), field=str(data.get('field', 'summary')),
+                   productive=bool(data.get('productive', True)))
+
+    def apply(self, event: CalendarEvent) -> Optional[Tuple[str, str, bool]]:
+        """(проект, задача, продуктивность) или None, если правило не подходит"""
+        if self.field == 'categories':
+            values = event.categories
+        else:
+            values = [getattr(event, self.field, '')]
+        for value in values:
+            match = self._regex.search(value)
+            if match:
+                task = match.expand(self.task) if self.task else event.summary
+                return self.project, task.strip() or "Без названия", self.productive
+        return None
+
+
+def map_event(event: CalendarEvent, rules: List[MappingRule],
+              default_project: str) -> Optional[Tuple[str, str, bool]]:
+    """
+    Проект и задача события: события из выгрузки таймера возвращаются
+    в свои задачи, остальные - по первому подходящему правилу или в
+    default_project (пустой - пропустить) с названием события как задачей.
+    """
+    if 'X-DESKTOPTIMER-PROJECT' in event.extra and 'X-DESKTOPTIMER-TASK' in event.extra:
+        return (event.extra['X-DESKTOPTIMER-PROJECT'], event.extra['X-DESKTOPTIMER-TASK'],
+                event.extra.get('X-DESKTOPTIMER-PRODUCTIVE', 'TRUE').upper() == 'TRUE')
+    for rule in rules:
+        target = rule.apply(event)
+        if target is not None:
+            return target if target[0] else None
+    if not default_project:
+        return None
+    return default_project, event.summary.strip() or "Без названия", True
+
+
+def record_uid(event_uid: str) -> Optional[str]:
+    """
+    uid записи для события: свой uid для выгрузки таймера, для чужих
+    событий - производный от UID, чтобы повторный импорт не дублировал записи
+    """
+    if not event_uid:
+        return None
+    if event_uid.endswith(UID_SUFFIX):
+        return event_uid[:-len(UID_SUFFIX)]
+    return uuid.uuid5(uuid.NAMESPACE_URL, 'ics:' + event_uid).hex
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0  # не подошли правилам, весь день, отменены, вне периода, уже есть
+    rejected: int = 0  # пересекаются с записями той же задачи
+
+
+class CalendarImporter:
+    """
+    Импорт событий в записи времени. События читаются потоком и
+    записываются пачками по batch_size одной транзакцией add_time_records;
+    проекты и задачи находятся (или создаются) один раз на имя. Если пачка
+    отвергнута из-за пересечения, её записи сохраняются по одной, и
+    отклоняются только конфликтующие.
+    """
+
+    def __init__(self, db: Repository, rules: List[MappingRule], default_project: str = '',
+                 batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.rules = rules
+        self.default_project = default_project
+        self.batch_size = batch_size
+        self._projects: Optional[Dict[str, int]] = None
+        self._tasks: Dict[Tuple[str, str], int] = {}
+
+    def _task_id(self, project_name: str, task_name: str) -> int:
+        key = (project_name, task_name)
+        if key not in self._tasks:
+            task = self.db.find_task(project_name, task_name)
+            if task is None:
+                if self._projects is None:
+                    self._projects = {p.name: p.id for p in self.db.get_projects()}
+                if project_name not in self._projects:
+                    self._projects[project_name] = self.db.add_project(project_name).id
+                task = self.db.add_task(self._projects[project_name], task_name)
+            self._tasks[key] = task.id
+        return self._tasks[key]
+
+    def _flush(self, batch: List[tuple], result: ImportResult):
+        if not batch:
+            return
+        try:
+            saved = len(self.db.add_time_records(batch))
+            result.imported += saved
+            result.skipped += len(batch) - saved
+        except (OverlapError, ValueError):
+            for record in batch:
+                try:
+                    saved = len(self.db.add_time_records([record]))
+                    result.imported += saved
+                    result.skipped += 1 - saved
+                except (OverlapError, ValueError):
+                    result.rejected += 1
+        batch.clear()
+
+    def run(self, lines: Iterable[str], date_from: date = None,
+            date_to: date = None) -> ImportResult:
+        result = ImportResult()
+        batch = []
+        for event in iter_events(lines):
+            target = map_event(event, self.rules, self.default_project)
+            if (target is None or event.status == 'CANCELLED' or event.end <= event.start
+                    or (date_from and event.start.date() < date_from)
+                    or (date_to and event.start.date() > date_to)):
+                result.skipped += 1
+                continue
+            project_name, task_name, productive = target
+            batch.append((self._task_id(project_name, task_name), event.start, event.end,
+                          int((event.end - event.start).total_seconds()), productive,
+                          record_uid(event.uid)))
+            if len(batch) >= self.batch_size:
+                self._flush(batch, result)
+        self._flush(batch, result)
+        return result
+
+
+def import_ics(db: Repository, path: str, rules: List[MappingRule], default_project: str = '',
+               date_from: date = None, date_to: date = None) -> ImportResult:
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return CalendarImporter(db, rules, default_project).run(f, date_from, date_to)
+
+
+def rules_from_settings(settings) -> List[MappingRule]:
+    """Правила из настроек; неверные выражения пропускаются с предупреждением"""
+    rules = []
+    for data in settings.ical_rules:
+        try:
+            rules.append(MappingRule.from_dict(data))
+        except (KeyError, TypeError, re.error) as e:
+            logger.warning("Пропущено правило импорта календаря %r: %s", data, e)
+    return rules
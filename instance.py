@@ -0,0 +1,83 @@
+import getpass
+import hashlib
+import json
+import os
+from typing import List
+
+from PyQt5.QtCore import QObject, QLockFile, QDir, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+# Команды, которые передаются уже запущенному окну
+GUI_COMMANDS = ('show', 'start', 'pause', 'stop')
+CONNECT_TIMEOUT_MS = 200
+
+
+def server_name(db_path: str = 'db/timer.db') -> str:
+    """Имя локального сокета: своё для пользователя и файла базы данных"""
+    digest = hashlib.md5(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:8]
+    return f"desktopTimer-{getpass.getuser()}-{digest}"
+
+
+def forward_to_running(args: List[str], db_path: str = 'db/timer.db') -> bool:
+    """
+    Передаёт команду запущенному экземпляру. Возвращает False, если
+    экземпляр не запущен. Не требует QApplication и не загружает GUI.
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(server_name(db_path))
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        return False
+    socket.write(json.dumps(args).encode('utf-8') + b'\n')
+    socket.waitForBytesWritten(CONNECT_TIMEOUT_MS)
+    # Ждём подтверждения, чтобы команда не потерялась при закрытии сокета
+    socket.waitForReadyRead(1000)
+    socket.disconnectFromServer()
+    return True
+
+
+class SingleInstance(QObject):
+    """
+    Сервер единственного экземпляра. Первый запуск захватывает lock-файл
+    и слушает локальный сокет; следующие запуски передают свои аргументы
+    через forward_to_running и сразу завершаются.
+    """
+
+    command_received = pyqtSignal(list)
+
+    def __init__(self, db_path: str = 'db/timer.db', parent=None):
+        super().__init__(parent)
+        self.name = server_name(db_path)
+        self.lock = QLockFile(os.path.join(QDir.tempPath(), self.name + '.lock'))
+        self.lock.setStaleLockTime(0)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self._on_new_connection)
+
+    def listen(self) -> bool:
+        """Захватывает роль основного экземпляра; False - он уже есть"""
+        if not self.lock.tryLock(100):
+            return False
+        # Сокет мог остаться от аварийно завершённого процесса
+        QLocalServer.removeServer(self.name)
+        return self.server.listen(self.name)
+
+    def close(self):
+        self.server.close()
+        self.lock.unlock()
+
+    def _on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda s=socket: self._read_command(s))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def _read_command(self, socket: QLocalSocket):
+        if not socket.canReadLine():
+            return
+        try:
+            args = json.loads(bytes(socket.readLine()).decode('utf-8'))
+        except ValueError:
+            args = None
+        socket.write(b'ok\n')
+        socket.flush()
+        if isinstance(args, list):
+            self.command_received.emit([str(a) for a in args])
@@ -0,0 +1,95 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (начало, конец, id записи, id задачи)
+Interval = Tuple[datetime, datetime, int, int]
+
+
+class OverlapError(ValueError):
+    """Запись пересекается с уже сохранёнными записями той же задачи"""
+
+    def __init__(self, conflicts: List[Interval]):
+        self.conflicts = conflicts
+        periods = ", ".join(f"{start:%d.%m.%Y %H:%M}-{end:%H:%M}" for start, end, _, _ in conflicts[:3])
+        if len(conflicts) > 3:
+            periods += f" и ещё {len(conflicts) - 3}"
+        super().__init__(f"Запись пересекается с уже сохранённым временем: {periods}")
+
+
+class IntervalIndex:
+    """
+    Интервалы записей времени, отсортированные по началу.
+
+    Поиск пересечений и свободных промежутков - бинарный поиск по началам:
+    интервал, пересекающий [start, end), начинается не раньше
+    start - max_length (самой длинной записи) и раньше end. Поэтому запрос
+    стоит O(log n + k), где k - число записей в этом окне. max_length при
+    удалении не уменьшается: окно лишь становится чуть шире.
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self._items: List[Interval] = sorted(intervals)
+        self._starts = [item[0] for item in self._items]
+        self._by_id: Dict[int, Interval] = {item[2]: item for item in self._items}
+        self._max_length = max((end - start for start, end, _, _ in self._items),
+                               default=timedelta(0))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, record_id: int, task_id: int, start: datetime, end: datetime):
+        if record_id in self._by_id:
+            self.remove(record_id)
+        item = (start, end, record_id, task_id)
+        index = bisect_right(self._items, item)
+        self._items.insert(index, item)
+        self._starts.insert(index, start)
+        self._by_id[record_id] = item
+        self._max_length = max(self._max_length, end - start)
+
+    def remove(self, record_id: int) -> bool:
+        item = self._by_id.pop(record_id, None)
+        if item is None:
+            return False
+        index = bisect_left(self._items, item)
+        del self._items[index]
+        del self._starts[index]
+        return True
+
+    def _window(self, start: datetime, end: datetime) -> List[Interval]:
+        lo = bisect_left(self._starts, start - self._max_length)
+        hi = bisect_left(self._starts, end)
+        return self._items[lo:hi]
+
+    def overlapping(self, start: datetime, end: datetime, task_id: Optional[int] = None,
+                    exclude_id: Optional[int] = None) -> List[Interval]:
+        """Интервалы, пересекающие [start, end) (касание концами - не пересечение)"""
+        return [item for item in self._window(start, end)
+                if item[1] > start and item[2] != exclude_id
+                and (task_id is None or item[3] == task_id)]
+
+    def gaps(self, start: datetime, end: datetime,
+             min_length: timedelta = timedelta(0)) -> List[Tuple[datetime, datetime]]:
+        """Промежутки внутри [start, end), не занятые ни одной записью"""
+        result = []
+        cursor = start
+        for item_start, item_end, _, _ in self._window(start, end):
+            if item_end <= cursor:
+                continue
+            if item_start > cursor and item_start - cursor >= min_length:
+                result.append((cursor, item_start))
+            cursor = max(cursor, item_end)
+        if end > cursor and end - cursor >= min_length:
+            result.append((cursor, end))
+        return result
+
+    def neighbours(self, moment: datetime) -> Tuple[Optional[Interval], Optional[Interval]]:
+        """Последняя запись, начатая до moment, и первая - начатая после"""
+        index = bisect_right(self._starts, moment)
+        before = self._items[index - 1] if index else None
+        after = self._items[index] if index < len(self._items) else None
+        return before, after
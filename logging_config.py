@@ -0,0 +1,107 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+from typing import Optional
+
+from settings import Settings, user_data_dir
+
+# Стандартные поля LogRecord; всё остальное - данные, переданные через extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'where': f"{record.module}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладёт запись в очередь, не форматируя её: в GUI-потоке только
+    подставляются аргументы сообщения и текст исключения.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_dir() -> str:
+    return os.path.join(user_data_dir(), 'logs')
+
+
+def apply_levels(settings: Settings):
+    """Общий уровень и уровни отдельных модулей из настроек"""
+    logging.getLogger().setLevel(settings.log_level)
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def setup_logging(settings: Settings) -> str:
+    """
+    Настраивает логирование приложения: все записи через очередь попадают
+    в фоновый поток, который пишет их в ротируемый JSON-файл в папке данных
+    пользователя (и предупреждения - в stderr). Возвращает путь к файлу.
+    """
+    global _listener
+    path = os.path.join(log_dir(), 'timer.log')
+    apply_levels(settings)
+    if _listener is not None:
+        return path
+
+    os.makedirs(log_dir(), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=settings.log_max_bytes, backupCount=settings.log_backups, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return path
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
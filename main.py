@@ -1,12 +1,52 @@
+import logging
 import sys
-from PyQt5.QtWidgets import QApplication
-from ui import TimerApp
+import time
+
+logger = logging.getLogger(__name__)
+
 
 def main():
-    app = QApplication(sys.argv)
+    argv = sys.argv[1:]
+
+    # Команды командной строки работают без запуска GUI
+    from instance import GUI_COMMANDS
+    if argv and argv[0] not in GUI_COMMANDS:
+        from cli import run
+        sys.exit(run(argv))
+
+    # Если приложение уже запущено, передаём ему команду и сразу выходим
+    from instance import SingleInstance, forward_to_running
+    if forward_to_running(argv or ['show']):
+        sys.exit(0)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+
+    # Логи пишутся в фоновом потоке; уровни модулей задаются в настройках
+    from settings import Settings
+    from logging_config import setup_logging
+    setup_logging(Settings())
+
+    # Сервер команд создаётся после QApplication: ему нужен цикл событий Qt
+    instance = SingleInstance()
+    if not instance.listen():
+        # Основной экземпляр ещё запускается - ждём, пока он начнёт принимать команды
+        for _ in range(20):
+            time.sleep(0.25)
+            if forward_to_running(argv or ['show']):
+                sys.exit(0)
+        logger.error("Приложение уже запущено, но не отвечает")
+        sys.exit(1)
+
+    from ui import TimerApp
     window = TimerApp()
+    instance.command_received.connect(window.handle_command)
     window.show()
-    sys.exit(app.exec_())
+    if argv:
+        window.handle_command(argv)
+    exit_code = app.exec_()
+    instance.close()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
 
 @dataclass
 class Project:
@@ -20,3 +22,39 @@ class TimeRecord:
     end_time: datetime
     duration_seconds: int
     was_productive: bool
+    # Заполняются, когда запись выбрана вместе с проектом и задачей
+    project_name: Optional[str] = None
+    task_name: Optional[str] = None
+
+@dataclass
+class Tag:
+    id: int
+    name: str
+
+@dataclass
+class Budget:
+    id: int
+    project_id: Optional[int]  # бюджет проекта
+    task_id: Optional[int]  # или бюджет задачи
+    period: str  # 'day', 'week' или 'total'
+    seconds: int
+
+@dataclass
+class Rate:
+    id: int
+    project_id: int
+    task_id: Optional[int]  # None - ставка всего проекта
+    effective_from: date
+    hourly_rate: Decimal
+
+@dataclass(frozen=True)
+class RecordQuery:
+    """Фильтр записей времени (см. Database.query_records); неизменяемый - ключ кэша"""
+    date_from: date
+    date_to: date
+    project_id: Optional[int] = None
+    task_id: Optional[int] = None
+    productive: Optional[bool] = None  # None - все записи
+    order: str = 'start_desc'  # ключ RECORD_ORDERS
+    limit: Optional[int] = None
+    offset: int = 0
@@ -0,0 +1,262 @@
+import logging
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+
+from database import Database
+from sessions import Session
+from settings import Settings
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+WORK = 'work'
+SHORT_BREAK = 'short_break'
+LONG_BREAK = 'long_break'
+
+PHASE_NAMES = {
+    WORK: "Работа",
+    SHORT_BREAK: "Перерыв",
+    LONG_BREAK: "Длинный перерыв",
+}
+
+
+@dataclass
+class IntervalPlan:
+    """План работы: циклы работа/перерыв, длинный перерыв каждые N циклов"""
+    name: str
+    work_minutes: int = 25
+    short_break_minutes: int = 5
+    long_break_minutes: int = 15
+    long_break_every: int = 4
+
+    @classmethod
+    def from_settings(cls, name: str, data: dict) -> 'IntervalPlan':
+        return cls(
+            name=name,
+            work_minutes=int(data.get('work_minutes', 25)),
+            short_break_minutes=int(data.get('short_break_minutes', 5)),
+            long_break_minutes=int(data.get('long_break_minutes', 15)),
+            long_break_every=max(int(data.get('long_break_every', 4)), 1)
+        )
+
+    def phase_seconds(self, phase: str) -> int:
+        minutes = {
+            WORK: self.work_minutes,
+            SHORT_BREAK: self.short_break_minutes,
+            LONG_BREAK: self.long_break_minutes,
+        }[phase]
+        return minutes * 60
+
+    def next_phase(self, phase: str, cycle: int) -> str:
+        """Фаза после текущей; cycle - число завершённых рабочих фаз"""
+        if phase != WORK:
+            return WORK
+        return LONG_BREAK if cycle % self.long_break_every == 0 else SHORT_BREAK
+
+
+@dataclass
+class PlanRun:
+    """Состояние плана для одной сессии"""
+    task_id: int
+    plan: IntervalPlan
+    phase: str = WORK
+    cycle: int = 0
+    phase_started: float = 0.0
+    deadline: Optional[float] = None  # None - план на паузе
+    remaining: float = 0.0  # остаток фазы на паузе, секунды
+
+    def to_state(self) -> dict:
+        state = asdict(self)
+        state['plan'] = self.plan.name
+        return state
+
+
+class PlanEngine(QObject):
+    """
+    Ведёт таймеры сессий по фазам плана.
+
+    Для всех планов используется один точный однократный QTimer, который
+    заводится на ближайший срок смены фазы. Рабочая фаза сохраняется в
+    time_records через очередь записей (Spool), каждая фаза (включая
+    перерывы) - в таблицу phases.
+    Состояние планов хранится в БД и восстанавливается при запуске.
+    """
+
+    phase_changed = pyqtSignal(int, str)  # task_id, новая фаза
+    # Рабочая фаза не записана: план остановлен, время осталось в таймере сессии
+    record_failed = pyqtSignal(int, str)  # task_id, текст ошибки
+
+    def __init__(self, db: Database, settings: Settings, spool: Spool, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.spool = spool
+        self.settings = settings
+        self.runs: Dict[int, PlanRun] = {}
+        self.sessions: Dict[int, Session] = {}
+
+        self._deadline_timer = QTimer(self)
+        self._deadline_timer.setSingleShot(True)
+        self._deadline_timer.setTimerType(Qt.PreciseTimer)
+        self._deadline_timer.timeout.connect(self._on_deadline)
+
+    def plan_for_project(self, project_id: Optional[int]) -> IntervalPlan:
+        name = self.settings.project_plans.get(str(project_id), self.settings.default_plan)
+        if name not in self.settings.plans:
+            name = self.settings.default_plan
+        return IntervalPlan.from_settings(name, self.settings.plans.get(name, {}))
+
+    def run_for(self, task_id: int) -> Optional[PlanRun]:
+        return self.runs.get(task_id)
+
+    def start(self, session: Session, plan: IntervalPlan) -> PlanRun:
+        """
+        Запускает план для сессии с рабочей фазы. Уже накопленное время
+        сессии не сбрасывается и войдёт в запись первой рабочей фазы.
+        """
+        run = PlanRun(task_id=session.task_id, plan=plan)
+        self.runs[session.task_id] = run
+        self.sessions[session.task_id] = session
+        session.plan_driven = True
+        self._begin_phase(run, WORK)
+        return run
+
+    def pause(self, task_id: int):
+        run = self.runs.get(task_id)
+        if run is None or run.deadline is None:
+            return
+        run.remaining = max(run.deadline - time.time(), 0.0)
+        run.deadline = None
+        self.sessions[task_id].timer.pause()
+        self._save(run)
+        self._schedule()
+
+    def resume(self, task_id: int):
+        run = self.runs.get(task_id)
+        if run is None or run.deadline is not None:
+            return
+        run.deadline = time.time() + run.remaining
+        if run.phase == WORK:
+            self.sessions[task_id].timer.start()
+        self._save(run)
+        self._schedule()
+
+    def stop(self, task_id: int):
+        """
+        Останавливает план. Незавершённый перерыв записывается в phases,
+        незавершённая работа остаётся в таймере сессии для обычного сохранения.
+        """
+        run = self.runs.pop(task_id, None)
+        session = self.sessions.pop(task_id, None)
+        if run is None:
+            return
+        if session:
+            session.plan_driven = False
+            session.timer.pause()
+        if run.phase != WORK:
+            self._record_phase(run, time.time())
+        self.db.delete_plan_state(task_id)
+        self._schedule()
+
+    def restore(self, session_factory):
+        """
+        Восстанавливает планы, сохранённые в БД. session_factory(task_id)
+        возвращает сессию для задачи. Планы восстанавливаются на паузе.
+        """
+        for task_id, state in self.db.get_plan_states().items():
+            session = session_factory(task_id)
+            if session is None:
+                self.db.delete_plan_state(task_id)
+                continue
+            plan = IntervalPlan.from_settings(state['plan'], self.settings.plans.get(state['plan'], {}))
+            remaining = state['remaining']
+            if state['deadline'] is not None:
+                remaining = max(state['deadline'] - time.time(), 0.0)
+            run = PlanRun(task_id=task_id, plan=plan, phase=state['phase'], cycle=state['cycle'],
+                          phase_started=state['phase_started'], deadline=None,
+                          remaining=remaining)
+            self.runs[task_id] = run
+            self.sessions[task_id] = session
+            session.plan_driven = True
+            self._save(run)
+
+    def describe(self, task_id: int) -> str:
+        run = self.runs.get(task_id)
+        if run is None:
+            return ""
+        left = run.remaining if run.deadline is None else max(run.deadline - time.time(), 0)
+        mins, secs = divmod(int(left), 60)
+        return f"{PHASE_NAMES[run.phase]} (цикл {run.cycle + 1}), осталось {mins:02d}:{secs:02d}"
+
+    def _begin_phase(self, run: PlanRun, phase: str):
+        now = time.time()
+        run.phase = phase
+        run.phase_started = now
+        run.deadline = now + run.plan.phase_seconds(phase)
+        run.remaining = 0.0
+        if phase == WORK:
+            self.sessions[run.task_id].timer.start()
+        self._save(run)
+        self._schedule()
+        self.phase_changed.emit(run.task_id, phase)
+
+    def _finish_phase(self, run: PlanRun):
+        now = time.time()
+        session = self.sessions[run.task_id]
+        if run.phase == WORK:
+            session.timer.pause()
+            elapsed = session.timer.get_elapsed_time()
+            if elapsed > 0:
+                # Сначала запись в очередь на диске, потом сброс: при ошибке
+                # время остаётся в таймере
+                start_time, end_time = session.timer.interval(elapsed)
+                self.spool.append(run.task_id, start_time, end_time, elapsed, True)
+            session.timer.reset()
+            run.cycle += 1
+        self._record_phase(run, now)
+        self._begin_phase(run, run.plan.next_phase(run.phase, run.cycle))
+
+    def _record_phase(self, run: PlanRun, end: float):
+        if end > run.phase_started:
+            self.db.add_phase(run.task_id, run.phase, datetime.fromtimestamp(run.phase_started),
+                              datetime.fromtimestamp(end))
+
+    def _save(self, run: PlanRun):
+        self.db.save_plan_state(run.task_id, run.to_state())
+
+    def _schedule(self):
+        deadlines = [r.deadline for r in self.runs.values() if r.deadline is not None]
+        if not deadlines:
+            self._deadline_timer.stop()
+            return
+        delay_ms = max(int((min(deadlines) - time.time()) * 1000), 0)
+        self._deadline_timer.start(delay_ms)
+
+    def _on_deadline(self):
+        now = time.time()
+        for run in list(self.runs.values()):
+            # Небольшой допуск на точность таймера
+            if run.deadline is not None and run.deadline <= now + 0.005:
+                try:
+                    self._finish_phase(run)
+                except Exception as e:
+                    # Слот таймера Qt: исключение не должно уйти в цикл событий
+                    logger.exception("Не удалось завершить фазу плана", extra={'task_id': run.task_id})
+                    self._abort(run.task_id, str(e))
+        self._schedule()
+
+    def _abort(self, task_id: int, message: str):
+        """Останавливает план после ошибки записи; несохранённое время остаётся в сессии"""
+        try:
+            self.stop(task_id)
+        except Exception:
+            logger.exception("Не удалось остановить план", extra={'task_id': task_id})
+            self.runs.pop(task_id, None)
+            session = self.sessions.pop(task_id, None)
+            if session:
+                session.plan_driven = False
+                session.timer.pause()
+        self.record_failed.emit(task_id, message)
@@ -0,0 +1,367 @@
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTabWidget, QTableWidget,
+                             QTableWidgetItem, QPushButton, QCheckBox, QFileDialog, QMessageBox,
+                             QHeaderView)
+
+STALL_CHECK_MS = 50
+# Методы Database, которые не замеряются (служебные и контекстные менеджеры)
+SKIP_DB_METHODS = {'add_listener', 'remove_listener', 'transaction', 'batch', 'close'}
+
+
+@dataclass
+class ProfileEvent:
+    kind: str  # 'db', 'sql', 'ui', 'stall'
+    name: str
+    start: float  # time.perf_counter()
+    duration: float  # секунды
+    rows: Optional[int] = None
+    thread: int = 0
+    parent: str = ''
+
+
+class _Call:
+    """Вызов метода Database, к которому привязываются выполненные SQL-запросы"""
+    __slots__ = ('name', 'statement', 'started', 'conn', 'changes')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statement = None
+
+
+def _row_count(result) -> Optional[int]:
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    if isinstance(result, bool):
+        return int(result)
+    return None
+
+
+class Profiler:
+    """
+    Сбор замеров в кольцевой буфер.
+
+    Пока профилирование выключено, ничего не установлено: методы Database
+    не обёрнуты, трассировка SQL и проверка зависаний не работают, а
+    декоратор timed сводится к проверке одного флага.
+    """
+
+    def __init__(self, capacity: int = 10000, stall_threshold_ms: int = 100):
+        self.events = deque(maxlen=capacity)
+        self.stall_threshold_ms = stall_threshold_ms
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self._db = None
+        self._wrapped: List[str] = []
+        self._local = threading.local()
+        self._stall_timer: Optional[QTimer] = None
+        self._last_check = 0.0
+
+    def configure(self, capacity: int, stall_threshold_ms: int):
+        if capacity != self.events.maxlen:
+            self.events = deque(self.events, maxlen=capacity)
+        self.stall_threshold_ms = stall_threshold_ms
+
+    def record(self, kind: str, name: str, start: float, duration: float,
+               rows: Optional[int] = None, parent: str = ''):
+        # deque.append потокобезопасен: события пишутся и из потоков API/сервера
+        self.events.append(ProfileEvent(kind, name, start, duration, rows,
+                                        threading.get_ident(), parent))
+
+    def clear(self):
+        self.events.clear()
+
+    # Включение и выключение
+    def enable(self, db=None):
+        if self.enabled:
+            return
+        self.enabled = True
+        if db is not None:
+            self._instrument_database(db)
+        self._start_stall_detector()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._db is not None:
+            for name in self._wrapped:
+                # Удаляем обёртку экземпляра - снова вызывается метод класса
+                delattr(self._db, name)
+            pool = self._db.pool
+            pool.__dict__.pop('_connect_reader', None)
+            for conn in self._connections(pool):
+                conn.set_trace_callback(None)
+        self._db = None
+        self._wrapped = []
+        if self._stall_timer is not None:
+            self._stall_timer.stop()
+            self._stall_timer = None
+
+    # Database: время методов и SQL-запросов
+    def _instrument_database(self, db):
+        self._db = db
+        for name in dir(type(db)):
+            if name.startswith('_') or name in SKIP_DB_METHODS:
+                continue
+            if not callable(getattr(type(db), name)):
+                continue
+            setattr(db, name, self._wrap_db_method(name, getattr(db, name)))
+            self._wrapped.append(name)
+
+        pool = db.pool
+        for conn in self._connections(pool):
+            self._trace(conn)
+        connect_reader = pool._connect_reader
+
+        def traced_reader():
+            conn = connect_reader()
+            self._trace(conn)
+            return conn
+        pool._connect_reader = traced_reader
+
+    @staticmethod
+    def _connections(pool) -> list:
+        return [pool.writer] + list(pool._readers.queue)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _wrap_db_method(self, name: str, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            call = _Call(name)
+            stack = self._stack()
+            stack.append(call)
+            start = time.perf_counter()
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            finally:
+                end = time.perf_counter()
+                stack.pop()
+                self._finish_statement(call, end)
+                self.record('db', name, start, end - start, _row_count(result))
+        return wrapper
+
+    def _trace(self, conn):
+        conn.set_trace_callback(lambda statement, c=conn: self._on_statement(c, statement))
+
+    def _on_statement(self, conn, statement: str):
+        now = time.perf_counter()
+        stack = self._stack()
+        if not stack:
+            # Запрос вне методов Database (например, из отчёта или бенчмарка)
+            self.record('sql', _normalize(statement), now, 0.0)
+            return
+        call = stack[-1]
+        # Длительность запроса - до начала следующего запроса или конца метода
+        self._finish_statement(call, now)
+        call.statement = _normalize(statement)
+        call.started = now
+        call.conn = conn
+        call.changes = conn.total_changes
+
+    def _finish_statement(self, call: _Call, end: float):
+        if call.statement is None:
+            return
+        rows = None
+        if not call.statement.upper().startswith(('SELECT', 'PRAGMA', 'BEGIN', 'COMMIT', 'SAVEPOINT',
+                                                   'RELEASE', 'ROLLBACK')):
+            rows = call.conn.total_changes - call.changes
+        self.record('sql', call.statement, call.started, end - call.started, rows, call.name)
+        call.statement = None
+
+    # Зависания цикла событий: проверочный таймер срабатывает с опозданием
+    def _start_stall_detector(self):
+        self._stall_timer = QTimer()
+        self._stall_timer.setTimerType(Qt.PreciseTimer)
+        self._stall_timer.timeout.connect(self._check_stall)
+        self._last_check = time.perf_counter()
+        self._stall_timer.start(STALL_CHECK_MS)
+
+    def _check_stall(self):
+        now = time.perf_counter()
+        late_ms = (now - self._last_check) * 1000 - STALL_CHECK_MS
+        if late_ms > self.stall_threshold_ms:
+            self.record('stall', "Цикл событий", self._last_check + STALL_CHECK_MS / 1000,
+                        late_ms / 1000)
+        self._last_check = now
+
+    # Отчёты
+    def summary(self) -> List[dict]:
+        """Сводка по именам: число вызовов, суммарное, среднее и максимальное время"""
+        groups = {}
+        for event in list(self.events):
+            key = (event.kind, event.name)
+            group = groups.setdefault(key, {'kind': event.kind, 'name': event.name, 'count': 0,
+                                            'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0})
+            ms = event.duration * 1000
+            group['count'] += 1
+            group['total_ms'] += ms
+            group['max_ms'] = max(group['max_ms'], ms)
+            group['rows'] += event.rows or 0
+        for group in groups.values():
+            group['mean_ms'] = group['total_ms'] / group['count']
+        return sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)
+
+    def export(self, path: str):
+        """
+        Сохраняет буфер в формате Chrome Trace Event (открывается в
+        chrome://tracing или ui.perfetto.dev)
+        """
+        pid = os.getpid()
+        trace = []
+        for event in list(self.events):
+            args = {}
+            if event.rows is not None:
+                args['rows'] = event.rows
+            if event.parent:
+                args['method'] = event.parent
+            trace.append({
+                'name': event.name,
+                'cat': event.kind,
+                'ph': 'X',
+                'ts': round((event.start - self.origin) * 1e6, 1),
+                'dur': round(event.duration * 1e6, 1),
+                'pid': pid,
+                'tid': event.thread,
+                'args': args,
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def _normalize(statement: str) -> str:
+    """Текст запроса без значений параметров, чтобы одинаковые запросы группировались"""
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return re.sub(r'\s+', ' ', statement).strip()[:200]
+
+
+profiler = Profiler()
+
+
+def timed(func):
+    """Замеряет метод обновления интерфейса, если профилирование включено"""
+    name = func.__qualname__
+    # Как и PyQt для слотов, отбрасываем лишние аргументы сигнала
+    code = func.__code__
+    max_args = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if max_args is not None:
+            args = args[:max_args]
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.record('ui', name, start, time.perf_counter() - start)
+    return wrapper
+
+
+class DiagnosticsDialog(QDialog):
+    """Скрытая панель диагностики (Ctrl+Shift+D): сводка и последние события"""
+
+    MAX_ROWS = 500
+
+    def __init__(self, db, settings, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.settings = settings
+        self.setWindowTitle("Диагностика")
+        self.resize(900, 500)
+
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        self.enabled_checkbox = QCheckBox("Профилирование включено")
+        self.enabled_checkbox.setChecked(profiler.enabled)
+        self.enabled_checkbox.toggled.connect(self.set_enabled)
+        controls.addWidget(self.enabled_checkbox)
+        controls.addStretch()
+        for title, slot in (("Обновить", self.refresh), ("Очистить", self.clear),
+                            ("Экспорт...", self.export)):
+            button = QPushButton(title)
+            button.clicked.connect(slot)
+            controls.addWidget(button)
+        layout.addLayout(controls)
+
+        tabs = QTabWidget()
+        self.summary_table = self._table(["Тип", "Имя", "Вызовов", "Всего, мс", "Среднее, мс",
+                                          "Макс, мс", "Строк"])
+        self.events_table = self._table(["Тип", "Имя", "Начало, с", "Длительность, мс", "Строк",
+                                         "Метод"])
+        tabs.addTab(self.summary_table, "Сводка")
+        tabs.addTab(self.events_table, "События")
+        layout.addWidget(tabs)
+
+        # Пока панель открыта, данные обновляются раз в секунду
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    @staticmethod
+    def _table(headers) -> QTableWidget:
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        return table
+
+    def set_enabled(self, enabled: bool):
+        if enabled:
+            profiler.enable(self.db)
+        else:
+            profiler.disable()
+        self.settings.profiling_enabled = enabled
+        self.settings.save()
+
+    def clear(self):
+        profiler.clear()
+        self.refresh()
+
+    def refresh(self):
+        summary = profiler.summary()
+        self.summary_table.setRowCount(len(summary))
+        for row, group in enumerate(summary):
+            values = (group['kind'], group['name'], group['count'], f"{group['total_ms']:.2f}",
+                      f"{group['mean_ms']:.3f}", f"{group['max_ms']:.2f}", group['rows'] or '')
+            for col, value in enumerate(values):
+                self.summary_table.setItem(row, col, QTableWidgetItem(str(value)))
+
+        events = list(profiler.events)[-self.MAX_ROWS:][::-1]
+        self.events_table.setRowCount(len(events))
+        for row, event in enumerate(events):
+            values = (event.kind, event.name, f"{event.start - profiler.origin:.3f}",
+                      f"{event.duration * 1000:.3f}", '' if event.rows is None else event.rows,
+                      event.parent)
+            for col, value in enumerate(values):
+                self.events_table.setItem(row, col, QTableWidgetItem(str(value)))
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт профиля", "profile.json",
+                                              "Chrome Trace (*.json)")
+        if not path:
+            return
+        try:
+            profiler.export(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить профиль: {str(e)}")
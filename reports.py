@@ -0,0 +1,350 @@
+import csv
+import html
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from analytics import Analytics, RecordColumns, index_to_date
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMATS = {'.html': 'html', '.htm': 'html', '.csv': 'csv', '.pdf': 'pdf'}
+WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+
+@dataclass
+class TimesheetEntry:
+    """Время по задаче за один день"""
+    day: date
+    project: str
+    task: str
+    productive: int  # секунды
+    unproductive: int
+
+    @property
+    def total(self) -> int:
+        return self.productive + self.unproductive
+
+
+@dataclass
+class Timesheet:
+    """Табель за период: записи по дням и итоги по задачам"""
+    title: str
+    date_from: date
+    date_to: date
+    entries: List[TimesheetEntry] = field(default_factory=list)
+    task_totals: List[TimesheetEntry] = field(default_factory=list)  # day = date_from
+
+    @property
+    def productive(self) -> int:
+        return sum(e.productive for e in self.task_totals)
+
+    @property
+    def unproductive(self) -> int:
+        return sum(e.unproductive for e in self.task_totals)
+
+    @property
+    def total(self) -> int:
+        return self.productive + self.unproductive
+
+    def days(self) -> Dict[date, List[TimesheetEntry]]:
+        grouped: Dict[date, List[TimesheetEntry]] = {}
+        for entry in self.entries:
+            grouped.setdefault(entry.day, []).append(entry)
+        return grouped
+
+
+def period_bounds(period: str, reference: Optional[date] = None) -> Tuple[date, date]:
+    """Границы недели (пн-вс) или календарного месяца, содержащих reference"""
+    reference = reference or date.today()
+    if period == 'week':
+        start = reference - timedelta(days=reference.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'month':
+        start = reference.replace(day=1)
+        following = (start + timedelta(days=32)).replace(day=1)
+        return start, following - timedelta(days=1)
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def format_hours(seconds: int) -> str:
+    """Часы и минуты, как принято в табелях: 7:05"""
+    minutes = int(seconds) // 60
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def build_timesheet(cols: RecordColumns, names: Dict[int, Tuple[str, str]],
+                    date_from: date, date_to: date, title: str = "") -> Timesheet:
+    """
+    Собирает табель из уже отфильтрованных колонок аналитики.
+    names: id задачи -> (название проекта, название задачи).
+    Группировка по (день, задача, продуктивность) выполняется векторно.
+    """
+    sheet = Timesheet(title=title or "Табель", date_from=date_from, date_to=date_to)
+    if not len(cols):
+        return sheet
+
+    def label(task_id: int) -> Tuple[str, str]:
+        return names.get(task_id, ("?", f"#{task_id}"))
+
+    days = cols.days
+    keys = np.stack([days, cols.task_ids, cols.productive.astype(np.int64)], axis=1)
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    sums = np.bincount(inverse.reshape(-1), weights=cols.durations, minlength=len(groups))
+
+    by_day_task: Dict[Tuple[int, int], List[int]] = {}
+    by_task: Dict[int, List[int]] = {}
+    for (day, task_id, productive), seconds in zip(groups.tolist(), sums.tolist()):
+        slot = 0 if productive else 1
+        by_day_task.setdefault((day, task_id), [0, 0])[slot] += int(seconds)
+        by_task.setdefault(task_id, [0, 0])[slot] += int(seconds)
+
+    for (day, task_id), (productive, unproductive) in by_day_task.items():
+        project, task = label(task_id)
+        sheet.entries.append(TimesheetEntry(index_to_date(day), project, task,
+                                            productive, unproductive))
+    sheet.entries.sort(key=lambda e: (e.day, e.project, e.task))
+
+    for task_id, (productive, unproductive) in by_task.items():
+        project, task = label(task_id)
+        sheet.task_totals.append(TimesheetEntry(date_from, project, task, productive, unproductive))
+    sheet.task_totals.sort(key=lambda e: (e.project, e.task))
+    return sheet
+
+
+# Форматы вывода
+def render_csv(sheet: Timesheet) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Дата", "Проект", "Задача", "Продуктивно, с", "Непродуктивно, с",
+                     "Всего, с", "Всего, ч:мм"])
+    for e in sheet.entries:
+        writer.writerow([e.day.isoformat(), e.project, e.task, e.productive, e.unproductive,
+                         e.total, format_hours(e.total)])
+    return out.getvalue()
+
+
+def render_html(sheet: Timesheet) -> str:
+    esc = html.escape
+    parts = [
+        "<html><head><meta charset='utf-8'>",
+        f"<title>{esc(sheet.title)}</title>",
+        "<style>body{font-family:sans-serif;font-size:10pt}"
+        "table{border-collapse:collapse;width:100%;margin-bottom:12pt}"
+        "th,td{border:1px solid #999;padding:2pt 4pt}th{background:#eee}"
+        "td.num{text-align:right}tr.day td{background:#f4f4f4;font-weight:bold}"
+        "tr.total td{font-weight:bold}</style></head><body>",
+        f"<h2>{esc(sheet.title)}</h2>",
+        f"<p>Период: {sheet.date_from.strftime('%d.%m.%Y')} — {sheet.date_to.strftime('%d.%m.%Y')}<br>"
+        f"Всего: {format_hours(sheet.total)} (продуктивно {format_hours(sheet.productive)}, "
+        f"непродуктивно {format_hours(sheet.unproductive)})</p>",
+    ]
+
+    header = ("<tr><th>Проект</th><th>Задача</th><th>Продуктивно</th>"
+              "<th>Непродуктивно</th><th>Всего</th></tr>")
+
+    def row(e: TimesheetEntry, css: str = "") -> str:
+        return (f"<tr class='{css}'><td>{esc(e.project)}</td><td>{esc(e.task)}</td>"
+                f"<td class='num'>{format_hours(e.productive)}</td>"
+                f"<td class='num'>{format_hours(e.unproductive)}</td>"
+                f"<td class='num'>{format_hours(e.total)}</td></tr>")
+
+    parts.append("<h3>Итоги по задачам</h3><table>" + header)
+    parts.extend(row(e) for e in sheet.task_totals)
+    parts.append(row(TimesheetEntry(sheet.date_from, "Итого", "", sheet.productive,
+                                    sheet.unproductive), 'total'))
+    parts.append("</table>")
+
+    parts.append("<h3>По дням</h3><table>" + header)
+    for day, entries in sheet.days().items():
+        productive = sum(e.productive for e in entries)
+        unproductive = sum(e.unproductive for e in entries)
+        parts.append(f"<tr class='day'><td colspan='2'>{day.strftime('%d.%m.%Y')}, "
+                     f"{WEEKDAYS[day.weekday()]}</td>"
+                     f"<td class='num'>{format_hours(productive)}</td>"
+                     f"<td class='num'>{format_hours(unproductive)}</td>"
+                     f"<td class='num'>{format_hours(productive + unproductive)}</td></tr>")
+        parts.extend(row(e) for e in entries)
+    parts.append("</table></body></html>")
+    return "".join(parts)
+
+
+def render_pdf(sheet: Timesheet, path: str):
+    """
+    PDF через QPrinter. Таблицы рисуются напрямую QPainter с разбивкой на
+    страницы: раскладка большого HTML через QTextDocument занимает секунды.
+    Рисование в QPrinter допускается и вне GUI-потока.
+    """
+    from PyQt5.QtCore import QPointF, QRectF, Qt
+    from PyQt5.QtGui import QColor, QFont, QPainter
+    from PyQt5.QtPrintSupport import QPrinter
+
+    printer = QPrinter(QPrinter.HighResolution)
+    printer.setOutputFormat(QPrinter.PdfFormat)
+    printer.setOutputFileName(path)
+    printer.setPageSize(QPrinter.A4)
+    printer.setPageMargins(15, 15, 15, 15, QPrinter.Millimeter)
+    printer.setDocName(sheet.title)
+
+    painter = QPainter()
+    if not painter.begin(printer):
+        raise OSError(f"Не удалось открыть файл {path}")
+    try:
+        page = printer.pageRect(QPrinter.DevicePixel)
+        width, height = page.width(), page.height()
+        font = QFont("Sans Serif", 9)
+        bold = QFont(font)
+        bold.setBold(True)
+        title_font = QFont(font)
+        title_font.setPointSize(14)
+        title_font.setBold(True)
+        painter.setFont(font)
+        line = painter.fontMetrics().height() * 1.5
+        pad = line * 0.2
+        # Проект, задача, продуктивно, непродуктивно, всего
+        fractions = (0.30, 0.34, 0.12, 0.12, 0.12)
+        edges = [0.0]
+        for fraction in fractions:
+            edges.append(edges[-1] + fraction * width)
+        header = ("Проект", "Задача", "Продуктивно", "Непродуктивно", "Всего")
+        y = 0.0
+
+        def new_page_if_needed(needed: float, repeat_header: bool = True):
+            nonlocal y
+            if y + needed > height:
+                printer.newPage()
+                y = 0.0
+                if repeat_header:
+                    cells(header, bold, QColor("#e6e6e6"))
+
+        def text(value: str, used_font: QFont, gap: float = 0.0):
+            nonlocal y
+            painter.setFont(used_font)
+            h = painter.fontMetrics().height() * 1.3
+            new_page_if_needed(h + gap, repeat_header=False)
+            y += gap
+            painter.drawText(QRectF(0, y, width, h), Qt.AlignLeft | Qt.AlignVCenter, value)
+            y += h
+
+        def cells(values, used_font: QFont = font, fill: QColor = None):
+            nonlocal y
+            painter.setFont(used_font)
+            metrics = painter.fontMetrics()
+            if fill is not None:
+                painter.fillRect(QRectF(0, y, width, line), fill)
+            for col, value in enumerate(values):
+                rect = QRectF(edges[col] + pad, y, edges[col + 1] - edges[col] - 2 * pad, line)
+                align = (Qt.AlignLeft if col < 2 else Qt.AlignRight) | Qt.AlignVCenter
+                painter.drawText(rect, align, metrics.elidedText(value, Qt.ElideRight, int(rect.width())))
+            painter.drawLine(QPointF(0, y + line), QPointF(width, y + line))
+            y += line
+
+        def entry_cells(e: TimesheetEntry, used_font: QFont = font, fill: QColor = None):
+            new_page_if_needed(line)
+            cells((e.project, e.task, format_hours(e.productive), format_hours(e.unproductive),
+                   format_hours(e.total)), used_font, fill)
+
+        text(sheet.title, title_font)
+        text(f"Период: {sheet.date_from.strftime('%d.%m.%Y')} — {sheet.date_to.strftime('%d.%m.%Y')}", font)
+        text(f"Всего: {format_hours(sheet.total)} (продуктивно {format_hours(sheet.productive)}, "
+             f"непродуктивно {format_hours(sheet.unproductive)})", font)
+
+        text("Итоги по задачам", bold, gap=line)
+        cells(header, bold, QColor("#e6e6e6"))
+        for e in sheet.task_totals:
+            entry_cells(e)
+        entry_cells(TimesheetEntry(sheet.date_from, "Итого", "", sheet.productive,
+                                   sheet.unproductive), bold)
+
+        text("По дням", bold, gap=line)
+        cells(header, bold, QColor("#e6e6e6"))
+        for day, entries in sheet.days().items():
+            productive = sum(e.productive for e in entries)
+            unproductive = sum(e.unproductive for e in entries)
+            # Заголовок дня не остаётся в конце страницы без записей
+            new_page_if_needed(line * 2)
+            entry_cells(TimesheetEntry(day, f"{day.strftime('%d.%m.%Y')}, {WEEKDAYS[day.weekday()]}",
+                                       "", productive, unproductive), bold, QColor("#f4f4f4"))
+            for e in entries:
+                entry_cells(e)
+    finally:
+        painter.end()
+
+
+def write_report(sheet: Timesheet, path: str):
+    """Сохраняет табель в формате, который определяется расширением файла"""
+    fmt = REPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError("Поддерживаются форматы HTML, PDF и CSV")
+    if fmt == 'pdf':
+        render_pdf(sheet, path)
+        return
+    content = render_html(sheet) if fmt == 'html' else render_csv(sheet)
+    # utf-8-sig, чтобы Excel правильно открыл CSV с кириллицей
+    with open(path, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='') as f:
+        f.write(content)
+
+
+def task_names(db) -> Dict[int, Tuple[str, str]]:
+    names = {}
+    for project in db.get_projects():
+        for task in db.get_tasks_for_project(project.id):
+            names[task.id] = (project.name, task.name)
+    return names
+
+
+def prepare_report(analytics: Analytics, db, date_from: date, date_to: date,
+                   project_id: Optional[int] = None, task_id: Optional[int] = None):
+    """
+    Снимок данных для отчёта (вызывается в GUI-потоке): отфильтрованные
+    колонки из кэша аналитики и названия задач. Дальше отчёт строится и
+    сохраняется без обращения к общему состоянию.
+    """
+    cols = analytics.select(date_from=date_from, date_to=date_to,
+                            project_id=project_id, task_id=task_id)
+    return cols, task_names(db)
+
+
+class ReportSignals(QObject):
+    finished = pyqtSignal(str, float)  # путь, секунды
+    failed = pyqtSignal(str)
+
+
+class ReportJob(QRunnable):
+    """Построение и сохранение отчёта в пуле потоков Qt"""
+
+    def __init__(self, cols: RecordColumns, names: Dict[int, Tuple[str, str]],
+                 date_from: date, date_to: date, title: str, path: str):
+        super().__init__()
+        self.cols = cols
+        self.names = names
+        self.date_from = date_from
+        self.date_to = date_to
+        self.title = title
+        self.path = path
+        self.signals = ReportSignals()
+        # Объект задачи держит вызывающая сторона до получения результата
+        self.setAutoDelete(False)
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            sheet = build_timesheet(self.cols, self.names, self.date_from, self.date_to, self.title)
+            write_report(sheet, self.path)
+        except Exception as e:
+            logger.exception("Ошибка построения отчёта %s", self.path)
+            self.signals.failed.emit(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        logger.info("Отчёт сохранён", extra={'path': self.path, 'seconds': round(elapsed, 3)})
+        self.signals.finished.emit(self.path, elapsed)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
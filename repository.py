@@ -0,0 +1,261 @@
+import os
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.request import pathname2url
+
+from models import Budget, Project, Rate, RecordQuery, Tag, Task, TimeRecord
+
+# Операции хранилища, которые можно вызывать удалённо (team_server.py)
+READ_METHODS = ('get_projects', 'get_tasks_for_project', 'get_task', 'find_task',
+                'get_time_record', 'get_time_record_columns', 'get_change_counter',
+                'find_overlaps', 'get_gaps', 'get_tags', 'get_record_tags',
+                'find_tagged_records', 'get_budgets', 'get_budget_records',
+                'get_rates', 'iter_time_records', 'iter_calendar_records',
+                'query_records')
+WRITE_METHODS = ('add_project', 'update_project', 'delete_project',
+                 'add_task', 'update_task', 'delete_task',
+                 'add_time_record', 'add_time_records', 'update_time_record',
+                 'delete_time_record', 'add_tag', 'delete_tag', 'set_record_tags',
+                 'add_budget', 'delete_budget', 'add_rate', 'delete_rate')
+
+
+class Repository(ABC):
+    """
+    Интерфейс хранилища проектов, задач и записей времени.
+    Реализации: Database (встроенная SQLite) и RemoteRepository
+    (общий сервер команды, см. team_server.py).
+    """
+
+    @abstractmethod
+    def add_listener(self, callback: Callable[[str, object], None]):
+        ...
+
+    @abstractmethod
+    def remove_listener(self, callback: Callable[[str, object], None]):
+        ...
+
+    @abstractmethod
+    def add_project(self, name: str) -> Project:
+        ...
+
+    @abstractmethod
+    def get_projects(self) -> List[Project]:
+        ...
+
+    @abstractmethod
+    def update_project(self, project_id: int, new_name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete_project(self, project_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def add_task(self, project_id: int, name: str) -> Task:
+        ...
+
+    @abstractmethod
+    def get_tasks_for_project(self, project_id: int) -> List[Task]:
+        ...
+
+    @abstractmethod
+    def get_task(self, task_id: int) -> Optional[Task]:
+        ...
+
+    @abstractmethod
+    def find_task(self, project_name: str, task_name: str) -> Optional[Task]:
+        ...
+
+    @abstractmethod
+    def update_task(self, task_id: int, new_name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete_task(self, task_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def add_time_record(self, task_id: int, start_time: datetime, end_time: datetime,
+                        duration_seconds: int, was_productive: bool) -> TimeRecord:
+        ...
+
+    @abstractmethod
+    def add_time_records(self, records: List[tuple]) -> List[TimeRecord]:
+        ...
+
+    @abstractmethod
+    def get_time_record(self, record_id: int) -> Optional[TimeRecord]:
+        ...
+
+    @abstractmethod
+    def update_time_record(self, record_id: int, task_id: int, start_time: datetime,
+                           end_time: datetime, duration_seconds: int, was_productive: bool,
+                           tag_ids: Optional[List[int]] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def delete_time_record(self, record_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def find_overlaps(self, start_time: datetime, end_time: datetime, task_id: int = None,
+                      exclude_id: int = None) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def get_gaps(self, start_time: datetime, end_time: datetime,
+                 min_seconds: int = 0) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def add_tag(self, name: str) -> Tag:
+        ...
+
+    @abstractmethod
+    def get_tags(self) -> List[Tag]:
+        ...
+
+    @abstractmethod
+    def delete_tag(self, tag_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def set_record_tags(self, record_id: int, tag_ids: List[int]) -> bool:
+        ...
+
+    @abstractmethod
+    def get_record_tags(self, record_ids: List[int]) -> Dict[int, List[int]]:
+        ...
+
+    @abstractmethod
+    def find_tagged_records(self, tag_ids: List[int], match_all: bool = True) -> bytes:
+        ...
+
+    @abstractmethod
+    def add_budget(self, project_id: Optional[int], task_id: Optional[int], period: str,
+                   seconds: int) -> Budget:
+        ...
+
+    @abstractmethod
+    def get_budgets(self) -> List[Budget]:
+        ...
+
+    @abstractmethod
+    def delete_budget(self, budget_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def get_budget_records(self) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def add_rate(self, project_id: int, task_id: Optional[int], effective_from: date,
+                 hourly_rate: Decimal) -> Rate:
+        ...
+
+    @abstractmethod
+    def get_rates(self) -> List[Rate]:
+        ...
+
+    @abstractmethod
+    def delete_rate(self, rate_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def iter_time_records(self, date_from: date, date_to: date, project_id: int = None,
+                          chunk_size: int = 1000) -> Iterator[tuple]:
+        ...
+
+    @abstractmethod
+    def iter_calendar_records(self, date_from: date, date_to: date, project_id: int = None,
+                              chunk_size: int = 1000) -> Iterator[tuple]:
+        ...
+
+    @abstractmethod
+    def query_records(self, query: RecordQuery) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def get_time_record_columns(self) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def get_change_counter(self) -> tuple:
+        ...
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Соединения SQLite: одно соединение для записи и пул соединений только
+    для чтения. В режиме WAL читатели не блокируются писателем, поэтому
+    чтение можно выполнять из любых потоков параллельно с записью.
+    Для базы в памяти пула нет - все запросы идут через писателя.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4):
+        self.db_path = db_path
+        self.in_memory = db_path == ':memory:'
+        self.writer = sqlite3.connect(db_path, check_same_thread=False)
+        if not self.in_memory:
+            self.writer.execute('PRAGMA journal_mode=WAL')
+            self.writer.execute('PRAGMA synchronous=NORMAL')
+        self.write_lock = threading.RLock()
+        self._size = 0 if self.in_memory else readers
+        self._readers = queue.Queue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        uri = 'file:' + pathname2url(os.path.abspath(self.db_path)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Соединение для чтения; возвращается в пул после использования"""
+        if not self._size:
+            with self.write_lock:
+                yield self.writer
+            return
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._create_lock:
+                create = self._created < self._size
+                if create:
+                    self._created += 1
+            conn = self._connect_reader() if create else self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writing(self):
+        """Монопольный доступ к соединению для записи"""
+        with self.write_lock:
+            yield self.writer
+
+    def close(self):
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self.writer.close()
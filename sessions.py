@@ -0,0 +1,107 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from timer_logic import Timer
+
+
+@dataclass
+class Session:
+    """Сессия учёта времени по одной задаче"""
+    task_id: int
+    title: str
+    timer: Timer
+    check_interval: int  # секунды работы до проверки
+    plan_driven: bool = False  # сроками управляет план (plans.PlanEngine)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Момент (time.time()), когда сессия дойдёт до проверки"""
+        if not self.timer.is_running:
+            return None
+        return time.time() + self.check_interval - self.timer.get_elapsed_time()
+
+
+class SessionManager:
+    """
+    Хранит несколько одновременно идущих таймеров, по одному на задачу.
+
+    У каждой сессии свой срок проверки, но отдельных QTimer у сессий нет:
+    владелец вызывает tick() из одного общего таймера, и tick() проверяет
+    все запущенные сессии через Timer.check_timer.
+    """
+
+    def __init__(self, on_check: Callable[[Session, int], None],
+                 on_state: Optional[Callable[[Session], None]] = None):
+        self.on_check = on_check
+        self.on_state = on_state  # запуск, пауза или сброс таймера сессии
+        self.sessions: Dict[int, Session] = {}
+        self._checking = False
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, task_id: int) -> Optional[Session]:
+        return self.sessions.get(task_id)
+
+    def add(self, task_id: int, title: str, check_interval: int) -> Session:
+        """Возвращает сессию задачи, создавая её (на паузе) при необходимости"""
+        session = self.sessions.get(task_id)
+        if session is None:
+            session = Session(task_id=task_id, title=title, timer=None,
+                              check_interval=check_interval)
+            session.timer = Timer(lambda elapsed, s=session: self.on_check(s, elapsed),
+                                  lambda s=session: self._state_changed(s))
+            self.sessions[task_id] = session
+        return session
+
+    def start(self, task_id: int, title: str, check_interval: int) -> Session:
+        """Запускает новую сессию или продолжает существующую"""
+        session = self.add(task_id, title, check_interval)
+        session.timer.start()
+        return session
+
+    def pause(self, task_id: int):
+        session = self.sessions.get(task_id)
+        if session:
+            session.timer.pause()
+
+    def _state_changed(self, session: Session):
+        if self.on_state is not None:
+            self.on_state(session)
+
+    def remove(self, task_id: int) -> Optional[Session]:
+        return self.sessions.pop(task_id, None)
+
+    def running(self) -> List[Session]:
+        return [s for s in self.sessions.values() if s.timer.is_running]
+
+    def checked(self) -> List[Session]:
+        """Запущенные сессии, которые проверяются по интервалу"""
+        return [s for s in self.running() if not s.plan_driven]
+
+    def set_check_interval(self, check_interval: int):
+        for session in self.sessions.values():
+            session.check_interval = check_interval
+
+    def next_deadline(self) -> Optional[float]:
+        deadlines = [s.deadline for s in self.checked()]
+        return min(deadlines) if deadlines else None
+
+    def tick(self):
+        """Проверяет все запущенные сессии; вызывается общим таймером"""
+        # Пока открыт диалог проверки одной сессии, остальные ждут своей очереди
+        if self._checking:
+            return
+        self._checking = True
+        try:
+            for session in self.checked():
+                session.timer.check_timer(session.check_interval)
+        finally:
+            self._checking = False
@@ -1,5 +1,41 @@
 import json
+import logging
 import os
+import sys
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLAN_NAME = "Помидор"
+DEFAULT_PLAN = {
+    'work_minutes': 25,
+    'short_break_minutes': 5,
+    'long_break_minutes': 15,
+    'long_break_every': 4
+}
+
+
+def user_data_dir() -> str:
+    """Папка данных пользователя (логи и служебные файлы)"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'desktopTimer')
+
+
+def _valid_level(level) -> bool:
+    return isinstance(logging.getLevelName(str(level).upper()), int)
+
+
+def _valid_time(value, default: str) -> str:
+    """Время в формате ЧЧ:ММ или значение по умолчанию"""
+    try:
+        return datetime.strptime(str(value), '%H:%M').strftime('%H:%M')
+    except ValueError:
+        return default
 
 
 class Settings:
@@ -7,6 +43,51 @@ class Settings:
         self.check_interval = 300  # 5 минут по умолчанию (в секундах)
         self.enable_sound = True
         self.loop_sound = False  # Новая настройка
+        # Планы работы (см. plans.py): название -> параметры плана
+        self.plans = {DEFAULT_PLAN_NAME: dict(DEFAULT_PLAN)}
+        self.default_plan = DEFAULT_PLAN_NAME
+        self.project_plans = {}  # id проекта (строкой) -> название плана
+        # Локальный API (api_server.py); api_socket - путь к Unix-сокету вместо порта
+        self.api_enabled = False
+        self.api_host = '127.0.0.1'
+        self.api_port = 8765
+        self.api_socket = ''
+        self.sync_folder = ''  # общая папка для синхронизации (sync.py)
+        # Профилирование (profiling.py): размер буфера событий и порог зависания
+        self.profiling_enabled = False
+        self.profiling_buffer = 10000
+        self.stall_threshold_ms = 100
+        # Логирование (logging_config.py): общий уровень, уровни модулей
+        # ({"ui": "DEBUG", "database": "WARNING"}) и ротация файлов
+        self.log_level = 'INFO'
+        self.log_levels = {}
+        self.log_max_bytes = 1_000_000
+        self.log_backups = 5
+        # Рабочий день для поиска пропусков (gaps.py): часы, дни недели (0 - понедельник)
+        # и минимальная длина пропуска
+        self.work_start = '09:00'
+        self.work_end = '18:00'
+        self.work_days = [0, 1, 2, 3, 4]
+        self.gap_min_minutes = 15
+        # Резервные копии (backup.py): папка (пусто - папка данных пользователя),
+        # число хранимых поколений и период автоматического копирования (0 - выкл.)
+        self.backup_folder = ''
+        self.backup_keep = 10
+        self.backup_interval_hours = 24
+        # Счета (billing.py): округление вверх до billing_round_minutes
+        # для каждой записи ('record'), за день по задаче ('day') или без него ('none')
+        self.billing_rounding = 'record'
+        self.billing_round_minutes = 15
+        # Импорт календаря (ical.py): правила {"pattern", "field", "project", "task",
+        # "productive"} и проект для событий без подходящего правила (пусто - пропускать)
+        self.ical_rules = []
+        self.ical_default_project = 'Календарь'
+        # Закрытие окна сворачивает таймер в системный трей (tray.py)
+        self.tray_enabled = False
+        # База в памяти (database.open_database): снимок в файл раз в
+        # db_snapshot_seconds (0 - только при выходе); нужен перезапуск
+        self.db_in_memory = False
+        self.db_snapshot_seconds = 60
         self.load()
 
     def save(self):
@@ -14,7 +95,36 @@ class Settings:
             json.dump({
                 'check_interval': self.check_interval,
                 'enable_sound': self.enable_sound,
-                'loop_sound': self.loop_sound  # Добавляем новую настройку
+                'loop_sound': self.loop_sound,  # Добавляем новую настройку
+                'plans': self.plans,
+                'default_plan': self.default_plan,
+                'project_plans': self.project_plans,
+                'api_enabled': self.api_enabled,
+                'api_host': self.api_host,
+                'api_port': self.api_port,
+                'api_socket': self.api_socket,
+                'sync_folder': self.sync_folder,
+                'profiling_enabled': self.profiling_enabled,
+                'profiling_buffer': self.profiling_buffer,
+                'stall_threshold_ms': self.stall_threshold_ms,
+                'log_level': self.log_level,
+                'log_levels': self.log_levels,
+                'log_max_bytes': self.log_max_bytes,
+                'log_backups': self.log_backups,
+                'work_start': self.work_start,
+                'work_end': self.work_end,
+                'work_days': self.work_days,
+                'gap_min_minutes': self.gap_min_minutes,
+                'backup_folder': self.backup_folder,
+                'backup_keep': self.backup_keep,
+                'backup_interval_hours': self.backup_interval_hours,
+                'billing_rounding': self.billing_rounding,
+                'billing_round_minutes': self.billing_round_minutes,
+                'ical_rules': self.ical_rules,
+                'ical_default_project': self.ical_default_project,
+                'tray_enabled': self.tray_enabled,
+                'db_in_memory': self.db_in_memory,
+                'db_snapshot_seconds': self.db_snapshot_seconds
             }, f)
 
     def load(self):
@@ -26,12 +136,82 @@ class Settings:
                     self.check_interval = int(data.get('check_interval', 300))
                     self.enable_sound = bool(data.get('enable_sound', True))
                     self.loop_sound = bool(data.get('loop_sound', False))
+                    self.plans = {str(name): dict(plan) for name, plan in
+                                  data.get('plans', {DEFAULT_PLAN_NAME: DEFAULT_PLAN}).items()}
+                    self.default_plan = str(data.get('default_plan', DEFAULT_PLAN_NAME))
+                    self.project_plans = {str(k): str(v) for k, v in
+                                          data.get('project_plans', {}).items()}
+                    self.api_enabled = bool(data.get('api_enabled', False))
+                    self.api_host = str(data.get('api_host', '127.0.0.1'))
+                    self.api_port = int(data.get('api_port', 8765))
+                    self.api_socket = str(data.get('api_socket', ''))
+                    self.sync_folder = str(data.get('sync_folder', ''))
+                    self.profiling_enabled = bool(data.get('profiling_enabled', False))
+                    self.profiling_buffer = max(int(data.get('profiling_buffer', 10000)), 100)
+                    self.stall_threshold_ms = int(data.get('stall_threshold_ms', 100))
+                    log_level = str(data.get('log_level', 'INFO')).upper()
+                    self.log_level = log_level if _valid_level(log_level) else 'INFO'
+                    self.log_levels = {str(k): str(v).upper() for k, v in
+                                       data.get('log_levels', {}).items() if _valid_level(v)}
+                    self.log_max_bytes = int(data.get('log_max_bytes', 1_000_000))
+                    self.log_backups = int(data.get('log_backups', 5))
+                    self.work_start = _valid_time(data.get('work_start'), '09:00')
+                    self.work_end = _valid_time(data.get('work_end'), '18:00')
+                    self.work_days = sorted({int(d) for d in data.get('work_days', [0, 1, 2, 3, 4])
+                                             if 0 <= int(d) <= 6})
+                    self.gap_min_minutes = max(int(data.get('gap_min_minutes', 15)), 1)
+                    self.backup_folder = str(data.get('backup_folder', ''))
+                    self.backup_keep = max(int(data.get('backup_keep', 10)), 1)
+                    self.backup_interval_hours = max(int(data.get('backup_interval_hours', 24)), 0)
+                    billing_rounding = str(data.get('billing_rounding', 'record'))
+                    self.billing_rounding = (billing_rounding if billing_rounding in
+                                             ('record', 'day', 'none') else 'record')
+                    self.billing_round_minutes = max(int(data.get('billing_round_minutes', 15)), 1)
+                    self.ical_rules = [dict(rule) for rule in data.get('ical_rules', [])
+                                       if isinstance(rule, dict) and 'pattern' in rule]
+                    self.ical_default_project = str(data.get('ical_default_project', 'Календарь'))
+                    self.tray_enabled = bool(data.get('tray_enabled', False))
+                    self.db_in_memory = bool(data.get('db_in_memory', False))
+                    self.db_snapshot_seconds = max(int(data.get('db_snapshot_seconds', 60)), 0)
+                    if not self.plans:
+                        self.plans = {DEFAULT_PLAN_NAME: dict(DEFAULT_PLAN)}
+                    if self.default_plan not in self.plans:
+                        self.default_plan = next(iter(self.plans))
             else:
                 self.save()
         except Exception as e:
-            print(f"Ошибка загрузки настроек: {repr(e)}")
+            logger.error("Ошибка загрузки настроек: %r", e)
             # Установим значения по умолчанию
             self.check_interval = 300
             self.enable_sound = True
             self.loop_sound = False
-            self.save()
\ No newline at end of file
+            self.plans = {DEFAULT_PLAN_NAME: dict(DEFAULT_PLAN)}
+            self.default_plan = DEFAULT_PLAN_NAME
+            self.project_plans = {}
+            self.api_enabled = False
+            self.api_host = '127.0.0.1'
+            self.api_port = 8765
+            self.api_socket = ''
+            self.sync_folder = ''
+            self.profiling_enabled = False
+            self.profiling_buffer = 10000
+            self.stall_threshold_ms = 100
+            self.log_level = 'INFO'
+            self.log_levels = {}
+            self.log_max_bytes = 1_000_000
+            self.log_backups = 5
+            self.work_start = '09:00'
+            self.work_end = '18:00'
+            self.work_days = [0, 1, 2, 3, 4]
+            self.gap_min_minutes = 15
+            self.backup_folder = ''
+            self.backup_keep = 10
+            self.backup_interval_hours = 24
+            self.billing_rounding = 'record'
+            self.billing_round_minutes = 15
+            self.ical_rules = []
+            self.ical_default_project = 'Календарь'
+            self.tray_enabled = False
+            self.db_in_memory = False
+            self.db_snapshot_seconds = 60
+            self.save()
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Ожидание блокировки при обычной работе с базой (sqlite3.connect по умолчанию)
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+# Повторы при занятой или недоступной базе: от MIN до MAX с удвоением
+RETRY_MIN_MS = 500
+RETRY_MAX_MS = 30000
+BATCH_SIZE = 100
+# Ошибки, с которыми запись не сохранится и при повторе (пересечение -
+# OverlapError, битая строка очереди): запись откладывается в файл
+# отвергнутых, чтобы не блокировать очередь. OperationalError (база занята)
+# сюда не относится - его обрабатывает повтор
+REJECT_ERRORS = (sqlite3.Error, ValueError, KeyError, TypeError)
+
+
+class Spool(QObject):
+    """
+    Очередь записей времени на диске перед записью в базу.
+
+    append() дописывает строку JSON в файл и делает fsync - после этого
+    запись не потеряется, даже если база заблокирована (резервное
+    копирование, другой процесс) или приложение упадёт. Выгрузка в базу
+    идёт пачками по таймеру цикла событий с нулевым ожиданием блокировки:
+    занятая база не задерживает окно, а выгрузка повторяется с удвоением
+    паузы. uid записи в очереди становится uid строки в time_records,
+    поэтому повторная выгрузка после сбоя ничего не дублирует.
+    """
+
+    flushed = pyqtSignal(int)  # сколько записей попало в базу
+    rejected = pyqtSignal(str)  # запись не может быть сохранена (пересечение и т.п.)
+
+    def __init__(self, db: Database, path: Optional[str] = None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.path = path or os.path.splitext(db.db_path)[0] + '.spool'
+        # Записи, которые база отвергла, откладываются сюда для ручного разбора
+        self.rejected_path = self.path + '.rejected'
+        self._lock = threading.Lock()
+        self._retry_ms = RETRY_MIN_MS
+        # База в памяти переживает сбой только в снимке на диске, поэтому
+        # выгруженные в неё записи остаются в очереди до снимка:
+        # uid -> total_changes соединения записи после вставки
+        self._unsaved: Dict[str, int] = {}
+        if db.in_memory:
+            db.add_snapshot_listener(self._on_snapshot)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def append(self, task_id: int, start_time: datetime, end_time: datetime,
+               duration_seconds: int, was_productive: bool, tag_ids: List[int] = None) -> str:
+        """Надёжно сохраняет запись в очереди и планирует выгрузку; возвращает uid"""
+        entry = {
+            'uid': uuid.uuid4().hex,
+            'task_id': task_id,
+            'start_time': start_time.isoformat(timespec='seconds'),
+            'end_time': end_time.isoformat(timespec='seconds'),
+            'duration_seconds': duration_seconds,
+            'was_productive': bool(was_productive),
+            'tags': list(tag_ids or []),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        self._timer.start(0)
+        return entry['uid']
+
+    def pending(self) -> List[dict]:
+        """Записи, ещё не выгруженные в базу"""
+        with self._lock:
+            return self._read()
+
+    def _read(self) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                # Недописанная последняя строка (сбой во время записи) пропускается
+                if line.endswith('\n'):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if isinstance(entry, dict):
+                        entries.append(entry)
+                    else:
+                        logger.warning("Повреждённая строка в очереди записей: %r", line[:200])
+        return entries
+
+    def _remove(self, uids: set):
+        """Переписывает очередь без выгруженных записей (атомарная замена файла)"""
+        if not uids:
+            return
+        with self._lock:
+            left = [entry for entry in self._read() if entry.get('uid') not in uids]
+            if not left:
+                os.remove(self.path)
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for entry in left:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    @staticmethod
+    def _record(entry: dict) -> tuple:
+        return (entry['task_id'], datetime.fromisoformat(entry['start_time']),
+                datetime.fromisoformat(entry['end_time']), entry['duration_seconds'],
+                entry['was_productive'], entry['uid'], entry.get('tags'))
+
+    def _insert(self, entries: List[dict]) -> int:
+        """Одна попытка записи без ожидания блокировки базы"""
+        with self.db.pool.writing() as conn:
+            # При synchronous=NORMAL фиксация в WAL может пропасть при сбое
+            # питания, а строки очереди после неё удаляются: здесь нужен FULL
+            synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+            conn.execute('PRAGMA busy_timeout = 0')
+            conn.execute('PRAGMA synchronous = FULL')
+            try:
+                saved = len(self.db.add_time_records([self._record(e) for e in entries]))
+                if self.db.in_memory:
+                    with self._lock:
+                        self._unsaved.update((e['uid'], conn.total_changes) for e in entries)
+                return saved
+            finally:
+                conn.execute(f'PRAGMA synchronous = {synchronous}')
+                conn.execute(f'PRAGMA busy_timeout = {DEFAULT_BUSY_TIMEOUT_MS}')
+
+    def _reject(self, entry: dict, error: Exception):
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(entry, error=str(error)), ensure_ascii=False) + '\n')
+        logger.error("Запись из очереди отклонена базой", extra={'uid': entry.get('uid'),
+                                                                 'error': str(error)})
+        self.rejected.emit(str(error))
+
+    def _retry_later(self):
+        self._timer.start(self._retry_ms)
+        self._retry_ms = min(self._retry_ms * 2, RETRY_MAX_MS)
+
+    def flush(self) -> int:
+        """Выгружает очередь в базу; при ошибке повторяет позже. Возвращает число записей"""
+        saved = 0
+        try:
+            entries = self.pending()
+            with self._lock:
+                # Уже в базе в памяти и ждут снимка
+                entries = [entry for entry in entries if entry.get('uid') not in self._unsaved]
+            while entries:
+                batch = entries[:BATCH_SIZE]
+                rejected = set()
+                try:
+                    saved += self._insert(batch)
+                except sqlite3.OperationalError:
+                    raise
+                except REJECT_ERRORS:
+                    # Пачка отвергнута из-за одной записи - выгружаем по одной
+                    for entry in batch:
+                        try:
+                            saved += self._insert([entry])
+                        except sqlite3.OperationalError:
+                            raise
+                        except REJECT_ERRORS as e:
+                            self._reject(entry, e)
+                            rejected.add(entry.get('uid'))
+                # Из базы в памяти записи уходят из очереди после снимка (_on_snapshot)
+                self._remove(rejected if self.db.in_memory
+                             else {entry.get('uid') for entry in batch})
+                entries = entries[BATCH_SIZE:]
+        except (sqlite3.OperationalError, OSError) as e:
+            # База занята или диск недоступен: запись остаётся в очереди
+            logger.warning("Очередь записей не выгружена, повтор через %d мс: %s", self._retry_ms, e)
+            self._retry_later()
+        except Exception:
+            # Слот таймера Qt: исключение не должно уйти в цикл событий
+            logger.exception("Ошибка выгрузки очереди записей")
+            self._retry_later()
+        else:
+            self._retry_ms = RETRY_MIN_MS
+        if saved:
+            self.flushed.emit(saved)
+        return saved
+
+    def _on_snapshot(self, changes: int):
+        """Снимок базы в памяти на диске: записи, вошедшие в него, больше не нужны"""
+        with self._lock:
+            saved = {uid for uid, after in self._unsaved.items() if after <= changes}
+            for uid in saved:
+                del self._unsaved[uid]
+        try:
+            self._remove(saved)
+        except OSError:
+            # Записи останутся в очереди; повторная выгрузка не дублирует их по uid
+            logger.exception("Не удалось очистить очередь записей после снимка")
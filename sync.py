@@ -0,0 +1,108 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+from database import Database
+
+EXPORT_BATCH = 1000
+
+
+class Transport(ABC):
+    """
+    Способ обмена журналами изменений между устройствами.
+    push() дописывает свои изменения, pull() возвращает изменения других
+    устройств, начиная с сохранённых позиций, и новые позиции.
+    """
+
+    @abstractmethod
+    def push(self, device_id: str, changes: List[dict]):
+        ...
+
+    @abstractmethod
+    def pull(self, device_id: str, positions: Dict[str, int]) -> Tuple[List[dict], Dict[str, int]]:
+        ...
+
+
+class FolderTransport(Transport):
+    """
+    Общая папка (Dropbox, сетевой диск, флешка): каждое устройство пишет
+    только в свой файл <device_id>.jsonl, поэтому одновременная запись с
+    разных устройств не конфликтует. Позиция чтения - смещение в байтах.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, device_id: str) -> str:
+        return os.path.join(self.folder, f"{device_id}.jsonl")
+
+    def push(self, device_id: str, changes: List[dict]):
+        if not changes:
+            return
+        data = ''.join(json.dumps(change, ensure_ascii=False) + '\n' for change in changes)
+        with open(self._path(device_id), 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pull(self, device_id: str, positions: Dict[str, int]) -> Tuple[List[dict], Dict[str, int]]:
+        changes = []
+        new_positions = {}
+        for name in sorted(os.listdir(self.folder)):
+            if not name.endswith('.jsonl'):
+                continue
+            peer = name[:-len('.jsonl')]
+            if peer == device_id:
+                continue
+            position = positions.get(peer, 0)
+            with open(os.path.join(self.folder, name), 'rb') as f:
+                f.seek(position)
+                data = f.read()
+            # Последняя строка может быть ещё недописана - берём только полные
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].splitlines():
+                if line.strip():
+                    changes.append(json.loads(line))
+            if end:
+                new_positions[peer] = position + end
+        return changes, new_positions
+
+
+class SyncEngine:
+    """
+    Синхронизация базы с другими устройствами через журнал изменений.
+    Передаются только изменения, которых у другой стороны ещё нет:
+    свои - после последнего выгруженного номера, чужие - после позиции чтения.
+    """
+
+    def __init__(self, db: Database, transport: Transport):
+        self.db = db
+        self.transport = transport
+
+    def sync(self) -> Tuple[int, int]:
+        """Выгружает свои изменения и применяет чужие; возвращает (выгружено, применено)"""
+        pushed = self.push()
+        return pushed, self.pull()
+
+    def push(self) -> int:
+        exported = int(self.db.get_sync_value('exported_counter', '0'))
+        pushed = 0
+        while True:
+            changes = self.db.get_local_changes(exported, EXPORT_BATCH)
+            if not changes:
+                break
+            self.transport.push(self.db.device_id, changes)
+            exported = changes[-1]['counter']
+            self.db.set_sync_value('exported_counter', str(exported))
+            pushed += len(changes)
+        return pushed
+
+    def pull(self) -> int:
+        changes, positions = self.transport.pull(self.db.device_id, self.db.get_peer_positions())
+        if not positions:
+            return 0
+        # Порядок Лэмпорта сохраняет причинность между устройствами
+        changes.sort(key=lambda c: (c['lamport'], c['device_id'], c['counter']))
+        return self.db.apply_remote_changes(changes, positions)
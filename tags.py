@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+def has_record(bitmap: bytes, record_id: int) -> bool:
+    """Установлен ли бит записи в битовой карте"""
+    byte = record_id >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] >> (record_id & 7) & 1)
+
+
+class TagIndex:
+    """
+    Битовые карты записей по меткам: для каждой метки бит с номером
+    id записи установлен, если запись помечена. Фильтр по нескольким
+    меткам - побитовое И (или ИЛИ) карт, без соединения таблиц в SQL.
+    Карта занимает max(id записи) / 8 байт на метку.
+    """
+
+    def __init__(self, pairs: Iterable[Tuple[int, int]] = ()):
+        self._bitmaps: Dict[int, bytearray] = {}
+        self._by_record: Dict[int, set] = {}
+        for record_id, tag_id in pairs:
+            self.add(record_id, tag_id)
+
+    def add(self, record_id: int, tag_id: int):
+        bitmap = self._bitmaps.setdefault(tag_id, bytearray())
+        byte = record_id >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte - len(bitmap) + 1))
+        bitmap[byte] |= 1 << (record_id & 7)
+        self._by_record.setdefault(record_id, set()).add(tag_id)
+
+    def discard(self, record_id: int):
+        """Снимает с записи все метки"""
+        for tag_id in self._by_record.pop(record_id, ()):
+            bitmap = self._bitmaps[tag_id]
+            bitmap[record_id >> 3] &= ~(1 << (record_id & 7)) & 0xFF
+
+    def set_tags(self, record_id: int, tag_ids: Iterable[int]):
+        self.discard(record_id)
+        for tag_id in tag_ids:
+            self.add(record_id, tag_id)
+
+    def drop_tag(self, tag_id: int):
+        self._bitmaps.pop(tag_id, None)
+        for tags in self._by_record.values():
+            tags.discard(tag_id)
+
+    def tags_of(self, record_id: int) -> List[int]:
+        return sorted(self._by_record.get(record_id, ()))
+
+    def count(self, tag_id: int) -> int:
+        return int.from_bytes(self._bitmaps.get(tag_id, b''), 'little').bit_count()
+
+    def matching(self, tag_ids: Sequence[int], match_all: bool = True) -> bytes:
+        """
+        Битовая карта записей со всеми (match_all) или хотя бы одной из меток.
+        Карты складываются как целые числа - операция над всей картой сразу.
+        """
+        result = None
+        for tag_id in tag_ids:
+            bits = int.from_bytes(self._bitmaps.get(tag_id, b''), 'little')
+            if result is None:
+                result = bits
+            else:
+                result = result & bits if match_all else result | bits
+        if not result:
+            return b''
+        return result.to_bytes((result.bit_length() + 7) // 8, 'little')
@@ -0,0 +1,452 @@
+import asyncio
+import base64
+import hmac
+import json
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional
+
+from database import Database
+from models import Budget, Project, Rate, RecordQuery, Tag, Task, TimeRecord
+from repository import Repository, READ_METHODS, WRITE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Без токена сервер принимает подключения только с этого компьютера
+LOCAL_HOSTS = {'127.0.0.1', 'localhost', '::1'}
+# Общий секрет команды, если он не передан явно
+TOKEN_ENV = 'DESKTOPTIMER_TEAM_TOKEN'
+
+MODELS = {cls.__name__: cls for cls in (Budget, Project, Rate, RecordQuery, Tag, Task,
+                                                   TimeRecord)}
+
+
+def encode(value) -> bytes:
+    """JSON-строка протокола; даты, байты и модели помечаются служебными ключами"""
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {'$dt': obj.isoformat()}
+        if isinstance(obj, date):
+            return {'$date': obj.isoformat()}
+        if isinstance(obj, Decimal):
+            return {'$dec': str(obj)}
+        if isinstance(obj, bytes):
+            return {'$b': base64.b64encode(obj).decode('ascii')}
+        if is_dataclass(obj):
+            return dict(asdict(obj), **{'$model': type(obj).__name__})
+        raise TypeError(f"Не сериализуется: {type(obj).__name__}")
+    return json.dumps(value, ensure_ascii=False, default=default).encode('utf-8') + b'\n'
+
+
+def decode(line: bytes):
+    def hook(obj):
+        if '$dt' in obj:
+            return datetime.fromisoformat(obj['$dt'])
+        if '$date' in obj:
+            return date.fromisoformat(obj['$date'])
+        if '$dec' in obj:
+            return Decimal(obj['$dec'])
+        if '$b' in obj:
+            return base64.b64decode(obj['$b'])
+        if '$model' in obj:
+            return MODELS[obj.pop('$model')](**obj)
+        return obj
+    return json.loads(line, object_hook=hook)
+
+
+class TeamServer:
+    """
+    Общий сервер для команды: много клиентов пишут в одну базу.
+
+    Протокол - строки JSON поверх TCP: запрос {"id", "method", "params"},
+    ответ {"id", "result"} или {"id", "error"}. Чтение выполняется в пуле
+    потоков через соединения только для чтения. Запись от всех клиентов
+    попадает в общую очередь; единственный поток записи забирает из неё
+    пачку (до batch_size операций или batch_window секунд ожидания) и
+    применяет её одной транзакцией, каждую операцию - в своей точке
+    сохранения, чтобы ошибка одного клиента не отменяла чужие записи.
+
+    С token каждый запрос должен содержать тот же общий секрет ("token").
+    Слушать не только локальный адрес без токена нельзя: иначе любой в сети
+    мог бы удалять проекты и записи.
+    """
+
+    def __init__(self, db_path: str = 'db/timer.db', host: str = '127.0.0.1', port: int = 8766,
+                 batch_size: int = 200, batch_window: float = 0.005, readers: int = 4,
+                 token: Optional[str] = None):
+        if not token and host not in LOCAL_HOSTS:
+            raise ValueError(f"Сервер на адресе {host} доступен из сети - задайте токен")
+        self.db_path = db_path
+        self.host = host
+        self.token = token
+        self.port = port
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.db = Database(db_path, readers)
+        self.batches = 0  # число применённых транзакций (для диагностики)
+
+        self._read_executor = ThreadPoolExecutor(readers, thread_name_prefix='team-read')
+        self._write_executor = ThreadPoolExecutor(1, thread_name_prefix='team-write')
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writes: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self.error: Optional[Exception] = None
+
+    # Запуск в отдельном потоке (локальный сервер, тесты)
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="team-server", daemon=True)
+        self._thread.start()
+        self._started.wait(5)
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(5)
+
+    def serve_forever(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._writes = asyncio.Queue()
+        try:
+            server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_client, self.host, self.port))
+            self.port = server.sockets[0].getsockname()[1]
+        except Exception as e:
+            self.error = e
+            self._started.set()
+            return
+
+        self._loop.create_task(self._write_loop())
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.close()
+            self._read_executor.shutdown()
+            self._write_executor.shutdown()
+            self.db.close()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Запросы одного клиента обрабатываются по очереди, ответы - в том же порядке
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = decode(line)
+                    self._check_token(request)
+                    result = await self._dispatch(request['method'], request.get('params', []))
+                    response = {'id': request.get('id'), 'result': result}
+                except Exception as e:
+                    response = {'id': request.get('id'), 'error': f"{type(e).__name__}: {e}"}
+                writer.write(encode(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _check_token(self, request: dict):
+        if not self.token:
+            return
+        token = request.get('token')
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode('utf-8'),
+                                                                 self.token.encode('utf-8')):
+            raise PermissionError("Неверный токен сервера команды")
+
+    async def _dispatch(self, method: str, params: list):
+        if method in READ_METHODS:
+            def read():
+                result = getattr(self.db, method)(*params)
+                # Потоковые выборки (iter_*) отправляются списком
+                return list(result) if isinstance(result, Iterator) else result
+            return await self._loop.run_in_executor(self._read_executor, read)
+        if method in WRITE_METHODS:
+            future = self._loop.create_future()
+            await self._writes.put((method, params, future))
+            return await future
+        raise LookupError(f"Неизвестный метод: {method}")
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._writes.get()]
+            deadline = self._loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                left = deadline - self._loop.time()
+                if left <= 0 and self._writes.empty():
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._writes.get(), max(left, 0)))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await self._loop.run_in_executor(self._write_executor, self._apply_batch,
+                                                            [(m, p) for m, p, _ in batch])
+            except Exception as e:
+                # Не удалось зафиксировать транзакцию - ошибка у всех операций пачки
+                logger.exception("Не удалось применить пачку из %d операций", len(batch))
+                results = [e] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _apply_batch(self, operations: list) -> list:
+        results = []
+        with self.db.batch():
+            for method, params in operations:
+                try:
+                    results.append(getattr(self.db, method)(*params))
+                except Exception as e:
+                    results.append(e)
+        self.batches += 1
+        return results
+
+
+class RemoteError(Exception):
+    """Ошибка, которую вернул сервер команды"""
+
+
+class RemoteRepository(Repository):
+    """Клиент TeamServer с тем же интерфейсом, что и Database"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8766, timeout: float = 10,
+                 token: Optional[str] = None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.token = token
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._listeners: List[Callable[[str, object], None]] = []
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, self.timeout)
+        self._file = self._sock.makefile('rb')
+
+    def _call(self, method: str, *params):
+        with self._lock:
+            self._next_id += 1
+            request = {'id': self._next_id, 'method': method, 'params': list(params)}
+            if self.token:
+                request['token'] = self.token
+            request = encode(request)
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(request)
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("Сервер закрыл соединение")
+                    break
+                except OSError:
+                    # Одна попытка переподключения (сервер перезапущен) - только
+                    # для чтения: запись могла дойти до сервера до обрыва, и
+                    # повтор сохранил бы её дважды
+                    self._close_socket()
+                    if attempt or method not in READ_METHODS:
+                        raise
+        response = decode(line)
+        if 'error' in response:
+            raise RemoteError(response['error'])
+        return response['result']
+
+    def _close_socket(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = None
+        self._file = None
+
+    def add_listener(self, callback: Callable[[str, object], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, object], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, event: str, payload):
+        for callback in list(self._listeners):
+            callback(event, payload)
+
+    def add_project(self, name: str) -> Project:
+        project = self._call('add_project', name)
+        self._notify('catalog_changed', 'project')
+        return project
+
+    def get_projects(self) -> List[Project]:
+        return self._call('get_projects')
+
+    def update_project(self, project_id: int, new_name: str) -> bool:
+        updated = self._call('update_project', project_id, new_name)
+        self._notify('catalog_changed', 'project')
+        return updated
+
+    def delete_project(self, project_id: int) -> bool:
+        deleted = self._call('delete_project', project_id)
+        self._notify('records_changed', None)
+        self._notify('catalog_changed', 'project')
+        return deleted
+
+    def add_task(self, project_id: int, name: str) -> Task:
+        task = self._call('add_task', project_id, name)
+        self._notify('catalog_changed', 'task')
+        return task
+
+    def get_tasks_for_project(self, project_id: int) -> List[Task]:
+        return self._call('get_tasks_for_project', project_id)
+
+    def get_task(self, task_id: int) -> Optional[Task]:
+        return self._call('get_task', task_id)
+
+    def find_task(self, project_name: str, task_name: str) -> Optional[Task]:
+        return self._call('find_task', project_name, task_name)
+
+    def update_task(self, task_id: int, new_name: str) -> bool:
+        updated = self._call('update_task', task_id, new_name)
+        self._notify('catalog_changed', 'task')
+        return updated
+
+    def delete_task(self, task_id: int) -> bool:
+        deleted = self._call('delete_task', task_id)
+        self._notify('records_changed', None)
+        self._notify('catalog_changed', 'task')
+        return deleted
+
+    def add_time_record(self, task_id: int, start_time: datetime, end_time: datetime,
+                        duration_seconds: int, was_productive: bool) -> TimeRecord:
+        record = self._call('add_time_record', task_id, start_time, end_time,
+                            duration_seconds, was_productive)
+        self._notify('record_added', record)
+        return record
+
+    def add_time_records(self, records: List[tuple]) -> List[TimeRecord]:
+        saved = self._call('add_time_records', [list(r) for r in records])
+        if saved:
+            self._notify('records_added', saved)
+        return saved
+
+    def get_time_record(self, record_id: int) -> Optional[TimeRecord]:
+        return self._call('get_time_record', record_id)
+
+    def update_time_record(self, record_id: int, task_id: int, start_time: datetime,
+                           end_time: datetime, duration_seconds: int, was_productive: bool,
+                           tag_ids: Optional[List[int]] = None) -> bool:
+        updated = self._call('update_time_record', record_id, task_id, start_time, end_time,
+                             duration_seconds, was_productive, tag_ids)
+        if updated:
+            self._notify('records_changed', None)
+        return updated
+
+    def find_overlaps(self, start_time: datetime, end_time: datetime, task_id: int = None,
+                      exclude_id: int = None) -> List[tuple]:
+        return [tuple(item) for item in
+                self._call('find_overlaps', start_time, end_time, task_id, exclude_id)]
+
+    def get_gaps(self, start_time: datetime, end_time: datetime,
+                 min_seconds: int = 0) -> List[tuple]:
+        return [tuple(item) for item in self._call('get_gaps', start_time, end_time, min_seconds)]
+
+    def delete_time_record(self, record_id: int) -> bool:
+        deleted = self._call('delete_time_record', record_id)
+        if deleted:
+            self._notify('record_deleted', record_id)
+        return deleted
+
+    def add_tag(self, name: str) -> Tag:
+        tag = self._call('add_tag', name)
+        self._notify('catalog_changed', 'tag')
+        return tag
+
+    def get_tags(self) -> List[Tag]:
+        return self._call('get_tags')
+
+    def delete_tag(self, tag_id: int) -> bool:
+        deleted = self._call('delete_tag', tag_id)
+        if deleted:
+            self._notify('records_changed', None)
+            self._notify('catalog_changed', 'tag')
+        return deleted
+
+    def set_record_tags(self, record_id: int, tag_ids: List[int]) -> bool:
+        updated = self._call('set_record_tags', record_id, list(tag_ids))
+        if updated:
+            self._notify('records_changed', None)
+        return updated
+
+    def get_record_tags(self, record_ids: List[int]) -> Dict[int, List[int]]:
+        # Ключи объектов JSON - строки
+        return {int(record_id): tag_ids for record_id, tag_ids in
+                self._call('get_record_tags', list(record_ids)).items()}
+
+    def find_tagged_records(self, tag_ids: List[int], match_all: bool = True) -> bytes:
+        return self._call('find_tagged_records', list(tag_ids), match_all)
+
+    def add_budget(self, project_id: Optional[int], task_id: Optional[int], period: str,
+                   seconds: int) -> Budget:
+        return self._call('add_budget', project_id, task_id, period, seconds)
+
+    def get_budgets(self) -> List[Budget]:
+        return self._call('get_budgets')
+
+    def delete_budget(self, budget_id: int) -> bool:
+        return self._call('delete_budget', budget_id)
+
+    def get_budget_records(self) -> List[tuple]:
+        return [tuple(row) for row in self._call('get_budget_records')]
+
+    def add_rate(self, project_id: int, task_id: Optional[int], effective_from: date,
+                 hourly_rate: Decimal) -> Rate:
+        return self._call('add_rate', project_id, task_id, effective_from, hourly_rate)
+
+    def get_rates(self) -> List[Rate]:
+        return self._call('get_rates')
+
+    def delete_rate(self, rate_id: int) -> bool:
+        return self._call('delete_rate', rate_id)
+
+    def iter_time_records(self, date_from: date, date_to: date, project_id: int = None,
+                          chunk_size: int = 1000) -> Iterator[tuple]:
+        # Сервер отдаёт выборку одним ответом
+        return iter(tuple(row) for row in
+                    self._call('iter_time_records', date_from, date_to, project_id, chunk_size))
+
+    def iter_calendar_records(self, date_from: date, date_to: date, project_id: int = None,
+                              chunk_size: int = 1000) -> Iterator[tuple]:
+        return iter(tuple(row) for row in self._call('iter_calendar_records', date_from,
+                                                     date_to, project_id, chunk_size))
+
+    def query_records(self, query: RecordQuery) -> List[tuple]:
+        return [tuple(row) for row in self._call('query_records', query)]
+
+    def get_time_record_columns(self) -> List[tuple]:
+        return [tuple(row) for row in self._call('get_time_record_columns')]
+
+    def get_change_counter(self) -> tuple:
+        return tuple(self._call('get_change_counter'))
+
+    def close(self):
+        with self._lock:
+            self._close_socket()
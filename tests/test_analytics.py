@@ -0,0 +1,34 @@
+from datetime import date
+
+import numpy as np
+
+from analytics import ChartAggregates, RecordColumns, SECONDS_PER_DAY
+
+
+def columns(*records):
+    """Колонки из записей (проект, начало, длительность)"""
+    rows = [(i + 1, 1, project, start, start + duration, duration, 1)
+            for i, (project, start, duration) in enumerate(records)]
+    return RecordColumns.from_rows(rows)
+
+
+def test_heatmap_keeps_hours_after_midnight_of_last_day():
+    # Последняя запись: 23:00 - 01:00 следующего дня
+    day = 20000
+    start = day * SECONDS_PER_DAY + 23 * 3600
+    aggregates = ChartAggregates(columns((1, day * SECONDS_PER_DAY, 600), (1, start, 7200)))
+
+    assert aggregates.day_hour.sum() == 600 + 7200
+    assert aggregates.day_hour[1, 0] == 3600
+    assert aggregates.heatmap().sum() == 600 + 7200
+
+
+def test_add_record_matches_vectorized_build():
+    records = [(1, 100 * SECONDS_PER_DAY + 3600, 1800), (2, 101 * SECONDS_PER_DAY - 600, 1200)]
+    built = ChartAggregates(columns(*records))
+    added = ChartAggregates(columns(records[0]))
+    added.add_record(*records[1], productive=True)
+
+    assert built.first_day == added.first_day
+    assert np.array_equal(built.day_hour, added.day_hour[:len(built.day_hour)])
+    assert built.stacked_days(date(1970, 4, 11))[0] == 100
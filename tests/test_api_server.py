@@ -0,0 +1,55 @@
+import http.client
+import json
+from datetime import datetime
+
+import pytest
+from PyQt5.QtCore import Qt
+
+from api_server import ApiServer
+
+
+@pytest.fixture
+def api(db):
+    server = ApiServer(db, port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def _request(api, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', api.port, timeout=5)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def test_stats_reads_window_database(api, db, task):
+    db.add_time_record(task.id, datetime(2024, 1, 5, 9), datetime(2024, 1, 5, 10), 3600, True)
+
+    status, data = _request(api, 'GET', '/stats?from=2024-01-01&to=2024-01-31&by=project')
+
+    assert status == 200
+    assert data['totals'] == {str(task.project_id): 3600}
+
+
+@pytest.mark.parametrize('path', ['/state?since=abc', '/stats?from=2024-13-01', '/stats?by=year'])
+def test_bad_parameters_get_400(api, path):
+    assert _request(api, 'GET', path)[0] == 400
+
+
+def test_commands_need_json_and_no_origin(api):
+    received = []
+    # Сигнал приходит из потока сервера; в тесте нет цикла событий Qt
+    api.command_received.connect(lambda name, data: received.append((name, data)),
+                                 Qt.DirectConnection)
+    body = json.dumps({'task_id': 1})
+
+    assert _request(api, 'POST', '/start', body)[0] == 415
+    assert _request(api, 'POST', '/start', body, {'Content-Type': 'application/json',
+                                                  'Origin': 'https://example.com'})[0] == 403
+    assert _request(api, 'GET', '/state', headers={'Host': 'evil.example:8765'})[0] == 403
+    assert _request(api, 'POST', '/start', body, {'Content-Type': 'application/json'})[0] == 202
+    assert received == [('start', {'task_id': 1})]
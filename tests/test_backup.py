@@ -0,0 +1,42 @@
+import os
+from datetime import datetime, timedelta
+
+from backup import NAME_FORMAT, check_integrity, create_backup, list_backups
+
+
+def test_backup_leaves_only_checked_copy(db, task, tmp_path):
+    folder = str(tmp_path / 'backups')
+    info = create_backup(db.db_path, folder)
+
+    assert os.listdir(folder) == [os.path.basename(info.path)]
+    assert check_integrity(info.path) == 'ok'
+
+
+def test_old_generations_are_pruned(db, tmp_path):
+    folder = tmp_path / 'backups'
+    folder.mkdir()
+    old = datetime(2024, 1, 1)
+    for days in range(3):
+        (folder / (old + timedelta(days=days)).strftime(NAME_FORMAT)).write_bytes(b'')
+
+    create_backup(db.db_path, str(folder), keep=2)
+
+    backups = list_backups(str(folder))
+    assert len(backups) == 2
+    assert backups[1].created == old + timedelta(days=2)
+
+
+def test_restore_returns_backup_contents(db, task, tmp_path):
+    info = create_backup(db.db_path, str(tmp_path / 'backups'))
+    db.add_project('После копии')
+
+    db.restore(info.path)
+
+    assert [project.name for project in db.get_projects()] == ['Проект']
+    assert db.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    # Журнал синхронизации не повторяет номера изменений, сделанных до восстановления
+    db.add_project('Новый')
+    counters = [row[0] for row in db.conn.execute(
+        'SELECT counter FROM changes WHERE device_id = ? ORDER BY counter', (db.device_id,))]
+    assert len(counters) == len(set(counters))
+    assert counters[-1] == 4
@@ -0,0 +1,75 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from billing import BillingEngine, RateTable, bill, month_periods, round_up
+from models import Rate
+from settings import Settings
+
+JANUARY = [(date(2024, 1, 1), date(2024, 1, 31))]
+
+
+def test_round_up():
+    assert round_up(1, 900) == 900
+    assert round_up(900, 900) == 900
+    assert round_up(901, 900) == 1800
+    assert round_up(61, 1) == 61
+
+
+def test_task_rate_overrides_project_rate_from_its_date():
+    rates = RateTable([
+        Rate(1, 1, None, date(2024, 1, 1), Decimal('100')),
+        Rate(2, 1, 7, date(2024, 1, 15), Decimal('150')),
+        Rate(3, 1, None, date(2024, 2, 1), Decimal('120')),
+    ])
+    assert rates.rate_for(1, 7, date(2023, 12, 31)) == 0
+    assert rates.rate_for(1, 7, date(2024, 1, 14)) == Decimal('100')
+    assert rates.rate_for(1, 7, date(2024, 1, 15)) == Decimal('150')
+    assert rates.rate_for(1, 8, date(2024, 2, 1)) == Decimal('120')
+
+
+@pytest.mark.parametrize('rounding, billable', [
+    ('record', 3 * 900),  # 5 + 5 минут в первый день, 5 минут во второй
+    ('day', 2 * 900),
+    ('none', 15 * 60),
+])
+def test_rounding_modes(rounding, billable):
+    records = [
+        (7, 1, '2024-01-10 09:00:00', 300),
+        (7, 1, '2024-01-10 11:00:00', 300),
+        (7, 1, '2024-01-11 09:00:00', 300),
+    ]
+    rates = RateTable([Rate(1, 1, None, date(2024, 1, 1), Decimal('60'))])
+
+    invoice = bill(records, rates, JANUARY, rounding, 900)[(0, 1)]
+
+    assert invoice.seconds == 15 * 60
+    assert invoice.billable_seconds == billable
+    assert invoice.amount == Decimal(billable) / 60
+
+
+def test_records_outside_periods_are_ignored():
+    records = [(7, 1, '2023-12-31 23:00:00', 3600), (7, 1, '2024-02-01 00:00:00', 3600)]
+    assert bill(records, RateTable([]), JANUARY) == {}
+
+
+def test_month_periods_cover_year():
+    periods = month_periods(2024)
+    assert periods[0] == (date(2024, 1, 1), date(2024, 1, 31))
+    assert periods[1][1] == date(2024, 2, 29)
+    assert periods[-1] == (date(2024, 12, 1), date(2024, 12, 31))
+
+
+def test_engine_cache_sees_new_records(db, task, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Settings читает settings.json из текущей папки
+    settings = Settings()
+    settings.billing_rounding = 'none'
+    db.add_rate(task.project_id, None, date(2024, 1, 1), Decimal('36'))
+    engine = BillingEngine(db, settings)
+    db.add_time_record(task.id, datetime(2024, 1, 5, 9), datetime(2024, 1, 5, 10), 3600, True)
+    assert engine.invoice(None, *JANUARY[0]).amount == Decimal('36.00')
+
+    db.add_time_record(task.id, datetime(2024, 1, 6, 9), datetime(2024, 1, 6, 9, 30), 1800, True)
+
+    assert engine.invoice(None, *JANUARY[0]).amount == Decimal('54.00')
@@ -0,0 +1,81 @@
+import io
+from datetime import date, datetime
+
+from ical import CalendarImporter, MappingRule, export_ics, import_ics, iter_events
+
+
+def _calendar(*events: str) -> str:
+    return 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n' + ''.join(events) + 'END:VCALENDAR\r\n'
+
+
+def _event(uid: str, start: str, end: str, summary: str, extra: str = '') -> str:
+    return (f'BEGIN:VEVENT\r\nUID:{uid}\r\nDTSTART:{start}\r\nDTEND:{end}\r\n'
+            f'SUMMARY:{summary}\r\n{extra}END:VEVENT\r\n')
+
+
+def _records(db):
+    return db.conn.execute('''
+    SELECT p.name, t.name, tr.start_time, tr.duration_seconds FROM time_records tr
+    JOIN tasks t ON tr.task_id = t.id JOIN projects p ON t.project_id = p.id
+    ORDER BY tr.start_time''').fetchall()
+
+
+def test_folded_lines_are_unfolded():
+    text = _calendar(_event('a', '20240105T090000', '20240105T100000',
+                            'Планирование\r\n  спринта'))
+    events = list(iter_events(io.StringIO(text)))
+    assert events[0].summary == 'Планирование спринта'
+
+
+def test_export_and_import_round_trip(db, task, tmp_path):
+    db.add_time_record(task.id, datetime(2024, 1, 5, 9), datetime(2024, 1, 5, 10), 3600, True)
+    path = str(tmp_path / 'work.ics')
+    assert export_ics(db, path, date(2024, 1, 1), date(2024, 1, 31)) == 1
+
+    result = import_ics(db, path, [])
+    assert (result.imported, result.skipped) == (0, 1)  # запись уже есть
+
+    db.delete_time_record(db.conn.execute('SELECT id FROM time_records').fetchone()[0])
+    result = import_ics(db, path, [])
+    assert result.imported == 1
+    assert _records(db) == [('Проект', 'Задача', '2024-01-05 09:00:00', 3600)]
+
+
+def test_rules_pick_project_and_task(db):
+    text = _calendar(
+        _event('1', '20240105T090000', '20240105T091500', 'Стендап команды'),
+        _event('2', '20240105T100000', '20240105T110000', 'Встреча с клиентом Ромашка'),
+        _event('3', '20240105T120000', '20240105T130000', 'Обед'),
+    )
+    rules = [MappingRule('^стендап', 'Встречи', 'Стендап'),
+             MappingRule(r'клиентом (\w+)', 'Клиенты', r'\1'),
+             MappingRule('обед', '')]
+
+    result = CalendarImporter(db, rules, 'Календарь').run(io.StringIO(text))
+
+    assert (result.imported, result.skipped) == (2, 1)
+    assert [row[:2] for row in _records(db)] == [('Встречи', 'Стендап'), ('Клиенты', 'Ромашка')]
+
+
+def test_events_with_same_uid_do_not_abort_import(db):
+    text = _calendar(
+        _event('same', '20240105T090000', '20240105T100000', 'Первое'),
+        _event('same', '20240106T090000', '20240106T100000', 'Второе'),
+        _event('other', '20240107T090000', '20240107T100000', 'Третье'),
+    )
+
+    result = CalendarImporter(db, [], 'Календарь').run(io.StringIO(text))
+
+    assert (result.imported, result.skipped, result.rejected) == (2, 1, 0)
+
+
+def test_overlapping_event_is_rejected_alone(db):
+    text = _calendar(
+        _event('1', '20240105T090000', '20240105T100000', 'Работа'),
+        _event('2', '20240105T093000', '20240105T103000', 'Работа'),
+        _event('3', '20240105T110000', '20240105T120000', 'Работа'),
+    )
+
+    result = CalendarImporter(db, [], 'Календарь').run(io.StringIO(text))
+
+    assert (result.imported, result.rejected) == (2, 1)
@@ -0,0 +1,122 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from database import Database
+from spool import Spool
+
+START = datetime(2024, 3, 1, 9)
+END = datetime(2024, 3, 1, 10)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def qapp():
+    # QTimer очереди нужен экземпляр приложения Qt, окно - нет
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def spool(db):
+    return Spool(db)
+
+
+def _durations(db):
+    return [row[0] for row in db.conn.execute(
+        'SELECT duration_seconds FROM time_records ORDER BY start_time')]
+
+
+def test_flush_moves_entries_to_database(db, task, spool):
+    spool.append(task.id, START, END, 3600, True)
+    assert len(spool.pending()) == 1
+
+    assert spool.flush() == 1
+    assert spool.pending() == []
+    assert _durations(db) == [3600]
+
+
+def test_replay_after_crash_does_not_duplicate(db, task, spool):
+    spool.append(task.id, START, END, 3600, True)
+    with open(spool.path, encoding='utf-8') as f:
+        saved_queue = f.read()
+    spool.flush()
+    # Сбой между записью в базу и очисткой очереди
+    with open(spool.path, 'w', encoding='utf-8') as f:
+        f.write(saved_queue)
+
+    spool.flush()
+    assert spool.pending() == []
+    assert _durations(db) == [3600]
+
+
+def test_busy_database_keeps_entry_queued(db, db_path, task, spool):
+    spool.append(task.id, START, END, 3600, True)
+    other = sqlite3.connect(db_path)
+    other.execute('BEGIN IMMEDIATE')
+    try:
+        assert spool.flush() == 0
+        assert len(spool.pending()) == 1
+    finally:
+        other.rollback()
+        other.close()
+
+    assert spool.flush() == 1
+    assert _durations(db) == [3600]
+
+
+def test_bad_entries_are_rejected_without_blocking_queue(db, task, spool):
+    db.add_time_record(task.id, START, END, 3600, True)
+    spool.append(task.id, START, END, 3600, True)  # пересечение
+    with open(spool.path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'uid': 'broken', 'task_id': task.id}) + '\n')
+        f.write(json.dumps({'uid': 'bad-date', 'task_id': task.id, 'start_time': 'вчера',
+                            'end_time': 'сегодня', 'duration_seconds': 1,
+                            'was_productive': True}) + '\n')
+    spool.append(task.id, datetime(2024, 3, 1, 11), datetime(2024, 3, 1, 12), 1800, True)
+    rejected = []
+    spool.rejected.connect(rejected.append)
+
+    assert spool.flush() == 1
+    assert spool.pending() == []
+    assert _durations(db) == [3600, 1800]
+    assert len(rejected) == 3
+    with open(spool.rejected_path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_integrity_error_is_rejected(db, task, spool, monkeypatch):
+    uid = spool.append(task.id, START, END, 3600, True)
+    add_time_records = db.add_time_records
+
+    def failing(records):
+        if any(record[5] == uid for record in records):
+            raise sqlite3.IntegrityError('UNIQUE constraint failed')
+        return add_time_records(records)
+
+    monkeypatch.setattr(db, 'add_time_records', failing)
+    spool.append(task.id, datetime(2024, 3, 1, 11), datetime(2024, 3, 1, 12), 1800, True)
+
+    assert spool.flush() == 1
+    assert spool.pending() == []
+    assert _durations(db) == [1800]
+
+
+def test_in_memory_database_keeps_entries_until_snapshot(db_path, task):
+    memory = Database(db_path, in_memory=True)
+    try:
+        spool = Spool(memory, path=db_path + '.memory-spool')
+        spool.append(task.id, START, END, 3600, True)
+
+        assert spool.flush() == 1
+        assert spool.flush() == 0  # ждёт снимка, повторно не выгружается
+        assert len(spool.pending()) == 1
+        assert _durations(memory) == [3600]
+
+        assert memory.snapshot()
+        assert spool.pending() == []
+    finally:
+        memory.close()
+    with Database(db_path) as on_disk:
+        assert _durations(on_disk) == [3600]
@@ -0,0 +1,59 @@
+import sqlite3
+from datetime import datetime
+
+from database import Database
+from sync import FolderTransport, SyncEngine
+
+
+def _counters(db):
+    return [row[0] for row in db.conn.execute(
+        'SELECT counter FROM changes WHERE device_id = ? ORDER BY counter', (db.device_id,))]
+
+
+def test_two_connections_to_one_file_share_counters(db, db_path):
+    # CLI, API и сервер команды открывают свою Database на тот же файл
+    other = Database(db_path)
+    try:
+        db.add_project('a')
+        other.add_project('b')
+        db.add_project('c')
+    finally:
+        other.close()
+    assert _counters(db) == [1, 2, 3]
+
+
+def test_restore_does_not_reuse_sent_counters(db, tmp_path):
+    db.add_project('a')
+    backup_path = str(tmp_path / 'copy.db')
+    target = sqlite3.connect(backup_path)
+    db.conn.backup(target)
+    target.close()
+    db.add_project('b')
+    db.add_project('c')
+
+    db.restore(backup_path)
+    db.add_project('d')
+
+    assert _counters(db) == [1, 4]
+
+
+def test_changes_reach_other_device(tmp_path):
+    first = Database(str(tmp_path / 'first.db'))
+    second = Database(str(tmp_path / 'second.db'))
+    try:
+        project = first.add_project('Общий')
+        shared = first.add_task(project.id, 'Задача')
+        first.add_time_record(shared.id, datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 10),
+                              3600, True)
+        transport = FolderTransport(str(tmp_path / 'sync'))
+        SyncEngine(first, transport).sync()
+        SyncEngine(second, transport).sync()
+
+        assert second.find_task('Общий', 'Задача') is not None
+        assert second.conn.execute('SELECT duration_seconds FROM time_records').fetchall() == [(3600,)]
+
+        # Повторная синхронизация ничего не дублирует
+        assert SyncEngine(second, transport).sync() == (0, 0)
+    finally:
+        first.close()
+        second.close()
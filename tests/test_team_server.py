@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from team_server import RemoteError, RemoteRepository, TeamServer
+
+
+@pytest.fixture
+def server(db_path):
+    team = TeamServer(db_path, port=0, token='секрет')
+    team.start()
+    yield team
+    team.stop()
+
+
+def test_remote_repository_round_trip(server):
+    with RemoteRepository('127.0.0.1', server.port, token='секрет') as remote:
+        project = remote.add_project('Общий')
+        task = remote.add_task(project.id, 'Задача')
+        record = remote.add_time_record(task.id, datetime(2024, 1, 1, 9),
+                                        datetime(2024, 1, 1, 10), 3600, True)
+        assert remote.find_task('Общий', 'Задача') == task
+        assert record.duration_seconds == 3600
+
+
+@pytest.mark.parametrize('token', [None, 'чужой'])
+def test_requests_without_valid_token_are_refused(server, token):
+    with RemoteRepository('127.0.0.1', server.port, token=token) as remote:
+        with pytest.raises(RemoteError, match='PermissionError'):
+            remote.get_projects()
+
+
+def test_network_address_requires_token(db_path):
+    with pytest.raises(ValueError):
+        TeamServer(db_path, host='0.0.0.0')
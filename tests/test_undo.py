@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from database import UNDO_DEPTH
+
+START = datetime(2024, 2, 1, 9)
+END = datetime(2024, 2, 1, 10)
+
+
+def _record_row(db, record_id):
+    return db.conn.execute('SELECT task_id, start_time, end_time, duration_seconds '
+                           'FROM time_records WHERE id = ?', (record_id,)).fetchone()
+
+
+def test_undo_and_redo_record_deletion(db, task):
+    record = db.add_time_record(task.id, START, END, 3600, True)
+    db.delete_time_record(record.id)
+    assert db.get_undo_state() == ("Удаление записи", None)
+
+    assert db.undo() == "Удаление записи"
+    assert _record_row(db, record.id) == (task.id, '2024-02-01 09:00:00', '2024-02-01 10:00:00', 3600)
+
+    assert db.redo() == "Удаление записи"
+    assert _record_row(db, record.id) is None
+
+
+def test_record_edit_with_tags_is_one_undo_step(db, task):
+    record = db.add_time_record(task.id, START, END, 3600, True)
+    old_tag = db.add_tag('старая')
+    new_tag = db.add_tag('новая')
+    db.set_record_tags(record.id, [old_tag.id])
+
+    db.update_time_record(record.id, task.id, START, datetime(2024, 2, 1, 11), 7200, True,
+                          [new_tag.id])
+    assert db.get_record_tags([record.id]) == {record.id: [new_tag.id]}
+
+    assert db.undo() == "Изменение записи"
+    assert _record_row(db, record.id)[3] == 3600
+    assert db.get_record_tags([record.id]) == {record.id: [old_tag.id]}
+    assert db.get_undo_state()[0] == "Изменение меток"
+
+
+def test_undo_project_deletion_restores_tasks_and_records(db, task):
+    record = db.add_time_record(task.id, START, END, 3600, True)
+    db.delete_project(task.project_id)
+    assert db.get_task(task.id) is None
+
+    db.undo()
+
+    assert db.get_task(task.id).name == 'Задача'
+    assert _record_row(db, record.id)[0] == task.id
+
+
+def test_journal_keeps_last_operations(db, task):
+    for hour in range(UNDO_DEPTH + 5):
+        start = datetime(2024, 3, 1) + timedelta(hours=hour)
+        record = db.add_time_record(task.id, start, start + timedelta(minutes=30), 1800, True)
+        db.delete_time_record(record.id)
+
+    steps = 0
+    while db.undo() is not None:
+        steps += 1
+    assert steps == UNDO_DEPTH
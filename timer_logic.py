@@ -1,29 +1,58 @@
 import time
-from datetime import datetime
-from typing import Optional, Callable
+from datetime import datetime, timedelta
+from typing import Optional, Callable, Tuple
 from models import TimeRecord
 
 class Timer:
-    def __init__(self, on_timer_end: Callable[[int], None]):
+    def __init__(self, on_timer_end: Callable[[int], None],
+                 on_state_changed: Optional[Callable[[], None]] = None):
         self.is_running = False
         self.start_time: Optional[float] = None
         self.elapsed_time = 0
+        # Момент первого запуска после сброса: начало будущей записи
+        self.started_at: Optional[float] = None
         self.on_timer_end = on_timer_end
+        # Запуск, пауза и сброс - для подписчиков на состояние (шина событий окна)
+        self.on_state_changed = on_state_changed
+
+    def _state_changed(self):
+        if self.on_state_changed is not None:
+            self.on_state_changed()
 
     def start(self):
         if not self.is_running:
             self.start_time = time.time()
+            if self.started_at is None:
+                self.started_at = self.start_time
             self.is_running = True
+            self._state_changed()
 
     def pause(self):
         if self.is_running and self.start_time:
             self.elapsed_time += time.time() - self.start_time
             self.is_running = False
+            self._state_changed()
 
     def reset(self):
         self.is_running = False
         self.start_time = None
+        self.started_at = None
         self.elapsed_time = 0
+        self._state_changed()
+
+    def interval(self, seconds: Optional[int] = None) -> Tuple[datetime, datetime]:
+        """
+        Начало и конец записи длительностью seconds (по умолчанию - всё
+        накопленное время). Запись начинается с первого запуска таймера;
+        если она не помещается до текущего момента (время увеличили вручную),
+        то сдвигается назад так, чтобы закончиться сейчас.
+        """
+        if seconds is None:
+            seconds = self.get_elapsed_time()
+        now = time.time()
+        start = min(self.started_at or now, now - seconds)
+        start = datetime.fromtimestamp(int(start))
+        return start, start + timedelta(seconds=seconds)
 
     def get_elapsed_time(self) -> int:
         current_elapsed = self.elapsed_time
@@ -31,7 +60,8 @@ class Timer:
             current_elapsed += time.time() - self.start_time
         return int(current_elapsed)
 
-    def format_time(self, seconds: int) -> str:
+    @staticmethod
+    def format_time(seconds: int) -> str:
         mins, secs = divmod(seconds, 60)
         hours, mins = divmod(mins, 60)
         return f"{hours:02d}:{mins:02d}:{secs:02d}"
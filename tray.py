@@ -0,0 +1,72 @@
+from typing import Iterable, Optional
+
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMenu, QStyle, QSystemTrayIcon
+
+# Период обновления подсказки и бюджетов, пока окно свёрнуто в трей;
+# проверка сессии по интервалу всё равно срабатывает точно в срок
+TRAY_TICK_MS = 15000
+NOTIFY_MS = 10000
+
+
+def format_minutes(seconds: int) -> str:
+    """Ч:ММ - подсказка обновляется не каждую секунду, секунды в ней не нужны"""
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}:{minutes:02d}"
+
+
+class TrayIcon(QSystemTrayIcon):
+    """
+    Значок в системном трее: подсказка с сессиями, управление текущей
+    сессией и уведомления. Сам ничего не запускает - только передаёт
+    команды окну сигналами.
+    """
+
+    show_requested = pyqtSignal()
+    command_requested = pyqtSignal(str)  # 'start', 'pause' или 'stop'
+    quit_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        icon = QApplication.style().standardIcon(QStyle.SP_BrowserReload)
+        super().__init__(icon, parent)
+        self._tooltip = None
+
+        menu = QMenu()
+        menu.addAction("Открыть таймер", self.show_requested.emit)
+        menu.addSeparator()
+        self.start_action = menu.addAction("Старт", lambda: self.command_requested.emit('start'))
+        self.pause_action = menu.addAction("Пауза", lambda: self.command_requested.emit('pause'))
+        self.stop_action = menu.addAction("Стоп и сохранить",
+                                          lambda: self.command_requested.emit('stop'))
+        menu.addSeparator()
+        menu.addAction("Выход", self.quit_requested.emit)
+        self.menu = menu  # меню без родителя - ссылка нужна, чтобы его не удалил сборщик
+        self.setContextMenu(menu)
+        self.activated.connect(self.on_activated)
+
+    def on_activated(self, reason):
+        if reason in (QSystemTrayIcon.Trigger, QSystemTrayIcon.DoubleClick):
+            self.show_requested.emit()
+
+    def update_state(self, sessions: Iterable, current_task_id: Optional[int],
+                     can_start: bool):
+        """Подсказка и доступность действий; подсказка меняется, только если изменился текст"""
+        lines = []
+        current = None
+        for session in sessions:
+            state = "▶" if session.timer.is_running else "⏸"
+            lines.append(f"{state} {session.title} — "
+                         f"{format_minutes(session.timer.get_elapsed_time())}")
+            if session.task_id == current_task_id:
+                current = session
+        tooltip = "\n".join(lines) if lines else "Таймер: нет активных сессий"
+        if tooltip != self._tooltip:
+            self._tooltip = tooltip
+            self.setToolTip(tooltip)
+        running = current is not None and current.timer.is_running
+        self.start_action.setEnabled(can_start and not running)
+        self.pause_action.setEnabled(running)
+        self.stop_action.setEnabled(current is not None)
+
+    def notify(self, title: str, text: str):
+        self.showMessage(title, text, QSystemTrayIcon.Information, NOTIFY_MS)
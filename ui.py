@@ -1,18 +1,56 @@
+import copy
+import functools
+import logging
 import sys
+import time
 
 from PyQt5.QtMultimedia import QSound
 from PyQt5.QtMultimedia import QSoundEffect
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QPushButton, QComboBox, QMessageBox, QTabWidget,
                              QTableWidget, QTableWidgetItem, QDialog, QLineEdit, QDialogButtonBox,
-                             QMessageBox, QInputDialog, QAction, QCheckBox, QSpinBox, QDateEdit)
-from PyQt5.QtCore import QTimer, Qt, QUrl, QDate
-from models import Project, Task, TimeRecord
-from database import Database
+                             QMessageBox, QInputDialog, QAction, QCheckBox, QSpinBox, QDateEdit,
+                             QListWidget, QListWidgetItem, QGroupBox, QFormLayout, QFileDialog,
+                             QShortcut, QMenu, QDateTimeEdit, QTimeEdit, QSystemTrayIcon)
+from PyQt5.QtCore import QTimer, Qt, QUrl, QDate, QDateTime, QTime
+from PyQt5.QtGui import QKeySequence
+from models import Project, RecordQuery, Task, TimeRecord
+from database import open_database
+from intervals import OverlapError
 from settings import Settings
 from timer_logic import Timer
+from sessions import Session, SessionManager
+from plans import PlanEngine, IntervalPlan, PHASE_NAMES
+from api_server import ApiServer
+from analytics import Analytics
+from charts import ChartsPanel
+from sync import SyncEngine, FolderTransport
+from profiling import profiler, timed, DiagnosticsDialog
+from reports import ReportJob, period_bounds, prepare_report
+from gaps import GapsDialog, analyze as analyze_gaps
+from ical import export_ics, import_ics, rules_from_settings
+from spool import Spool
+from tags import has_record
+from budgets import BudgetTracker, BudgetsDialog, PERIODS
+from billing import BillingEngine, InvoiceDialog, RatesDialog, ROUNDING_MODES
+from backup import BackupJob, backup_folder, last_backup_time, list_backups, check_integrity
+from tray import TrayIcon, TRAY_TICK_MS
+from events import (EventBus, CatalogChanged, RecordDeleted, SettingsChanged, TimerStateChanged,
+                    RECORD_EVENTS)
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+
+def with_views(method):
+    """Обновление виджетов окна: пропускается, пока окно свёрнуто в трей и виджетов нет"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.tabs is None:
+            return None
+        return method(self, *args, **kwargs)
+    return wrapper
+
 
 class TimerApp(QMainWindow):
     def __init__(self):
@@ -27,9 +65,38 @@ class TimerApp(QMainWindow):
                 self.settings.loop_sound = False
                 self.settings.save()
 
-            self.db = Database()
-            self.timer = Timer(self.on_timer_end)
-            self.current_task_id = None
+            # Файл или база в памяти со снимками на диск - по настройке db_in_memory
+            self.db = open_database(self.settings)
+            profiler.configure(self.settings.profiling_buffer, self.settings.stall_threshold_ms)
+            if self.settings.profiling_enabled:
+                profiler.enable(self.db)
+            self.analytics = Analytics(self.db)
+            # Кэш аналитики обновляется инкрементально при каждой записи в БД
+            self.db.add_listener(self.analytics.on_db_event)
+            # Виджеты, API и трей узнают об изменениях базы, таймеров и настроек
+            # через шину: пачкой, в цикле Qt, когда кэши уже обновлены
+            self.bus = EventBus(self)
+            self.db.add_listener(self.bus.on_db_event)
+            # Расход бюджетов времени тоже меняется по событиям базы
+            self.budgets = BudgetTracker(self.db, self)
+            self.db.add_listener(self.budgets.on_db_event)
+            # Предупреждение показывается после тика, а не внутри него
+            self.budgets.threshold_reached.connect(self.on_budget_threshold, Qt.QueuedConnection)
+            # Счета кэшируются до изменения записей
+            self.billing = BillingEngine(self.db, self.settings)
+            self.db.add_listener(self.billing.on_db_event)
+            # Записи таймера сначала попадают в очередь на диске, затем в базу
+            self.spool = Spool(self.db, parent=self)
+            self.spool.rejected.connect(self.on_spool_rejected)
+            # Несколько одновременных таймеров, по одному на задачу.
+            # current_task_id - сессия, которая показывается в таймере
+            self.sessions = SessionManager(self.check_work_time, self.on_session_state)
+            self._current_task_id = None
+
+            # Планы работы (помидоры): ведут сессии по фазам работа/перерыв
+            self.plan_engine = PlanEngine(self.db, self.settings, self.spool, self)
+            self.plan_engine.phase_changed.connect(self.on_phase_changed)
+            self.plan_engine.record_failed.connect(self.on_plan_record_failed)
 
             # Добавьте эти строки
             self.interval_spinbox = None
@@ -46,6 +113,24 @@ class TimerApp(QMainWindow):
             self.setup_ui()
             self.setup_timers()
             self.setup_settings_menu()  # Добавьте эту строку
+            self.setup_edit_menu()
+            # Скрытая панель диагностики
+            self.diagnostics_dialog = None
+            QShortcut(QKeySequence('Ctrl+Shift+D'), self, self.show_diagnostics)
+            self.plan_engine.restore(self.restore_plan_session)
+            self.api_server = None
+            self._published_state = None
+            self.setup_api_server()
+            # Значок в трее (если включён): окно при закрытии сворачивается в него
+            self.tray = None
+            self.last_task_id = None  # задача для «Старт» из трея, когда сессий нет
+            self._quitting = False
+            self.setup_tray()
+
+            self.bus.subscribe(RECORD_EVENTS, self.on_records_event)
+            self.bus.subscribe(CatalogChanged, self.on_catalog_changed)
+            self.bus.subscribe(TimerStateChanged, self.on_timer_state_changed)
+            self.bus.subscribe(SettingsChanged, self.on_settings_changed)
 
             # Инициализация звука
             self.sound_effect = QSoundEffect()
@@ -54,22 +139,45 @@ class TimerApp(QMainWindow):
                 self.sound_effect.setSource(sound_file)
                 self.sound_effect.setVolume(0.5)  # Установим комфортную громкость
             else:
-                print("Не удалось загрузить звуковой файл")
+                logger.warning("Не удалось загрузить звуковой файл")
+
+            # Записи, не попавшие в базу до закрытия или сбоя
+            QTimer.singleShot(0, self.spool.flush)
+            # Напоминание о неучтённом времени (приложение было закрыто, опрос пропущен)
+            QTimer.singleShot(0, self.report_gaps)
+
+            # Автоматические резервные копии: проверка при запуске и раз в час
+            self.backup_job = None
+            self.backup_timer = QTimer(self)
+            self.backup_timer.timeout.connect(self.auto_backup)
+            self.backup_timer.start(3600 * 1000)
+            QTimer.singleShot(0, self.auto_backup)
         except Exception as e:
-            print(f"Ошибка инициализации: {e}")
+            logger.exception("Ошибка инициализации")
             QMessageBox.critical(None, "Ошибка", f"Ошибка запуска: {str(e)}")
             sys.exit(1)
 
     def save_settings(self, dialog):
-        """Сохраняет настройки и перезапускает таймер"""
+        """Сохраняет настройки; применяют их подписчики SettingsChanged"""
+        before = copy.deepcopy(vars(self.settings))
         self.settings.check_interval = self.interval_spinbox.value() * 60
         self.settings.enable_sound = self.sound_checkbox.isChecked()
         self.settings.loop_sound = self.loop_sound_checkbox.isChecked()  # Сохраняем новую настройку
+        self.settings.api_enabled = self.api_checkbox.isChecked()
+        self.settings.api_port = self.api_port_spinbox.value()
+        self.settings.work_start = self.work_start_edit.time().toString('HH:mm')
+        self.settings.work_end = self.work_end_edit.time().toString('HH:mm')
+        self.settings.gap_min_minutes = self.gap_min_spinbox.value()
+        self.settings.billing_rounding = self.billing_rounding_combo.currentData()
+        self.settings.billing_round_minutes = self.billing_round_spinbox.value()
+        self.settings.tray_enabled = self.tray_checkbox.isChecked()
+        self.store_plan_fields()
+        self.settings.plans = self.edited_plans
+        project_id = self.project_combo.currentData()
+        if project_id:
+            self.settings.project_plans[str(project_id)] = self.project_plan_combo.currentText()
         self.settings.save()
-
-        # Перезапускаем таймер проверки
-        self.check_timer.stop()
-        self.check_timer.start(self.settings.check_interval * 1000)
+        self.publish_settings(before)
 
         dialog.accept()
         QMessageBox.information(self, "Сохранено", "Настройки успешно сохранены!")
@@ -112,6 +220,52 @@ class TimerApp(QMainWindow):
                 lambda state: self.loop_sound_checkbox.setEnabled(state == Qt.Checked)
             )
 
+            self.tray_checkbox = QCheckBox("Сворачивать в трей при закрытии окна")
+            self.tray_checkbox.setChecked(bool(self.settings.tray_enabled))
+            self.tray_checkbox.setEnabled(QSystemTrayIcon.isSystemTrayAvailable())
+            layout.addWidget(self.tray_checkbox)
+
+            layout.addWidget(self.setup_plan_settings())
+
+            # Локальный API
+            api_layout = QHBoxLayout()
+            self.api_checkbox = QCheckBox("Локальный API, порт:")
+            self.api_checkbox.setChecked(bool(self.settings.api_enabled))
+            self.api_port_spinbox = QSpinBox()
+            self.api_port_spinbox.setRange(1024, 65535)
+            self.api_port_spinbox.setValue(int(self.settings.api_port))
+            api_layout.addWidget(self.api_checkbox)
+            api_layout.addWidget(self.api_port_spinbox)
+            layout.addLayout(api_layout)
+
+            # Рабочий день: по нему ищутся пропуски
+            work_group = QGroupBox("Рабочий день")
+            work_form = QFormLayout(work_group)
+            self.work_start_edit = QTimeEdit(QTime.fromString(self.settings.work_start, 'HH:mm'))
+            self.work_end_edit = QTimeEdit(QTime.fromString(self.settings.work_end, 'HH:mm'))
+            self.gap_min_spinbox = QSpinBox()
+            self.gap_min_spinbox.setRange(1, 240)
+            self.gap_min_spinbox.setValue(int(self.settings.gap_min_minutes))
+            work_form.addRow("Начало:", self.work_start_edit)
+            work_form.addRow("Конец:", self.work_end_edit)
+            work_form.addRow("Пропуск от (минут):", self.gap_min_spinbox)
+            layout.addWidget(work_group)
+
+            # Округление времени в счетах
+            billing_group = QGroupBox("Счета")
+            billing_form = QFormLayout(billing_group)
+            self.billing_rounding_combo = QComboBox()
+            for mode, name in ROUNDING_MODES.items():
+                self.billing_rounding_combo.addItem(name, mode)
+            self.billing_rounding_combo.setCurrentIndex(
+                max(self.billing_rounding_combo.findData(self.settings.billing_rounding), 0))
+            self.billing_round_spinbox = QSpinBox()
+            self.billing_round_spinbox.setRange(1, 240)
+            self.billing_round_spinbox.setValue(int(self.settings.billing_round_minutes))
+            billing_form.addRow("Округление вверх:", self.billing_rounding_combo)
+            billing_form.addRow("Шаг (минут):", self.billing_round_spinbox)
+            layout.addWidget(billing_group)
+
             # Кнопки
             buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
             buttons.accepted.connect(lambda: self.save_settings(dialog))
@@ -122,19 +276,286 @@ class TimerApp(QMainWindow):
             dialog.exec_()
 
         except Exception as e:
-            print(f"Ошибка в show_settings_dialog: {repr(e)}")
+            logger.exception("Ошибка в show_settings_dialog")
             QMessageBox.critical(self, "Ошибка", f"Не удалось открыть настройки: {str(e)}")
 
+    def setup_plan_settings(self):
+        """Группа настроек планов работы для диалога настроек"""
+        group = QGroupBox("Планы работы")
+        form = QFormLayout(group)
+        # Правим копию, чтобы отмена диалога ничего не меняла
+        self.edited_plans = {name: dict(plan) for name, plan in self.settings.plans.items()}
+        self.edited_plan_name = None
+
+        plan_row = QHBoxLayout()
+        self.plan_combo = QComboBox()
+        self.plan_combo.addItems(list(self.edited_plans))
+        add_plan_btn = QPushButton("+ План")
+        add_plan_btn.clicked.connect(self.add_plan)
+        plan_row.addWidget(self.plan_combo)
+        plan_row.addWidget(add_plan_btn)
+        form.addRow("План:", plan_row)
+
+        self.plan_spinboxes = {}
+        for key, label, maximum in (('work_minutes', "Работа (минут):", 240),
+                                    ('short_break_minutes', "Перерыв (минут):", 120),
+                                    ('long_break_minutes', "Длинный перерыв (минут):", 240),
+                                    ('long_break_every', "Длинный перерыв каждые N циклов:", 20)):
+            spinbox = QSpinBox()
+            spinbox.setRange(1, maximum)
+            self.plan_spinboxes[key] = spinbox
+            form.addRow(label, spinbox)
+
+        self.project_plan_combo = QComboBox()
+        self.project_plan_combo.addItems(list(self.edited_plans))
+        project_id = self.project_combo.currentData()
+        current = self.plan_engine.plan_for_project(project_id).name
+        self.project_plan_combo.setCurrentText(current)
+        self.project_plan_combo.setEnabled(bool(project_id))
+        form.addRow(f"План проекта «{self.project_combo.currentText()}»:", self.project_plan_combo)
+
+        self.plan_combo.currentTextChanged.connect(self.load_plan_fields)
+        self.plan_combo.setCurrentText(current)
+        self.load_plan_fields(self.plan_combo.currentText())
+        return group
+
+    def load_plan_fields(self, name):
+        self.store_plan_fields()
+        self.edited_plan_name = name
+        plan = IntervalPlan.from_settings(name, self.edited_plans.get(name, {}))
+        for key, spinbox in self.plan_spinboxes.items():
+            spinbox.setValue(getattr(plan, key))
+
+    def store_plan_fields(self):
+        if self.edited_plan_name in self.edited_plans:
+            for key, spinbox in self.plan_spinboxes.items():
+                self.edited_plans[self.edited_plan_name][key] = spinbox.value()
+
+    def add_plan(self):
+        name, ok = QInputDialog.getText(self, "Новый план", "Название плана:")
+        name = name.strip()
+        if ok and name and name not in self.edited_plans:
+            self.store_plan_fields()
+            self.edited_plans[name] = dict(self.edited_plans[self.plan_combo.currentText()])
+            self.plan_combo.addItem(name)
+            self.project_plan_combo.addItem(name)
+            self.plan_combo.setCurrentText(name)
+
     def setup_settings_menu(self):
-        print("Создание меню настроек...")  # Добавьте эту строку для отладки
         menubar = self.menuBar()
-        print(f"Меню-бар: {menubar}")  # Проверка, что menubar существует
         settings_menu = menubar.addMenu('Настройки')
 
         settings_action = QAction('Настройки...', self)
         settings_action.triggered.connect(self.show_settings_dialog)
         settings_menu.addAction(settings_action)
-        print("Меню настроек создано")  # Подтверждение создания
+
+        sync_action = QAction('Синхронизировать', self)
+        sync_action.triggered.connect(self.sync_now)
+        settings_menu.addAction(sync_action)
+
+        backup_action = QAction('Создать резервную копию', self)
+        backup_action.triggered.connect(self.backup_now)
+        settings_menu.addAction(backup_action)
+        restore_action = QAction('Восстановить из копии...', self)
+        restore_action.triggered.connect(self.restore_backup)
+        settings_menu.addAction(restore_action)
+
+        budgets_action = QAction('Бюджеты времени...', self)
+        budgets_action.triggered.connect(self.show_budgets)
+        settings_menu.addAction(budgets_action)
+        rates_action = QAction('Ставки оплаты...', self)
+        rates_action.triggered.connect(self.show_rates)
+        settings_menu.addAction(rates_action)
+        logger.debug("Меню настроек создано")
+
+    def show_budgets(self):
+        try:
+            targets = []
+            for project in self.db.get_projects():
+                targets.append((project.id, None, project.name))
+                targets += [(None, task.id, f"{project.name} / {task.name}")
+                            for task in self.db.get_tasks_for_project(project.id)]
+            dialog = BudgetsDialog(self.db, targets, self)
+            dialog.exec_()
+            if dialog.changed:
+                self.budgets.reload()
+                self.update_display()
+        except Exception as e:
+            logger.exception("Ошибка в диалоге бюджетов")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось изменить бюджеты: {str(e)}")
+
+    def show_rates(self):
+        try:
+            targets = []
+            for project in self.db.get_projects():
+                targets.append((project.id, None, project.name))
+                targets += [(project.id, task.id, f"{project.name} / {task.name}")
+                            for task in self.db.get_tasks_for_project(project.id)]
+            dialog = RatesDialog(self.db, targets, self)
+            dialog.exec_()
+            if dialog.changed:
+                self.billing.invalidate()
+        except Exception as e:
+            logger.exception("Ошибка в диалоге ставок")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось изменить ставки: {str(e)}")
+
+    def show_invoice(self):
+        """Счёт по проекту и периоду из фильтров статистики"""
+        try:
+            invoice = self.billing.invoice(self.filter_project_combo.currentData(),
+                                           self.date_from_edit.date().toPyDate(),
+                                           self.date_to_edit.date().toPyDate())
+            titles = {task.id: f"{project.name} / {task.name}"
+                      for project in self.db.get_projects()
+                      for task in self.db.get_tasks_for_project(project.id)}
+            InvoiceDialog(invoice, titles, self.settings.billing_rounding, self).exec_()
+        except Exception as e:
+            logger.exception("Ошибка при расчёте счёта")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось рассчитать счёт: {str(e)}")
+
+    def on_budget_threshold(self, budget, ratio: float):
+        """Бюджет израсходован на 80% или полностью: звук и сообщение"""
+        if budget.task_id is not None:
+            task = self.db.get_task(budget.task_id)
+            title = self.task_title(task) if task else "?"
+        else:
+            title = next((p.name for p in self.db.get_projects() if p.id == budget.project_id), "?")
+        if self.settings.enable_sound and self.sound_effect.isLoaded():
+            self.sound_effect.setLoopCount(1)
+            self.sound_effect.play()
+        text = "израсходован" if ratio >= 1 else f"израсходован на {ratio:.0%}"
+        message = (f"Бюджет «{title}» ({PERIODS[budget.period]}, "
+                   f"{Timer.format_time(budget.seconds)}) {text}")
+        if self.tray is not None and not self.isVisible():
+            self.tray.notify("Бюджет времени", message)
+            return
+        QMessageBox.information(self, "Бюджет времени", message)
+
+    def auto_backup(self):
+        """Копия по расписанию, если с последней прошло больше backup_interval_hours"""
+        hours = self.settings.backup_interval_hours
+        if not hours:
+            return
+        last = last_backup_time(backup_folder(self.settings))
+        if last is None or datetime.now() - last >= timedelta(hours=hours):
+            self.backup_now(quiet=True)
+
+    def backup_now(self, quiet: bool = False):
+        """Резервная копия в фоновом потоке; окно продолжает работать"""
+        if self.backup_job is not None:
+            return
+        # Копия делается с файла: база в памяти сначала сохраняет в него снимок
+        self.db.snapshot()
+        job = BackupJob(self.db.db_path, backup_folder(self.settings), self.settings.backup_keep)
+        job.signals.progress.connect(
+            lambda done, total: self.statusBar().showMessage(
+                f"Резервное копирование: {done * 100 // max(total, 1)}%"))
+        job.signals.finished.connect(lambda path: self.on_backup_finished(path, quiet))
+        job.signals.failed.connect(self.on_backup_failed)
+        self.backup_job = job
+        job.start()
+
+    def on_backup_finished(self, path: str, quiet: bool):
+        self.backup_job = None
+        self.statusBar().showMessage(f"Резервная копия сохранена: {path}", 5000)
+        if not quiet:
+            QMessageBox.information(self, "Резервная копия", f"Копия сохранена:\n{path}")
+
+    def on_backup_failed(self, message: str):
+        self.backup_job = None
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Ошибка", f"Не удалось создать резервную копию: {message}")
+
+    def restore_backup(self):
+        try:
+            backups = list_backups(backup_folder(self.settings))
+            if not backups:
+                QMessageBox.information(self, "Восстановление", "Резервных копий нет")
+                return
+            labels = [f"{b.created:%d.%m.%Y %H:%M:%S} ({b.size // 1024} КБ)" for b in backups]
+            label, ok = QInputDialog.getItem(self, "Восстановление", "Копия:", labels, 0, False)
+            if not ok:
+                return
+            info = backups[labels.index(label)]
+            reply = QMessageBox.question(
+                self, 'Подтверждение',
+                f"Заменить все данные копией от {info.created:%d.%m.%Y %H:%M}?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+            result = check_integrity(info.path)
+            if result != 'ok':
+                QMessageBox.critical(self, "Ошибка", f"Копия повреждена: {result}")
+                return
+            self.db.restore(info.path)
+            QMessageBox.information(self, "Восстановление", "Данные восстановлены из копии")
+        except Exception as e:
+            logger.exception("Ошибка восстановления из копии")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось восстановить данные: {str(e)}")
+
+    def setup_edit_menu(self):
+        """Отмена и повтор удалений и правок (журнал отмены в БД)"""
+        edit_menu = self.menuBar().addMenu('Правка')
+        self.undo_action = QAction('Отменить', self)
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(self.undo_action)
+        self.redo_action = QAction('Повторить', self)
+        self.redo_action.setShortcuts([QKeySequence.Redo, QKeySequence('Ctrl+Shift+Z')])
+        self.redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(self.redo_action)
+        edit_menu.aboutToShow.connect(self.update_undo_actions)
+        self.update_undo_actions()
+
+    def update_undo_actions(self):
+        undo_label, redo_label = self.db.get_undo_state()
+        self.undo_action.setText(f"Отменить: {undo_label}" if undo_label else "Отменить")
+        self.redo_action.setText(f"Повторить: {redo_label}" if redo_label else "Повторить")
+
+    def undo(self):
+        self.apply_undo_step(self.db.undo, "Отменено", "Нечего отменять")
+
+    def redo(self):
+        self.apply_undo_step(self.db.redo, "Повторено", "Нечего повторять")
+
+    def apply_undo_step(self, step, done_text: str, empty_text: str):
+        try:
+            label = step()
+        except OverlapError as e:
+            QMessageBox.warning(self, "Пересечение записей", str(e))
+            return
+        except Exception as e:
+            logger.exception("Ошибка отмены/повтора")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить операцию: {str(e)}")
+            return
+        if label is None:
+            self.statusBar().showMessage(empty_text, 3000)
+            return
+        self.update_undo_actions()
+        self.statusBar().showMessage(f"{done_text}: {label}", 5000)
+
+    def sync_now(self):
+        """Обменивается изменениями с другими устройствами через общую папку"""
+        if not self.settings.sync_folder:
+            folder = QFileDialog.getExistingDirectory(self, "Папка синхронизации")
+            if not folder:
+                return
+            self.settings.sync_folder = folder
+            self.settings.save()
+        try:
+            pushed, applied = SyncEngine(self.db, FolderTransport(self.settings.sync_folder)).sync()
+        except (OSError, ValueError) as e:
+            logger.error("Ошибка синхронизации: %s", e)
+            QMessageBox.critical(self, "Ошибка", f"Не удалось синхронизировать: {str(e)}")
+            return
+        logger.info("Синхронизация: отправлено %d, получено %d", pushed, applied)
+        self.statusBar().showMessage(f"Синхронизация: отправлено {pushed}, получено {applied}", 5000)
+
+    def show_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self.db, self.settings, self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
 
     def change_check_interval(self):
         minutes, ok = QInputDialog.getInt(
@@ -144,11 +565,10 @@ class TimerApp(QMainWindow):
             min=1, max=120, step=1)
 
         if ok:
+            before = copy.deepcopy(vars(self.settings))
             self.settings.check_interval = minutes * 60
             self.settings.save()
-            # Перезапускаем таймер с новым интервалом
-            self.check_timer.stop()
-            self.check_timer.start(self.settings.check_interval * 1000)
+            self.publish_settings(before)
             QMessageBox.information(self, "Сохранено",
                                     f"Новый интервал проверки: {minutes} минут")
 
@@ -159,8 +579,12 @@ class TimerApp(QMainWindow):
     def setup_ui(self):
         self.setWindowTitle("Task Timer")
         self.setGeometry(100, 100, 600, 400)
+        self.tabs = None
+        self.stats_tab = None
+        self.build_views()
 
-
+    def build_views(self):
+        """Вкладки окна; пересоздаются при показе окна из трея"""
         # Главный виджет
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -179,7 +603,23 @@ class TimerApp(QMainWindow):
 
         # Теперь можно безопасно обновлять комбобоксы
         self.update_projects_combo()  # Moved after setup_timer_tab()
-
+        # Таблица статистики строится при первом открытии вкладки
+        self._stats_dirty = True
+        self._stats_total = 0
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+
+    def release_views(self):
+        """
+        Удаляет вкладки окна, свёрнутого в трей: таблицу статистики, графики и
+        остальные виджеты. Сессии, планы и кэши живут в самом TimerApp, а
+        методы обновления виджетов (with_views) до пересоздания пропускаются.
+        """
+        if self.tabs is None:
+            return
+        self.tabs = None
+        self.takeCentralWidget().deleteLater()
+        # Колонки аналитики тоже освобождаются - построятся при открытии статистики
+        self.analytics.invalidate()
 
     def setup_management_buttons(self):
         """Инициализация кнопок управления"""
@@ -218,7 +658,7 @@ class TimerApp(QMainWindow):
         self.task_combo = QComboBox()
         timer_layout.addWidget(QLabel("Задача:"))
         timer_layout.addWidget(self.task_combo)
-        self.project_combo.currentIndexChanged.connect(self.update_tasks_combo)
+        self.project_combo.currentIndexChanged.connect(lambda: self.update_tasks_combo())
 
         # Теперь, когда оба комбобокса созданы, можно их заполнить
         self.update_projects_combo()  # Перенесено после создания task_combo
@@ -260,6 +700,28 @@ class TimerApp(QMainWindow):
         timer_buttons.addWidget(self.reset_button)
 
         timer_layout.addLayout(timer_buttons)
+
+        # Работа по плану (циклы работа/перерыв вместо интервала проверки)
+        self.use_plan_checkbox = QCheckBox("Работать по плану (работа/перерывы)")
+        timer_layout.addWidget(self.use_plan_checkbox)
+        self.phase_label = QLabel("")
+        self.phase_label.setAlignment(Qt.AlignCenter)
+        timer_layout.addWidget(self.phase_label)
+        self.budget_label = QLabel("")
+        self.budget_label.setAlignment(Qt.AlignCenter)
+        timer_layout.addWidget(self.budget_label)
+
+        # Компактный список активных сессий
+        timer_layout.addWidget(QLabel("Активные сессии:"))
+        self.sessions_list = QListWidget()
+        self.sessions_list.setMaximumHeight(100)
+        self.sessions_list.itemClicked.connect(self.select_session)
+        timer_layout.addWidget(self.sessions_list)
+
+        self.save_all_button = QPushButton("Сохранить все сессии")
+        self.save_all_button.clicked.connect(self.save_all_sessions)
+        timer_layout.addWidget(self.save_all_button)
+
         self.tabs.addTab(timer_tab, "Таймер")
         self.stop_button.setStyleSheet("""
             QPushButton {
@@ -327,10 +789,35 @@ class TimerApp(QMainWindow):
         filter_layout.addWidget(self.filter_task_combo)
         filter_layout.addWidget(date_filter_widget)
 
+        # Фильтр по меткам: записи со всеми отмеченными метками
+        self.filter_tags_btn = QPushButton("Метки")
+        self.filter_tags_menu = QMenu(self.filter_tags_btn)
+        self.filter_tags_btn.setMenu(self.filter_tags_menu)
+        filter_layout.addWidget(self.filter_tags_btn)
+
         self.apply_filter_btn = QPushButton("Применить фильтр")
         self.apply_filter_btn.clicked.connect(self.update_stats_table)
         filter_layout.addWidget(self.apply_filter_btn)
 
+        # Табели строятся и сохраняются в фоновом потоке
+        self.report_jobs = []
+        self.report_btn = QPushButton("Отчёт")
+        report_menu = QMenu(self.report_btn)
+        report_menu.addAction("За текущую неделю", lambda: self.export_report('week'))
+        report_menu.addAction("За текущий месяц", lambda: self.export_report('month'))
+        report_menu.addAction("По фильтру", lambda: self.export_report('filter'))
+        report_menu.addSeparator()
+        report_menu.addAction("Счёт по фильтру", self.show_invoice)
+        report_menu.addSeparator()
+        report_menu.addAction("Экспорт в календарь (.ics)...", self.export_calendar)
+        report_menu.addAction("Импорт из календаря (.ics)...", self.import_calendar)
+        self.report_btn.setMenu(report_menu)
+        filter_layout.addWidget(self.report_btn)
+
+        self.gaps_btn = QPushButton("Пропуски")
+        self.gaps_btn.clicked.connect(self.show_gaps)
+        filter_layout.addWidget(self.gaps_btn)
+
         stats_layout.addWidget(filter_widget)
 
         # Общее время (добавили отсутствующий элемент)
@@ -338,18 +825,34 @@ class TimerApp(QMainWindow):
         self.total_time_label.setStyleSheet("font-size: 14px; font-weight: bold;")
         stats_layout.addWidget(self.total_time_label)
 
+        # Сводка по выбранному периоду (считается модулем analytics)
+        self.summary_label = QLabel("")
+        stats_layout.addWidget(self.summary_label)
+
+        # Таблица и графики на отдельных вкладках
+        self.stats_views = QTabWidget()
+        stats_layout.addWidget(self.stats_views)
+
         # Таблица (добавили отсутствующий элемент)
         self.stats_table = QTableWidget()
-        self.stats_table.setColumnCount(6)
+        self.stats_table.setColumnCount(7)
         self.stats_table.setHorizontalHeaderLabels(
-            ["Проект", "Задача", "Время", "Дата", "Продуктивно", "Действия"])
-        stats_layout.addWidget(self.stats_table)
+            ["Проект", "Задача", "Время", "Дата", "Продуктивно", "Метки", "Действия"])
+        self.stats_table.cellDoubleClicked.connect(lambda row, _: self.edit_time_record(row))
+        self.stats_views.addTab(self.stats_table, "Таблица")
+
+        # Графики рисуются по предрасчитанным агрегатам analytics
+        self.charts_panel = ChartsPanel(self.analytics)
+        self.stats_views.addTab(self.charts_panel, "Графики")
 
         # Добавляем вкладку (это было пропущено)
+        self.stats_tab = stats_tab
         self.tabs.addTab(stats_tab, "Статистика")
         # Заполняем фильтры данными
         self.update_filter_combos()
 
+    @timed
+    @with_views
     def update_filter_combos(self):
         # Сохраняем текущие выбранные значения
         current_project = self.filter_project_combo.currentData()
@@ -375,20 +878,16 @@ class TimerApp(QMainWindow):
 
         # Обновляем комбобокс задач для выбранного проекта
         self.update_filter_task_combo(current_task)
+        self.update_tag_filter()
 
         # Разблокируем сигналы
         self.filter_project_combo.blockSignals(False)
         self.filter_task_combo.blockSignals(False)
 
-        # Устанавливаем даты по умолчанию (сегодня)
-        today = QDate.currentDate()
-        self.date_from_edit.setDate(today)
-        self.date_to_edit.setDate(today)
-
-        print(f"Получено проектов: {len(projects)}")  # Для отладки
-        for p in projects:
-            print(f"Проект: {p.id} - {p.name}")
+        logger.debug("Получено проектов: %d", len(projects))
 
+    @with_views
+    @timed
     def update_filter_task_combo(self, current_task=None):
         # Сохраняем текущий выбор
         current_task_id = current_task if current_task else self.filter_task_combo.currentData()
@@ -408,25 +907,111 @@ class TimerApp(QMainWindow):
             if index >= 0:
                 self.filter_task_combo.setCurrentIndex(index)
 
+    @with_views
+    def update_tag_filter(self):
+        """Меню фильтра меток: флажки меток и управление ими"""
+        selected = set(self.selected_filter_tags())
+        self.filter_tags_menu.clear()
+        for tag in self.db.get_tags():
+            action = self.filter_tags_menu.addAction(tag.name)
+            action.setData(tag.id)
+            action.setCheckable(True)
+            action.setChecked(tag.id in selected)
+            action.toggled.connect(self.on_tag_filter_changed)
+        self.filter_tags_menu.addSeparator()
+        self.filter_tags_menu.addAction("Новая метка...", self.add_tag)
+        self.filter_tags_menu.addAction("Удалить метку...", self.delete_tag)
+        self.update_tag_filter_text()
+
+    @with_views
+    def selected_filter_tags(self) -> list:
+        return [action.data() for action in self.filter_tags_menu.actions()
+                if action.isCheckable() and action.isChecked()]
+
+    @with_views
+    def update_tag_filter_text(self):
+        names = [action.text() for action in self.filter_tags_menu.actions()
+                 if action.isCheckable() and action.isChecked()]
+        self.filter_tags_btn.setText("Метки: " + ", ".join(names) if names else "Метки")
+
+    def on_tag_filter_changed(self):
+        self.update_tag_filter_text()
+        self.update_stats_table()
+
+    def add_tag(self):
+        name, ok = QInputDialog.getText(self, "Новая метка", "Название метки:")
+        if not ok or not name.strip():
+            return
+        try:
+            self.db.add_tag(name.strip())
+        except Exception as e:
+            logger.exception("Ошибка при создании метки")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось создать метку: {str(e)}")
+
+    def delete_tag(self):
+        tags = self.db.get_tags()
+        if not tags:
+            QMessageBox.information(self, "Метки", "Меток нет")
+            return
+        name, ok = QInputDialog.getItem(self, "Удалить метку", "Метка:",
+                                        [tag.name for tag in tags], 0, False)
+        if not ok:
+            return
+        tag = next(tag for tag in tags if tag.name == name)
+        try:
+            self.db.delete_tag(tag.id)
+        except Exception as e:
+            logger.exception("Ошибка при удалении метки")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось удалить метку: {str(e)}")
+
     def setup_timers(self):
-        # Таймер для обновления отображения
+        # Общий таймер: обновляет отображение и проверяет сроки всех сессий
         self.display_timer = QTimer(self)
-        self.display_timer.timeout.connect(self.update_display)
+        self.display_timer.timeout.connect(self.on_tick)
         self.display_timer.start(1000)
 
-        # Таймер для проверки времени работы
-        self.check_timer = QTimer(self)
-        self.check_timer.timeout.connect(self.check_work_time)
-        self.check_timer.start(self.settings.check_interval * 1000)  # Используем настройки
+    def on_tick(self):
+        self.sessions.tick()
+        # Несохранённое время сессий учитывается в бюджетах без запросов к базе
+        for session in self.sessions:
+            if session.timer.is_running:
+                self.budgets.check(session.task_id, session.timer.get_elapsed_time())
+        self.update_display()
+
+    @property
+    def current_task_id(self):
+        return self._current_task_id
+
+    @current_task_id.setter
+    def current_task_id(self, task_id):
+        # Текущая сессия - часть состояния для API и трея
+        if task_id != self._current_task_id:
+            self._current_task_id = task_id
+            session = self.sessions.get(task_id) if task_id else None
+            self.bus.publish(TimerStateChanged(task_id, bool(session and session.timer.is_running)))
 
+    def current_session(self):
+        return self.sessions.get(self.current_task_id) if self.current_task_id else None
+
+    @with_views
+    @timed
     def update_projects_combo(self):
+        # Выбранные проект и задача сохраняются: список перестраивается
+        # и после изменений каталога из синхронизации или отмены
+        current_project = self.project_combo.currentData()
+        current_task = self.task_combo.currentData()
+        self.project_combo.blockSignals(True)
         self.project_combo.clear()
         projects = self.db.get_projects()
         for project in projects:
             self.project_combo.addItem(project.name, project.id)
+        index = self.project_combo.findData(current_project)
+        if index >= 0:
+            self.project_combo.setCurrentIndex(index)
+        self.project_combo.blockSignals(False)
 
         # Автоматически обновляем задачи
-        self.update_tasks_combo()
+        self.update_tasks_combo(current_task)
 
         # Блокируем кнопки если нет проектов
         has_projects = len(projects) > 0
@@ -434,7 +1019,9 @@ class TimerApp(QMainWindow):
         self.del_project_btn.setEnabled(has_projects)
         self.add_task_btn.setEnabled(has_projects)
 
-    def update_tasks_combo(self):
+    @with_views
+    @timed
+    def update_tasks_combo(self, current_task=None):
         self.task_combo.clear()
         project_id = self.project_combo.currentData()
 
@@ -442,29 +1029,82 @@ class TimerApp(QMainWindow):
             tasks = self.db.get_tasks_for_project(project_id)
             for task in tasks:
                 self.task_combo.addItem(task.name, task.id)
+        if current_task:
+            index = self.task_combo.findData(current_task)
+            if index >= 0:
+                self.task_combo.setCurrentIndex(index)
 
         # Блокируем кнопки если нет задач
         has_tasks = self.task_combo.count() > 0
         self.edit_task_btn.setEnabled(has_tasks)
         self.del_task_btn.setEnabled(has_tasks)
 
+    @timed
     def update_display(self):
-        elapsed = self.timer.get_elapsed_time()
-        self.timer_label.setText(self.timer.format_time(elapsed))
-
-    def check_work_time(self):
-        if not self.timer.is_running:
-            return
+        if self.tabs is not None:
+            session = self.current_session()
+            elapsed = session.timer.get_elapsed_time() if session else 0
+            self.timer_label.setText(Timer.format_time(elapsed))
+            self.phase_label.setText(self.plan_engine.describe(self.current_task_id))
+            self.budget_label.setText(self.budgets.describe(self.current_task_id, elapsed))
+            self.update_sessions_list()
+        if self.tray is not None:
+            self.update_tray()
+            if self.tabs is None:
+                self.schedule_tick()
+
+    def update_tray(self):
+        if self.tray is not None:
+            self.tray.update_state(self.sessions, self.current_task_id,
+                                   bool(self.current_task_id or self.last_task_id))
+
+    def schedule_tick(self):
+        """
+        Пока окно в трее, таймер просыпается раз в TRAY_TICK_MS или к ближайшему
+        сроку проверки сессии, а не каждую секунду
+        """
+        interval = TRAY_TICK_MS
+        deadline = self.sessions.next_deadline()
+        if deadline is not None:
+            interval = min(interval, max(int((deadline - time.time()) * 1000) + 50, 100))
+        self.display_timer.start(interval)
+
+    @with_views
+    @timed
+    def update_sessions_list(self):
+        sessions = list(self.sessions)
+        if self.sessions_list.count() != len(sessions):
+            self.sessions_list.clear()
+            for session in sessions:
+                item = QListWidgetItem()
+                item.setData(Qt.UserRole, session.task_id)
+                self.sessions_list.addItem(item)
+
+        for row, session in enumerate(sessions):
+            item = self.sessions_list.item(row)
+            item.setData(Qt.UserRole, session.task_id)
+            state = "▶" if session.timer.is_running else "⏸"
+            text = f"{state} {session.title} — {Timer.format_time(session.timer.get_elapsed_time())}"
+            if session.plan_driven:
+                text += f" [{self.plan_engine.describe(session.task_id)}]"
+            if item.text() != text:
+                item.setText(text)
+            item.setSelected(session.task_id == self.current_task_id)
+
+    def select_session(self, item):
+        self.current_task_id = item.data(Qt.UserRole)
+        self.update_display()
 
+    def check_work_time(self, session: Session, elapsed: int):
+        """Проверка сессии, дошедшей до интервала (таймер уже на паузе)"""
         try:
-            elapsed = self.timer.get_elapsed_time()
-            was_running = self.timer.is_running
-            self.timer.pause()
-
             if self.settings.enable_sound and self.sound_effect.isLoaded():
                 if self.settings.loop_sound:
                     self.sound_effect.setLoopCount(QSoundEffect.Infinite)
                 self.sound_effect.play()
+            if self.tray is not None and not self.isVisible():
+                self.tray.notify("Подтверждение времени",
+                                 f"{session.title}: {elapsed // 60} мин. — работали это время?")
 
             # Создаем диалог для редактирования времени
             dialog = QDialog(self)
@@ -472,6 +1112,7 @@ class TimerApp(QMainWindow):
             layout = QVBoxLayout(dialog)
 
             # Добавляем информацию о времени
+            layout.addWidget(QLabel(session.title))
             time_label = QLabel(f"Вы работали последние {elapsed // 60} мин. {elapsed % 60} сек.")
             layout.addWidget(time_label)
 
@@ -495,6 +1136,8 @@ class TimerApp(QMainWindow):
             seconds_layout.addWidget(self.seconds_spinbox)
             layout.addLayout(seconds_layout)
 
+            tag_list = self.add_tag_list(layout)
+
             # Кнопки подтверждения
             buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
             buttons.accepted.connect(dialog.accept)
@@ -508,19 +1151,17 @@ class TimerApp(QMainWindow):
                 edited_elapsed = new_minutes * 60 + new_seconds
 
                 self.sound_effect.stop()
-                self.save_time_record(edited_elapsed)
-                self.timer.reset()
-                if was_running:
-                    self.timer.start()
+                self.save_time_record(edited_elapsed, session.task_id, session.timer,
+                                      self.checked_tags(tag_list))
+                session.timer.reset()
+                session.timer.start()
             else:
                 self.sound_effect.stop()
-                self.timer.reset()
+                session.timer.reset()
 
         except Exception as e:
-            print(f"Ошибка в check_work_time: {e}")
-            self.timer.reset()
-        finally:
-            self.check_timer.start(self.settings.check_interval * 1000)
+            logger.exception("Ошибка в check_work_time")
+            session.timer.reset()
 
     def play_sound(self):
         """Воспроизведение звука с учетом настроек"""
@@ -531,27 +1172,43 @@ class TimerApp(QMainWindow):
                 self.sound_effect.setLoopCount(1)
             self.sound_effect.play()
         except Exception as e:
-            print(f"Ошибка воспроизведения звука: {e}")
+            logger.warning("Ошибка воспроизведения звука: %s", e)
 
     def start_timer(self):
         if self.task_combo.currentIndex() == -1:
             QMessageBox.warning(self, "Ошибка", "Выберите задачу!")
             return
 
-        self.current_task_id = self.task_combo.currentData()
-        self.timer.start()
-        # Перезапускаем таймер проверки с текущими настройками
-        self.check_timer.stop()
-        self.check_timer.start(self.settings.check_interval * 1000)
+        # Для уже идущей задачи сессия продолжается, для новой - создаётся
+        task_id = self.task_combo.currentData()
+        title = f"{self.project_combo.currentText()} / {self.task_combo.currentText()}"
+        if self.plan_engine.run_for(task_id):
+            self.plan_engine.resume(task_id)
+        else:
+            session = self.sessions.start(task_id, title, self.settings.check_interval)
+            if self.use_plan_checkbox.isChecked():
+                plan = self.plan_engine.plan_for_project(self.project_combo.currentData())
+                self.plan_engine.start(session, plan)
+        self.current_task_id = task_id
+        self.update_display()
 
     def pause_timer(self):
-        if self.timer.is_running:
-            self.timer.pause()
+        session = self.current_session()
+        run = self.plan_engine.run_for(self.current_task_id)
+        if run and run.deadline is not None:
+            self.plan_engine.pause(self.current_task_id)
+        elif session and session.timer.is_running:
+            session.timer.pause()
         else:
             QMessageBox.information(self, "Инфо", "Таймер уже на паузе")
+        self.update_display()
 
     def reset_timer(self):
-        if self.timer.get_elapsed_time() > 0:
+        session = self.current_session()
+        if session is None:
+            return
+
+        if session.timer.get_elapsed_time() > 0:
             reply = QMessageBox.question(
                 self, "Подтверждение",
                 "Сбросить таймер без сохранения?",
@@ -559,17 +1216,73 @@ class TimerApp(QMainWindow):
                 QMessageBox.No)
 
             if reply == QMessageBox.Yes:
-                self.timer.reset()
+                self.finish_session(session)
         else:
-            self.timer.reset()
+            self.finish_session(session)
         self.update_display()
 
+    def finish_session(self, session: Session):
+        """Сбрасывает таймер сессии и убирает её из списка активных"""
+        self.plan_engine.stop(session.task_id)
+        session.timer.reset()
+        self.sessions.remove(session.task_id)
+        self.last_task_id = session.task_id
+        if self.current_task_id == session.task_id:
+            running = self.sessions.running()
+            self.current_task_id = running[0].task_id if running else None
+
+    def save_all_sessions(self):
+        """Сохраняет все сессии с накопленным временем (каждая - отдельной записью в очереди)"""
+        sessions = [s for s in self.sessions if s.timer.get_elapsed_time() > 0]
+        if not sessions:
+            QMessageBox.information(self, "Инфо", "Нет сессий для сохранения")
+            return
+
+        # Таймеры идут, пока открыт вопрос: при отказе учёт продолжается как был
+        reply = QMessageBox.question(
+            self, 'Подтверждение',
+            "Сохранить все сессии?\n" + "\n".join(
+                f"{s.title}: {Timer.format_time(s.timer.get_elapsed_time())}" for s in sessions),
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes)
+        if reply != QMessageBox.Yes:
+            return
+
+        saved = 0
+        try:
+            for session in sessions:
+                self.plan_engine.stop(session.task_id)
+                session.timer.pause()
+                elapsed = session.timer.get_elapsed_time()
+                start_time, end_time = session.timer.interval(elapsed)
+                self.spool.append(session.task_id, start_time, end_time, elapsed, True)
+                # Сохранённая сессия сразу закрывается: при ошибке на следующей
+                # её время не запишется повторно
+                self.finish_session(session)
+                saved += 1
+        except Exception as e:
+            logger.exception("Ошибка при сохранении сессий")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить сессии: {str(e)}")
+            return
+        finally:
+            self.update_display()
+        QMessageBox.information(self, "Сохранено", f"Сохранено сессий: {saved}")
+
     def stop_timer(self):
+        session = self.current_session()
+        if session is None:
+            return
+        timer = session.timer
+        # План останавливается, несохранённая работа остаётся в таймере
+        self.plan_engine.stop(session.task_id)
+
         try:
-            if not self.timer.is_running and self.timer.get_elapsed_time() == 0:
+            if not timer.is_running and timer.get_elapsed_time() == 0:
+                self.finish_session(session)
+                self.update_display()
                 return
 
-            elapsed = self.timer.get_elapsed_time()
+            elapsed = timer.get_elapsed_time()
             if elapsed > 0:
                 # Создаем диалог для редактирования времени
                 dialog = QDialog(self)
@@ -577,7 +1290,7 @@ class TimerApp(QMainWindow):
                 layout = QVBoxLayout(dialog)
 
                 # Добавляем информацию о времени
-                time_label = QLabel(f"Вы работали {self.timer.format_time(elapsed)}")
+                time_label = QLabel(f"{session.title}\nВы работали {Timer.format_time(elapsed)}")
                 layout.addWidget(time_label)
 
                 # Добавляем спинбокс для редактирования минут
@@ -600,6 +1313,8 @@ class TimerApp(QMainWindow):
                 seconds_layout.addWidget(self.seconds_spinbox)
                 layout.addLayout(seconds_layout)
 
+                tag_list = self.add_tag_list(layout)
+
                 # Кнопки подтверждения
                 buttons = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
                 buttons.accepted.connect(dialog.accept)
@@ -612,62 +1327,396 @@ class TimerApp(QMainWindow):
                     new_seconds = self.seconds_spinbox.value()
                     edited_elapsed = new_minutes * 60 + new_seconds
 
-                    if self.save_time_record(edited_elapsed):
-                        self.timer.reset()
+                    if self.save_time_record(edited_elapsed, session.task_id, session.timer,
+                                             self.checked_tags(tag_list)):
+                        self.finish_session(session)
                         self.update_display()
                 else:
-                    self.timer.reset()
+                    self.finish_session(session)
                     self.update_display()
             else:
-                self.timer.reset()
+                self.finish_session(session)
                 self.update_display()
 
         except Exception as e:
-            print(f"Ошибка в stop_timer: {e}")
+            logger.exception("Ошибка в stop_timer")
             QMessageBox.critical(self, "Ошибка", f"Не удалось остановить таймер: {str(e)}")
-            self.timer.reset()
+            self.finish_session(session)
+
+    def task_title(self, task: Task) -> str:
+        projects = {p.id: p.name for p in self.db.get_projects()}
+        return f"{projects.get(task.project_id, '')} / {task.name}"
+
+    def restore_plan_session(self, task_id: int):
+        """Создаёт сессию для плана, сохранённого с прошлого запуска"""
+        task = self.db.get_task(task_id)
+        if task is None:
+            return None
+        if self.current_task_id is None:
+            self.current_task_id = task_id
+        return self.sessions.add(task_id, self.task_title(task), self.settings.check_interval)
+
+    # Локальный API
+    def setup_api_server(self):
+        if self.api_server:
+            self.api_server.stop()
+            self.api_server = None
+        if not self.settings.api_enabled:
+            return
+
+        try:
+            self.api_server = ApiServer(self.db, self.settings.api_host, self.settings.api_port,
+                                        self.settings.api_socket)
+            self.api_server.command_received.connect(self.run_command)
+            self.api_server.start()
+            self._published_state = None
+            self.publish_state()
+        except Exception as e:
+            logger.warning("Не удалось запустить локальный API: %s", e)
+            self.api_server = None
+
+    def publish_state(self):
+        """Отдаёт состояние сессий в API, только если оно изменилось"""
+        if self.api_server is None:
+            return
+        sessions = []
+        for session in self.sessions:
+            run = self.plan_engine.run_for(session.task_id)
+            sessions.append({
+                'task_id': session.task_id,
+                'title': session.title,
+                'running': session.timer.is_running,
+                # Время до текущего запуска и момент запуска: клиент считает
+                # текущее время сам, поэтому состояние не меняется каждую секунду
+                'elapsed_before_start': int(session.timer.elapsed_time),
+                'started_at': session.timer.start_time if session.timer.is_running else None,
+                'check_interval': session.check_interval,
+                'plan_phase': run.phase if run else None,
+                'plan_deadline': run.deadline if run else None,
+            })
+        state = {'current_task_id': self.current_task_id, 'sessions': sessions}
+        if state != self._published_state:
+            self._published_state = state
+            self.api_server.publish_state(state)
+
+    def run_command(self, name: str, params: dict):
+        """
+        Команды таймеру из локального API и от повторного запуска приложения
+        (выполняются в GUI-потоке)
+        """
+        try:
+            task_id = params.get('task_id') or self.current_task_id
+            if not task_id:
+                return
+            if name == 'start':
+                task = self.db.get_task(int(task_id))
+                if task is None:
+                    return
+                if self.plan_engine.run_for(task.id):
+                    self.plan_engine.resume(task.id)
+                else:
+                    self.sessions.start(task.id, self.task_title(task), self.settings.check_interval)
+                self.current_task_id = task.id
+            elif name == 'pause':
+                if self.plan_engine.run_for(task_id):
+                    self.plan_engine.pause(task_id)
+                else:
+                    self.sessions.pause(task_id)
+            elif name == 'stop':
+                # Без диалога: сохраняем накопленное время как есть
+                session = self.sessions.get(task_id)
+                if session:
+                    self.plan_engine.stop(task_id)
+                    elapsed = session.timer.get_elapsed_time()
+                    if elapsed > 0:
+                        start_time, end_time = session.timer.interval(elapsed)
+                        self.spool.append(task_id, start_time, end_time, elapsed, True)
+                    self.finish_session(session)
+            self.update_display()
+        except Exception as e:
+            logger.exception("Ошибка выполнения команды %r", name)
+
+    def handle_command(self, args: list):
+        """
+        Аргументы командной строки, переданные повторным запуском:
+            show [timer|stats], start <id | Проект/Задача>, pause, stop
+        """
+        if not args:
+            args = ['show']
+        name, rest = args[0], args[1:]
+
+        if name == 'show':
+            self.show_window()
+            if rest and rest[0] == 'stats':
+                self.tabs.setCurrentIndex(1)
+            elif rest and rest[0] == 'timer':
+                self.tabs.setCurrentIndex(0)
+            return
+
+        params = {}
+        if rest:
+            spec = ' '.join(rest)
+            if spec.isdigit():
+                params['task_id'] = int(spec)
+            else:
+                project_name, _, task_name = spec.partition('/')
+                task = self.db.find_task(project_name.strip(), task_name.strip())
+                if task is None:
+                    QMessageBox.warning(self, "Ошибка", f"Задача не найдена: {spec}")
+                    return
+                params['task_id'] = task.id
+        self.run_command(name, params)
+
+    def setup_tray(self):
+        """Включает или выключает значок в трее по настройке tray_enabled"""
+        enabled = self.settings.tray_enabled and QSystemTrayIcon.isSystemTrayAvailable()
+        if enabled and self.tray is None:
+            self.tray = TrayIcon(self)
+            self.tray.show_requested.connect(self.show_window)
+            self.tray.command_requested.connect(self.on_tray_command)
+            self.tray.quit_requested.connect(self.quit_app)
+            self.tray.show()
+            self.update_display()
+        elif not enabled and self.tray is not None:
+            self.tray.hide()
+            self.tray.deleteLater()
+            self.tray = None
+            self.show_window()
+        # Со значком в трее приложение живёт и без видимых окон
+        QApplication.setQuitOnLastWindowClosed(self.tray is None)
+
+    def on_tray_command(self, name: str):
+        if name == 'start' and not self.current_task_id:
+            self.run_command('start', {'task_id': self.last_task_id})
+        else:
+            self.run_command(name, {})
+
+    def show_window(self):
+        """Показывает окно, заново создавая вкладки, если оно было свёрнуто в трей"""
+        if self.tabs is None:
+            self.build_views()
+            self.display_timer.start(1000)
+            self.update_display()
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    def hide_to_tray(self):
+        self.hide()
+        self.release_views()
+        self.update_display()  # переводит общий таймер на редкие пробуждения
+
+    def quit_app(self):
+        self._quitting = True
+        self.close()
+        QApplication.quit()
+
+    def closeEvent(self, event):
+        if self.tray is not None and not self._quitting:
+            event.ignore()
+            self.hide_to_tray()
+            return
+        if self.tray is not None:
+            self.tray.hide()
+        if self.api_server:
+            self.api_server.stop()
+        self.spool.flush()
+        self.db.snapshot()
+        super().closeEvent(event)
+
+    def on_phase_changed(self, task_id: int, phase: str):
+        session = self.sessions.get(task_id)
+        title = session.title if session else ""
+        self.statusBar().showMessage(f"{title}: {PHASE_NAMES[phase]}")
+        if self.tray is not None and not self.isVisible():
+            self.tray.notify("Смена фазы", f"{title}: {PHASE_NAMES[phase]}")
+        if self.settings.enable_sound and self.sound_effect.isLoaded():
+            self.sound_effect.setLoopCount(1)
+            self.sound_effect.play()
+        self.update_display()
 
-    def save_time_record(self, elapsed_seconds: int):
-        if not self.current_task_id or elapsed_seconds <= 0:
+    def on_plan_record_failed(self, task_id: int, message: str):
+        session = self.sessions.get(task_id)
+        title = session.title if session else ""
+        self.update_display()
+        QMessageBox.warning(self, "План остановлен",
+                            f"{title}: не удалось записать рабочую фазу ({message}).\n"
+                            f"Время осталось в таймере - сохраните его кнопкой «Стоп».")
+
+    def add_tag_list(self, layout, checked=()) -> QListWidget:
+        """Список меток с флажками для диалога (скрыт, если меток нет)"""
+        tag_list = QListWidget()
+        for tag in self.db.get_tags():
+            item = QListWidgetItem(tag.name)
+            item.setData(Qt.UserRole, tag.id)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if tag.id in checked else Qt.Unchecked)
+            tag_list.addItem(item)
+        tag_list.setMaximumHeight(100)
+        if not tag_list.count():
+            tag_list.hide()
+        elif isinstance(layout, QFormLayout):
+            layout.addRow("Метки:", tag_list)
+        else:
+            layout.addWidget(QLabel("Метки:"))
+            layout.addWidget(tag_list)
+        return tag_list
+
+    @staticmethod
+    def checked_tags(tag_list: QListWidget) -> list:
+        return [tag_list.item(i).data(Qt.UserRole) for i in range(tag_list.count())
+                if tag_list.item(i).checkState() == Qt.Checked]
+
+    def save_time_record(self, elapsed_seconds: int, task_id: int = None, timer: Timer = None,
+                         tag_ids: list = None):
+        task_id = task_id or self.current_task_id
+        if not task_id or elapsed_seconds <= 0:
             QMessageBox.warning(self, "Ошибка", "Невозможно сохранить: задача не выбрана или время равно нулю")
             return False
 
         try:
-            end_time = datetime.now()
-            start_time = end_time - timedelta(seconds=elapsed_seconds)
-
-            # Убираем проверку на дубликаты для тестирования
-            record = self.db.add_time_record(
-                task_id=self.current_task_id,
-                start_time=start_time,
-                end_time=end_time,
-                duration_seconds=elapsed_seconds,
-                was_productive=True
-            )
+            # Запись начинается с запуска таймера, а не "сейчас минус длительность":
+            # иначе исправленное в диалоге время сдвигает начало записи
+            if timer is not None:
+                start_time, end_time = timer.interval(elapsed_seconds)
+            else:
+                end_time = datetime.now()
+                start_time = end_time - timedelta(seconds=elapsed_seconds)
+
+            # Пересечение проверяется до очереди: из неё отвергнутая запись
+            # попала бы только в файл отложенных, без списка конфликтов
+            conflicts = self.db.find_overlaps(start_time, end_time, task_id)
+            if conflicts:
+                raise OverlapError(conflicts)
+
+            # Запись надёжно сохранена в очереди на диске; в базу она попадёт
+            # сразу или, если база занята, при следующей попытке
+            self.spool.append(task_id, start_time, end_time, elapsed_seconds, True, tag_ids)
 
             QMessageBox.information(self, "Сохранено",
                                     f"Запись успешно сохранена: {elapsed_seconds} секунд")
-            self.update_stats_table()
             return True
 
+        except OverlapError as e:
+            QMessageBox.warning(self, "Пересечение записей", str(e))
+            return False
         except Exception as e:
-            print(f"Ошибка при сохранении записи времени: {e}")
+            logger.exception("Ошибка при сохранении записи времени")
             QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить запись: {str(e)}")
             return False
 
-    def on_timer_end(self, elapsed_seconds: int):
-        reply = QMessageBox.question(
-            self, 'Подтверждение',
-            "Вы работали над задачей?",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.Yes)
-
-        if reply == QMessageBox.Yes:
-            self.save_time_record(elapsed_seconds)
+    def on_spool_rejected(self, message: str):
+        QMessageBox.warning(self, "Запись не сохранена",
+                            f"{message}\nЗапись отложена в файл {self.spool.rejected_path}")
+
+    # Подписчики шины событий
+    def on_records_event(self, events: list):
+        """
+        Записи изменились: таблица и графики обновляются, только если вкладка
+        статистики открыта, иначе - при её открытии. Удалённые записи убираются
+        из таблицы по строкам, остальные изменения перестраивают её один раз
+        на всю пачку событий.
+        """
+        if not self.stats_visible():
+            self._stats_dirty = self.tabs is not None
+            return
+        if all(isinstance(event, RecordDeleted) for event in events):
+            self.remove_stats_rows({event.record_id for event in events})
+        else:
+            self.update_stats_table()
 
-        self.timer.reset()
+    def on_catalog_changed(self, events: list):
+        """Проекты, задачи или метки изменились здесь, при синхронизации или отмене"""
+        if {event.kind for event in events} == {'tag'}:
+            self.update_tag_filter()
+        else:
+            self.update_projects_combo()
+            self.update_filter_combos()
+        # Названия в таблице и фильтр по удалённым проектам или меткам
+        self.update_stats_table()
+
+    def on_session_state(self, session: Session):
+        """Обработчик SessionManager: таймер сессии запущен, остановлен или сброшен"""
+        self.bus.publish(TimerStateChanged(session.task_id, session.timer.is_running))
+
+    def on_timer_state_changed(self, events: list):
+        # Раз в секунду меняется только прошедшее время, его клиенты API считают сами
+        self.publish_state()
+        self.update_tray()
+
+    def on_settings_changed(self, events: list):
+        names = frozenset().union(*(event.names for event in events))
+        if 'check_interval' in names:
+            # Новый интервал проверки для всех сессий
+            self.sessions.set_check_interval(self.settings.check_interval)
+            self.publish_state()
+        if names & {'api_enabled', 'api_host', 'api_port', 'api_socket'}:
+            self.setup_api_server()
+        if 'tray_enabled' in names:
+            self.setup_tray()
+
+    def publish_settings(self, before: dict):
+        """Сообщает подписчикам, какие настройки изменились по сравнению с before"""
+        changed = frozenset(name for name, value in vars(self.settings).items()
+                            if before.get(name) != value)
+        if changed:
+            self.bus.publish(SettingsChanged(changed))
+
+    def stats_visible(self) -> bool:
+        return (self.tabs is not None and self.stats_tab is not None
+                and self.tabs.currentWidget() is self.stats_tab)
+
+    def on_tab_changed(self, index: int):
+        if self._stats_dirty and self.stats_visible():
+            self.update_stats_table()
 
     def update_stats_table(self):
+        """Перестраивает таблицу по фильтрам; пока вкладка скрыта - только помечает"""
+        if not self.stats_visible():
+            self._stats_dirty = self.tabs is not None
+            return
+        self._stats_dirty = False
+        self.fill_stats_table()
+
+    def stats_row(self, record_id: int) -> int:
+        """Строка таблицы с записью (строки удаляются по одной, номера сдвигаются)"""
+        for row in range(self.stats_table.rowCount()):
+            item = self.stats_table.item(row, 0)
+            if item is not None and item.data(Qt.UserRole) == record_id:
+                return row
+        return -1
+
+    @with_views
+    def remove_stats_rows(self, record_ids: set):
+        for row in range(self.stats_table.rowCount() - 1, -1, -1):
+            item = self.stats_table.item(row, 0)
+            if item is not None and item.data(Qt.UserRole) in record_ids:
+                self._stats_total -= item.data(Qt.UserRole + 1)
+                self.stats_table.removeRow(row)
+        self.update_stats_summary()
+        self.charts_panel.refresh()
+
+    @with_views
+    def update_stats_summary(self):
+        """Общее время строк таблицы и сводка analytics по фильтрам"""
+        total_hours, remainder = divmod(self._stats_total, 3600)
+        total_minutes, total_seconds = divmod(remainder, 60)
+        self.total_time_label.setText(
+            f"Общее время: {total_hours:02d}:{total_minutes:02d}:{total_seconds:02d}")
+
+        summary = self.analytics.summary(date_from=self.date_from_edit.date().toPyDate(),
+                                         date_to=self.date_to_edit.date().toPyDate(),
+                                         project_id=self.filter_project_combo.currentData(),
+                                         task_id=self.filter_task_combo.currentData(),
+                                         tag_ids=self.selected_filter_tags())
+        self.summary_label.setText(
+            f"Дней с записями: {summary['days']} | "
+            f"В среднем за день: {Timer.format_time(int(summary['average_per_day']))} | "
+            f"Продуктивно: {summary['productive_ratio']:.0%}")
+
+    @with_views
+    @timed
+    def fill_stats_table(self):
         try:
             project_id = self.filter_project_combo.currentData()
             task_id = self.filter_task_combo.currentData()
@@ -679,35 +1728,22 @@ class TimerApp(QMainWindow):
             # Корректируем date_to, чтобы включить весь день
             date_to = datetime.combine(date_to, datetime.max.time()).date()
 
-            # Получаем данные с фильтрацией
-            cursor = self.db.conn.cursor()
-            query = '''
-                SELECT tr.id, p.name AS project_name, t.name AS task_name, 
-                       tr.duration_seconds, tr.start_time, tr.was_productive
-                FROM time_records tr
-                JOIN tasks t ON tr.task_id = t.id
-                JOIN projects p ON t.project_id = p.id
-                WHERE date(tr.start_time) BETWEEN ? AND ?
-                '''
-            params = [date_from.isoformat(), date_to.isoformat()]
-
-            if project_id:
-                query += ' AND p.id = ?'
-                params.append(project_id)
-            if task_id:
-                query += ' AND t.id = ?'
-                params.append(task_id)
-
-            query += ' ORDER BY tr.start_time DESC'
-
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+            # Получаем данные с фильтрацией (повторный запрос с тем же фильтром - из кэша)
+            rows = self.db.query_records(RecordQuery(date_from, date_to, project_id, task_id))
 
             # Обновляем таблицу
+            # Фильтр по меткам - пересечение битовых карт в памяти
+            tag_ids = self.selected_filter_tags()
+            if tag_ids:
+                tagged = self.db.find_tagged_records(tag_ids)
+                rows = [row for row in rows if has_record(tagged, row[0])]
+            record_tags = self.db.get_record_tags([row[0] for row in rows])
+            tag_names = {tag.id: tag.name for tag in self.db.get_tags()}
+
             self.stats_table.setRowCount(0)
-            self.stats_table.setColumnCount(6)
+            self.stats_table.setColumnCount(7)
             self.stats_table.setHorizontalHeaderLabels(
-                ["Проект", "Задача", "Время", "Дата", "Продуктивно", "Действия"])
+                ["Проект", "Задача", "Время", "Дата", "Продуктивно", "Метки", "Действия"])
 
             total_seconds = 0
 
@@ -719,6 +1755,8 @@ class TimerApp(QMainWindow):
 
                 # Сохраняем ID записи в UserRole первого элемента строки
                 project_item.setData(Qt.UserRole, row[0])  # row[0] - это tr.id из запроса
+                # и длительность - для общего времени при удалении строки
+                project_item.setData(Qt.UserRole + 1, row[3])
 
                 # Форматируем время
                 hours, remainder = divmod(row[3], 3600)
@@ -745,23 +1783,166 @@ class TimerApp(QMainWindow):
                 self.stats_table.setItem(row_idx, 2, time_item)
                 self.stats_table.setItem(row_idx, 3, date_item)
                 self.stats_table.setItem(row_idx, 4, productive_item)
-
-                # Кнопка удаления
+                self.stats_table.setItem(row_idx, 5, QTableWidgetItem(
+                    ", ".join(tag_names[t] for t in record_tags.get(row[0], []) if t in tag_names)))
+
+                # Кнопки изменения и удаления
+                actions = QWidget()
+                actions_layout = QHBoxLayout(actions)
+                actions_layout.setContentsMargins(0, 0, 0, 0)
+                edit_btn = QPushButton("Изменить")
+                edit_btn.clicked.connect(
+                    lambda _, r=row[0]: self.edit_time_record(self.stats_row(r)))
+                actions_layout.addWidget(edit_btn)
                 btn = QPushButton("Удалить")
-                btn.clicked.connect(lambda _, r=row_idx: self.delete_time_record(r))
-                self.stats_table.setCellWidget(row_idx, 5, btn)
+                btn.clicked.connect(
+                    lambda _, r=row[0]: self.delete_time_record(self.stats_row(r)))
+                actions_layout.addWidget(btn)
+                self.stats_table.setCellWidget(row_idx, 6, actions)
 
             # Обновляем общее время
-            total_hours, remainder = divmod(total_seconds, 3600)
-            total_minutes, total_seconds = divmod(remainder, 60)
-            self.total_time_label.setText(
-                f"Общее время: {total_hours:02d}:{total_minutes:02d}:{total_seconds:02d}")
+            self._stats_total = total_seconds
+            self.update_stats_summary()
+
+            self.charts_panel.set_filters(date_from, date_to, project_id)
+            self.charts_panel.set_project_names({p.id: p.name for p in self.db.get_projects()})
 
             self.stats_table.resizeColumnsToContents()
 
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось обновить статистику: {str(e)}")
 
+    def export_report(self, period: str):
+        """Сохраняет табель за неделю, месяц или период из фильтров"""
+        project_id = self.filter_project_combo.currentData()
+        task_id = None
+        if period == 'filter':
+            date_from = self.date_from_edit.date().toPyDate()
+            date_to = self.date_to_edit.date().toPyDate()
+            task_id = self.filter_task_combo.currentData()
+            title = "Табель"
+        else:
+            date_from, date_to = period_bounds(period)
+            title = "Табель за неделю" if period == 'week' else "Табель за месяц"
+        if project_id:
+            title += f": {self.filter_project_combo.currentText()}"
+
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить отчёт", f"timesheet_{date_from.isoformat()}.pdf",
+            "PDF (*.pdf);;HTML (*.html);;CSV (*.csv)")
+        if not path:
+            return
+        cols, names = prepare_report(self.analytics, self.db, date_from, date_to, project_id, task_id)
+        job = ReportJob(cols, names, date_from, date_to, title, path)
+        job.signals.finished.connect(lambda p, secs, j=job: self.on_report_finished(j, p, secs))
+        job.signals.failed.connect(lambda message, j=job: self.on_report_failed(j, message))
+        self.report_jobs.append(job)
+        self.statusBar().showMessage("Построение отчёта...")
+        job.start()
+
+    def export_calendar(self):
+        """Выгружает записи из фильтров статистики в файл iCalendar"""
+        date_from = self.date_from_edit.date().toPyDate()
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт в календарь", f"timer_{date_from.isoformat()}.ics", "iCalendar (*.ics)")
+        if not path:
+            return
+        try:
+            count = export_ics(self.db, path, date_from, self.date_to_edit.date().toPyDate(),
+                               self.filter_project_combo.currentData())
+            self.statusBar().showMessage(f"Выгружено событий: {count}", 5000)
+        except Exception as e:
+            logger.exception("Ошибка экспорта календаря")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось выгрузить календарь: {str(e)}")
+
+    def import_calendar(self):
+        """Загружает события календаря как записи по правилам из настроек"""
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт из календаря", "",
+                                              "iCalendar (*.ics);;Все файлы (*)")
+        if not path:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            result = import_ics(self.db, path, rules_from_settings(self.settings),
+                                self.settings.ical_default_project)
+        except Exception as e:
+            logger.exception("Ошибка импорта календаря")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить календарь: {str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        QMessageBox.information(self, "Импорт из календаря",
+                                f"Импортировано записей: {result.imported}\n"
+                                f"Пропущено событий: {result.skipped}\n"
+                                f"Пересекаются с записями: {result.rejected}")
+
+    def report_gaps(self):
+        """Сообщает в строке состояния о неучтённом времени за последнюю неделю"""
+        try:
+            today = datetime.now().date()
+            gaps = analyze_gaps(self.db, self.settings, today - timedelta(days=7), today)
+        except Exception:
+            logger.exception("Не удалось найти пропуски")
+            return
+        if gaps:
+            hours, rest = divmod(sum(gap.seconds for gap in gaps), 3600)
+            self.statusBar().showMessage(
+                f"Неучтённое рабочее время за неделю: {hours} ч {rest // 60} мин "
+                f"(Статистика → Пропуски)", 15000)
+
+    def show_gaps(self):
+        """Пропуски в рабочих часах за период фильтра с заполнением в один щелчок"""
+        try:
+            gaps = analyze_gaps(self.db, self.settings, self.date_from_edit.date().toPyDate(),
+                                self.date_to_edit.date().toPyDate())
+            if not gaps:
+                QMessageBox.information(self, "Пропуски", "Пропусков в рабочем времени нет")
+                return
+            titles = [(task.id, f"{project.name} / {task.name}")
+                      for project in self.db.get_projects()
+                      for task in self.db.get_tasks_for_project(project.id)]
+            GapsDialog(self.db, gaps, titles, self).exec_()
+        except Exception as e:
+            logger.exception("Ошибка при поиске пропусков")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось найти пропуски: {str(e)}")
+
+    def on_report_finished(self, job: ReportJob, path: str, seconds: float):
+        self.report_jobs.remove(job)
+        self.statusBar().showMessage(f"Отчёт сохранён: {path} ({seconds:.2f} с)", 10000)
+
+    def on_report_failed(self, job: ReportJob, message: str):
+        self.report_jobs.remove(job)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Ошибка", f"Не удалось построить отчёт: {message}")
+
+    def edit_time_record(self, row):
+        """Изменение записи: задача, начало, конец и продуктивность"""
+        try:
+            item = self.stats_table.item(row, 0)
+            record = self.db.get_time_record(item.data(Qt.UserRole)) if item else None
+            if record is None:
+                QMessageBox.warning(self, "Ошибка", "Не удалось определить запись для изменения")
+                return
+
+            dialog = self.RecordDialog(self, self.db, record)
+            if dialog.exec_() != QDialog.Accepted:
+                return
+            task_id, start_time, end_time, was_productive = dialog.get_values()
+            tag_ids = dialog.get_tags()
+            # Длительность без пауз сохраняется, пока интервал не изменён
+            if (start_time, end_time) == (record.start_time, record.end_time):
+                duration = record.duration_seconds
+            else:
+                duration = int((end_time - start_time).total_seconds())
+            if not self.db.update_time_record(record.id, task_id, start_time, end_time,
+                                              duration, was_productive, tag_ids):
+                QMessageBox.warning(self, "Ошибка", "Запись не найдена")
+        except OverlapError as e:
+            QMessageBox.warning(self, "Пересечение записей", str(e))
+        except Exception as e:
+            logger.exception("Ошибка при изменении записи")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось изменить запись: {str(e)}")
+
     def delete_time_record(self, row):
         try:
 
@@ -774,8 +1955,7 @@ class TimerApp(QMainWindow):
 
             # Получаем ID записи из UserRole
             record_id = record_id_item.data(Qt.UserRole)
-            print(f"Пытаемся удалить запись с ID: {record_id}")
-            print(f"Тип ID: {type(record_id)}")
+            logger.debug("Удаление записи времени", extra={'record_id': record_id})
             if not record_id:
                 QMessageBox.warning(self, "Ошибка", "Не удалось получить ID записи")
                 return
@@ -788,12 +1968,11 @@ class TimerApp(QMainWindow):
 
             if reply == QMessageBox.Yes:
                 if self.db.delete_time_record(record_id):
-                    self.update_stats_table()
                     QMessageBox.information(self, "Успех", "Запись успешно удалена")
                 else:
                     QMessageBox.warning(self, "Ошибка", "Не удалось удалить запись")
         except Exception as e:
-            print(f"Ошибка при удалении записи: {e}")
+            logger.exception("Ошибка при удалении записи")
             QMessageBox.critical(self, "Ошибка", f"Не удалось удалить запись: {str(e)}")
 
     def _time_str_to_seconds(self, time_str):
@@ -819,7 +1998,7 @@ class TimerApp(QMainWindow):
 
             return h * 3600 + m * 60 + s
         except Exception as e:
-            print(f"Ошибка конвертации времени '{time_str}': {e}")
+            logger.warning("Ошибка конвертации времени %r: %s", time_str, e)
             return 0
 
     class ProjectDialog(QDialog):
@@ -842,6 +2021,82 @@ class TimerApp(QMainWindow):
         def get_name(self):
             return self.name_edit.text().strip()
 
+    class RecordDialog(QDialog):
+        def __init__(self, parent, db, record: TimeRecord):
+            super().__init__(parent)
+            self.setWindowTitle("Редактировать запись")
+            self.db = db
+            self.record = record
+
+            layout = QFormLayout()
+            self.task_combo = QComboBox()
+            for project in db.get_projects():
+                for task in db.get_tasks_for_project(project.id):
+                    self.task_combo.addItem(f"{project.name} / {task.name}", task.id)
+            self.task_combo.setCurrentIndex(max(self.task_combo.findData(record.task_id), 0))
+            layout.addRow("Задача:", self.task_combo)
+
+            self.start_edit = QDateTimeEdit(QDateTime(record.start_time))
+            self.start_edit.setDisplayFormat("dd.MM.yyyy HH:mm:ss")
+            self.start_edit.setCalendarPopup(True)
+            layout.addRow("Начало:", self.start_edit)
+            self.end_edit = QDateTimeEdit(QDateTime(record.end_time))
+            self.end_edit.setDisplayFormat("dd.MM.yyyy HH:mm:ss")
+            self.end_edit.setCalendarPopup(True)
+            layout.addRow("Конец:", self.end_edit)
+
+            self.productive_check = QCheckBox("Продуктивно")
+            self.productive_check.setChecked(record.was_productive)
+            layout.addRow(self.productive_check)
+
+            self.tag_list = parent.add_tag_list(
+                layout, db.get_record_tags([record.id]).get(record.id, []))
+
+            # Пересечения показываются сразу, при изменении полей
+            self.overlap_label = QLabel()
+            self.overlap_label.setWordWrap(True)
+            layout.addRow(self.overlap_label)
+
+            buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+            buttons.accepted.connect(self.accept)
+            buttons.rejected.connect(self.reject)
+            layout.addRow(buttons)
+            self.ok_button = buttons.button(QDialogButtonBox.Ok)
+
+            self.setLayout(layout)
+            self.task_combo.currentIndexChanged.connect(self.check_overlaps)
+            self.start_edit.dateTimeChanged.connect(self.check_overlaps)
+            self.end_edit.dateTimeChanged.connect(self.check_overlaps)
+            self.check_overlaps()
+
+        def get_values(self):
+            return (self.task_combo.currentData(),
+                    self.start_edit.dateTime().toPyDateTime().replace(microsecond=0),
+                    self.end_edit.dateTime().toPyDateTime().replace(microsecond=0),
+                    self.productive_check.isChecked())
+
+        def get_tags(self):
+            return TimerApp.checked_tags(self.tag_list)
+
+        def check_overlaps(self):
+            task_id, start_time, end_time, _ = self.get_values()
+            if end_time <= start_time:
+                self.overlap_label.setText("Конец записи должен быть позже начала")
+                self.ok_button.setEnabled(False)
+                return
+            overlaps = self.db.find_overlaps(start_time, end_time, exclude_id=self.record.id)
+            same_task = [o for o in overlaps if o[3] == task_id]
+            self.ok_button.setEnabled(not same_task and task_id is not None)
+            if same_task:
+                self.overlap_label.setText(
+                    "Пересекается с записью этой задачи: " +
+                    ", ".join(f"{o[0]:%d.%m %H:%M}-{o[1]:%H:%M}" for o in same_task[:3]))
+            elif overlaps:
+                # Параллельная работа над разными задачами допустима
+                self.overlap_label.setText(f"Одновременно с записями других задач: {len(overlaps)}")
+            else:
+                self.overlap_label.setText("")
+
     class TaskDialog(QDialog):
         def __init__(self, parent=None, task=None):
             super().__init__(parent)
@@ -872,9 +2127,8 @@ class TimerApp(QMainWindow):
                 name = dialog.get_name()
                 if name:  # Проверяем, что имя не пустое
                     self.db.add_project(name)
-                    self.update_projects_combo()
         except Exception as e:
-            print(f"Ошибка при создании проекта: {e}")
+            logger.exception("Ошибка при создании проекта")
             QMessageBox.critical(self, "Ошибка", f"Не удалось создать проект: {str(e)}")
 
     def edit_project(self):
@@ -886,16 +2140,10 @@ class TimerApp(QMainWindow):
         project = next((p for p in projects if p.id == project_id), None)
 
         if project:
-            dialog = ProjectDialog(self, project)
+            dialog = self.ProjectDialog(self, project)
             if dialog.exec_() == QDialog.Accepted and dialog.get_name():
-                # Обновляем проект в БД
-                cursor = self.db.conn.cursor()
-                cursor.execute(
-                    "UPDATE projects SET name = ? WHERE id = ?",
-                    (dialog.get_name(), project.id)
-                )
-                self.db.conn.commit()
-                self.update_projects_combo()
+                # Обновляем проект в БД (изменение попадает в журнал синхронизации)
+                self.db.update_project(project.id, dialog.get_name())
 
     def delete_project(self):
         if not self.project_combo.currentData():
@@ -909,13 +2157,8 @@ class TimerApp(QMainWindow):
 
         if reply == QMessageBox.Yes:
             project_id = self.project_combo.currentData()
-            # Удаляем сначала задачи, затем проект
-            cursor = self.db.conn.cursor()
-            cursor.execute("DELETE FROM tasks WHERE project_id = ?", (project_id,))
-            cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-            self.db.conn.commit()
-            self.update_projects_combo()
-            self.task_combo.clear()
+            # Задачи и записи времени удаляются вместе с проектом
+            self.db.delete_project(project_id)
 
     # Задачи
     def add_task(self):
@@ -934,9 +2177,8 @@ class TimerApp(QMainWindow):
                     # Добавляем задержку для теста (можно убрать потом)
                     QApplication.processEvents()
                     self.db.add_task(project_id, name)
-                    self.update_tasks_combo()
         except Exception as e:
-            print(f"Ошибка при создании задачи: {e}")
+            logger.exception("Ошибка при создании задачи")
             QMessageBox.critical(self, "Ошибка", f"Не удалось создать задачу:\n{str(e)}")
 
     def edit_task(self):
@@ -948,16 +2190,10 @@ class TimerApp(QMainWindow):
         task = next((t for t in tasks if t.id == task_id), None)
 
         if task:
-            dialog = TaskDialog(self, task)
+            dialog = self.TaskDialog(self, task)
             if dialog.exec_() == QDialog.Accepted and dialog.get_name():
                 # Обновляем задачу в БД
-                cursor = self.db.conn.cursor()
-                cursor.execute(
-                    "UPDATE tasks SET name = ? WHERE id = ?",
-                    (dialog.get_name(), task.id)
-                )
-                self.db.conn.commit()
-                self.update_tasks_combo()
+                self.db.update_task(task.id, dialog.get_name())
 
     def delete_task(self):
         if not self.task_combo.currentData():
@@ -971,15 +2207,5 @@ class TimerApp(QMainWindow):
 
         if reply == QMessageBox.Yes:
             task_id = self.task_combo.currentData()
-            # Удаляем сначала записи времени, затем задачу
-            cursor = self.db.conn.cursor()
-            cursor.execute("DELETE FROM time_records WHERE task_id = ?", (task_id,))
-            cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-            self.db.conn.commit()
-            self.update_tasks_combo()
-
-        # Блокируем кнопки если нет проектов
-        has_projects = len(projects) > 0
-        self.edit_project_btn.setEnabled(has_projects)
-        self.del_project_btn.setEnabled(has_projects)
-        self.add_task_btn.setEnabled(has_projects)
+            # Записи времени удаляются вместе с задачей
+            self.db.delete_task(task_id)